@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import gzip
+import json
+import random
+import threading
+from dataclasses import dataclass
+from functools import cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+ROLES = ("user", "assistant")
+
+
+@dataclass(frozen=True)
+class ResponseSize:
+    layers: int
+    cases_per_layer: int
+    conversations: int
+    turns: int
+    field_length: int
+    # When set, multi-turn messages are drawn from this many distinct texts,
+    # as repeated attacker turns and boilerplate are in real runs.
+    distinct_messages: int = 0
+
+
+def _text(rng: random.Random, length: int) -> str:
+    words = []
+    size = 0
+    while size < length:
+        word = "".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(2, 9)))
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)[:length]
+
+
+def single_turn_response(size: ResponseSize, *, seed: int = 0) -> dict[str, Any]:
+    rng = random.Random(seed)
+    failed_results = [
+        [
+            {
+                "user_input": _text(rng, size.field_length),
+                "model_response": _text(rng, size.field_length),
+                "safe_response_score": round(rng.random() * 0.5, 4),
+            }
+            for _ in range(size.cases_per_layer)
+        ]
+        for _ in range(size.layers)
+    ]
+    total_failed = size.layers * size.cases_per_layer
+    return {
+        "total_passed": total_failed,
+        "total_failed": total_failed,
+        "failed_results": failed_results,
+    }
+
+
+def multi_turn_response(size: ResponseSize, *, seed: int = 0) -> dict[str, Any]:
+    rng = random.Random(seed)
+    pool = [_text(rng, size.field_length) for _ in range(size.distinct_messages)]
+
+    def content() -> str:
+        return rng.choice(pool) if pool else _text(rng, size.field_length)
+
+    failed_results = [
+        {
+            "min_safe_response_score": round(rng.random() * 0.5, 4),
+            "conversation": [
+                {
+                    "role": ROLES[turn % 2],
+                    "content": content(),
+                }
+                for turn in range(size.turns)
+            ],
+        }
+        for _ in range(size.conversations)
+    ]
+    return {
+        "total_passed": size.conversations,
+        "total_failed": size.conversations,
+        "failed_results": failed_results,
+    }
+
+
+def system_prompt(length: int, *, seed: int = 0) -> str:
+    # Instructions followed by tool schemas and few-shot examples, the bulk
+    # of large production prompts.
+    rng = random.Random(seed)
+    parts = ["You are a customer support assistant. " + _text(rng, 400)]
+    size = len(parts[0])
+    index = 0
+    while size < length:
+        tool = {
+            "name": f"tool_{index}",
+            "description": _text(rng, 200),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    f"field_{field}": {"type": "string", "description": _text(rng, 60)}
+                    for field in range(4)
+                },
+            },
+        }
+        example = f"User: {_text(rng, 150)}\nAssistant: {_text(rng, 300)}"
+        parts.append(json.dumps(tool, indent=2))
+        parts.append(example)
+        size += len(parts[-2]) + len(parts[-1])
+        index += 1
+    return "\n\n".join(parts)[:length]
+
+
+@cache
+def encoded_response(kind: str, size: ResponseSize) -> bytes:
+    if kind == "singleturn":
+        return json.dumps(single_turn_response(size)).encode()
+    return json.dumps(multi_turn_response(size)).encode()
+
+
+class MockApi:
+    # Serves one pre-encoded synthetic response per endpoint kind, so the
+    # server's own cost stays negligible next to the client being measured.
+    def __init__(self, size: ResponseSize, *, delay: float = 0.0) -> None:
+        self.size = size
+        self.delay = delay
+        # Request body bytes as sent, before undoing any Content-Encoding.
+        self.received_bytes = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host!s}:{port}/v1/"
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+            def do_POST(self) -> None:
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with api._lock:
+                    api.received_bytes += len(body)
+                if self.headers.get("Content-Encoding") == "gzip":
+                    # Fails the request, as a real server would, if the body
+                    # is not valid gzip.
+                    gzip.decompress(body)
+                if api.delay:
+                    threading.Event().wait(api.delay)
+                kind = "singleturn" if "/singleturn_" in self.path else "multiturn"
+                body = encoded_response(kind, api.size)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def __enter__(self) -> MockApi:
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self._server.shutdown()
+        self._server.server_close()
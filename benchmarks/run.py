@@ -0,0 +1,486 @@
+from __future__ import annotations
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from collections.abc import Callable
+from contextlib import redirect_stdout
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+
+from circuit_breaker_labs.models.multi_turn_run_tests_response import (
+    MultiTurnRunTestsResponse,
+)
+from circuit_breaker_labs.models.single_turn_run_tests_response import (
+    SingleTurnRunTestsResponse,
+)
+from mock_api import MockApi, ResponseSize, encoded_response, system_prompt
+
+from actions.analytics import analyze
+from actions.arguments import parse_non_negative_int, parse_positive_int
+from actions.conversations import multi_turn_response_from_dict
+from actions.report import (
+    CHUNK_SIZE,
+    ReportOptions,
+    report_multi_turn_failed_cases,
+    report_single_turn_failed_cases,
+)
+from actions.streaming import RunTestsResponseReader
+
+COMMON_ARGS = [
+    "--fail-action-threshold",
+    "0",
+    "--fail-case-threshold",
+    "0.5",
+    "--circuit-breaker-labs-api-key",
+    "benchmark",
+]
+
+ENDPOINT_ARGS = {
+    "singleturn_evaluate_system_prompt": [
+        "--variations",
+        "1",
+        "--maximum-iteration-layers",
+        "1",
+        "--system-prompt",
+        "You are a helpful assistant",
+        "--openrouter-model-name",
+        "benchmark/model",
+    ],
+    "singleturn_evaluate_openai_finetune": [
+        "--variations",
+        "1",
+        "--maximum-iteration-layers",
+        "1",
+        "--model-name",
+        "ft:benchmark",
+        "--openai-api-key",
+        "benchmark",
+    ],
+    "multiturn_evaluate_system_prompt": [
+        "--max-turns",
+        "4",
+        "--test-types",
+        "user_persona",
+        "--system-prompt",
+        "You are a helpful assistant",
+        "--openrouter-model-name",
+        "benchmark/model",
+    ],
+    "multiturn_evaluate_openai_finetune": [
+        "--max-turns",
+        "4",
+        "--test-types",
+        "user_persona",
+        "--model-name",
+        "ft:benchmark",
+        "--openai-api-key",
+        "benchmark",
+    ],
+}
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    seconds: list[float]
+    items: int
+    payload_bytes: int
+    peak_bytes: int
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.seconds)
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.median if self.median else 0.0
+
+    @property
+    def megabytes_per_second(self) -> float:
+        return self.payload_bytes / 1024 / 1024 / self.median if self.median else 0.0
+
+
+def run_cli(
+    module: str,
+    *,
+    base_url: str,
+    endpoint_args: list[str] | None = None,
+) -> tuple[float, int]:
+    # Each entry point runs in a fresh interpreter, as it does in the action,
+    # so the measurement includes imports and the peak RSS is its own.
+    env = os.environ | {"CBL_BASE_URL": base_url}
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            f"actions.{module}",
+            *COMMON_ARGS,
+            *(ENDPOINT_ARGS[module] if endpoint_args is None else endpoint_args),
+        ],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - started
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode not in (0, 1):
+        assert process.stderr is not None
+        print(process.stderr.read().decode(), file=sys.stderr)
+        raise SystemExit(f"{module} exited with {process.returncode}")
+    # ru_maxrss is reported in KiB on Linux.
+    return elapsed, usage.ru_maxrss * 1024
+
+
+def measure(
+    name: str,
+    run: Callable[[], object],
+    *,
+    repeat: int,
+    items: int,
+    payload_bytes: int,
+) -> BenchmarkResult:
+    seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - started)
+
+    # Measured separately because tracing slows the timed runs down.
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return BenchmarkResult(
+        name=name,
+        seconds=seconds,
+        items=items,
+        payload_bytes=payload_bytes,
+        peak_bytes=peak,
+    )
+
+
+def benchmark_cli(
+    size: ResponseSize, *, repeat: int, delay: float
+) -> list[BenchmarkResult]:
+    results = []
+    with MockApi(size, delay=delay) as api:
+        for module in ENDPOINT_ARGS:
+            kind = module.split("_", 1)[0]
+            runs = [run_cli(module, base_url=api.base_url) for _ in range(repeat)]
+            results.append(
+                BenchmarkResult(
+                    name=f"main {module}",
+                    seconds=[elapsed for elapsed, _ in runs],
+                    items=1,
+                    payload_bytes=len(encoded_response(kind, size)),
+                    peak_bytes=max(rss for _, rss in runs),
+                ),
+            )
+    return results
+
+
+def benchmark_uploads(
+    size: ResponseSize,
+    *,
+    repeat: int,
+    delay: float,
+    prompt_length: int,
+) -> list[BenchmarkResult]:
+    # Runs the system prompt entry points with a large prompt file, with and
+    # without compressed request bodies. The payload is the bytes the mock
+    # API received per run.
+    results = []
+    with tempfile.TemporaryDirectory() as directory, MockApi(size, delay=delay) as api:
+        prompt_file = Path(directory) / "system_prompt.txt"
+        prompt_file.write_text(system_prompt(prompt_length), encoding="utf-8")
+        for module, args in ENDPOINT_ARGS.items():
+            if "--system-prompt" not in args:
+                continue
+            index = args.index("--system-prompt")
+            prompt_args = [
+                *args[:index],
+                "--system-prompt-file",
+                str(prompt_file),
+                *args[index + 2 :],
+            ]
+            for compress in (False, True):
+                received = api.received_bytes
+                runs = [
+                    run_cli(
+                        module,
+                        base_url=api.base_url,
+                        endpoint_args=[*prompt_args, "--compress-requests"]
+                        if compress
+                        else prompt_args,
+                    )
+                    for _ in range(repeat)
+                ]
+                results.append(
+                    BenchmarkResult(
+                        name=f"upload {module}{' gzip' if compress else ''}",
+                        seconds=[elapsed for elapsed, _ in runs],
+                        items=1,
+                        payload_bytes=(api.received_bytes - received) // repeat,
+                        peak_bytes=max(rss for _, rss in runs),
+                    ),
+                )
+    return results
+
+
+def print_upload_savings(results: list[BenchmarkResult]) -> None:
+    # benchmark_uploads returns each uncompressed run followed by its
+    # compressed counterpart.
+    for plain, compressed in zip(results[::2], results[1::2], strict=True):
+        saved = 1 - compressed.payload_bytes / plain.payload_bytes
+        print(
+            f"{plain.name.removeprefix('upload ')}: uploaded "
+            f"{plain.payload_bytes} bytes, {compressed.payload_bytes} with gzip "
+            f"({saved:.1%} saved)",
+        )
+
+
+def read_streaming(
+    body: bytes,
+    response_type: type[SingleTurnRunTestsResponse] | type[MultiTurnRunTestsResponse],
+) -> object:
+    # Fed in the chunk size the actions read response bodies with.
+    reader = RunTestsResponseReader(response_type)
+    view = memoryview(body)
+    for start in range(0, len(body), CHUNK_SIZE):
+        reader.feed(bytes(view[start : start + CHUNK_SIZE]))
+    return reader.finish()
+
+
+def benchmark_parsing(size: ResponseSize, *, repeat: int) -> list[BenchmarkResult]:
+    single_turn = encoded_response("singleturn", size)
+    multi_turn = encoded_response("multiturn", size)
+    return [
+        measure(
+            "from_dict single-turn",
+            lambda: SingleTurnRunTestsResponse.from_dict(json.loads(single_turn)),
+            repeat=repeat,
+            items=size.layers * size.cases_per_layer,
+            payload_bytes=len(single_turn),
+        ),
+        measure(
+            "from_dict multi-turn",
+            lambda: MultiTurnRunTestsResponse.from_dict(json.loads(multi_turn)),
+            repeat=repeat,
+            items=size.conversations * size.turns,
+            payload_bytes=len(multi_turn),
+        ),
+        measure(
+            "streaming single-turn",
+            lambda: read_streaming(single_turn, SingleTurnRunTestsResponse),
+            repeat=repeat,
+            items=size.layers * size.cases_per_layer,
+            payload_bytes=len(single_turn),
+        ),
+        measure(
+            "streaming multi-turn",
+            lambda: read_streaming(multi_turn, MultiTurnRunTestsResponse),
+            repeat=repeat,
+            items=size.conversations * size.turns,
+            payload_bytes=len(multi_turn),
+        ),
+    ]
+
+
+def benchmark_reporters(
+    size: ResponseSize,
+    *,
+    repeat: int,
+    report_file: Path | None,
+) -> list[BenchmarkResult]:
+    single_turn = SingleTurnRunTestsResponse.from_dict(
+        json.loads(encoded_response("singleturn", size)),
+    )
+    # Multi-turn results are reported from the conversation table the
+    # streaming reader builds, as they are in the actions.
+    multi_turn = multi_turn_response_from_dict(
+        json.loads(encoded_response("multiturn", size)),
+    )
+    options = ReportOptions(
+        top_n=50,
+        max_field_length=2000,
+        report_file=report_file,
+        step_summary=False,
+    )
+    suffix = " with report file" if report_file is not None else ""
+
+    def report_single_turn() -> None:
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            report_single_turn_failed_cases(
+                failure_rate=0.5,
+                failed_cases=single_turn.failed_results,
+                options=options,
+            )
+
+    def report_multi_turn() -> None:
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            report_multi_turn_failed_cases(
+                failure_rate=0.5,
+                failed_cases=multi_turn.failed_results,
+                options=options,
+            )
+
+    results = [
+        measure(
+            f"report single-turn{suffix}",
+            report_single_turn,
+            repeat=repeat,
+            items=single_turn.total_failed,
+            payload_bytes=len(encoded_response("singleturn", size)),
+        ),
+        measure(
+            f"report multi-turn{suffix}",
+            report_multi_turn,
+            repeat=repeat,
+            items=multi_turn.total_failed,
+            payload_bytes=len(encoded_response("multiturn", size)),
+        ),
+    ]
+    if report_file is not None:
+        return results
+    return [
+        *results,
+        measure(
+            "analytics single-turn",
+            lambda: analyze(single_turn),
+            repeat=repeat,
+            items=single_turn.total_failed,
+            payload_bytes=len(encoded_response("singleturn", size)),
+        ),
+        measure(
+            "analytics multi-turn",
+            lambda: analyze(multi_turn),
+            repeat=repeat,
+            items=multi_turn.total_failed,
+            payload_bytes=len(encoded_response("multiturn", size)),
+        ),
+    ]
+
+
+def print_results(results: list[BenchmarkResult]) -> None:
+    header = (
+        f"{'Benchmark':<48} {'Median s':>10} {'Min s':>10} "
+        f"{'Items/s':>12} {'MiB/s':>10} {'Peak MiB':>10}"
+    )
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        print(
+            f"{result.name:<48} {result.median:>10.4f} {min(result.seconds):>10.4f} "
+            f"{result.items_per_second:>12.0f} {result.megabytes_per_second:>10.1f} "
+            f"{result.peak_bytes / 1024 / 1024:>10.1f}",
+        )
+
+
+def main() -> None:
+    parser = ArgumentParser(
+        description=(
+            "Benchmark the actions against a local mock Circuit Breaker Labs API"
+        ),
+    )
+    parser.add_argument("--layers", type=parse_positive_int, default=20)
+    parser.add_argument("--cases-per-layer", type=parse_positive_int, default=100)
+    parser.add_argument("--conversations", type=parse_positive_int, default=500)
+    parser.add_argument("--turns", type=parse_positive_int, default=20)
+    parser.add_argument("--field-length", type=parse_non_negative_int, default=500)
+    parser.add_argument(
+        "--distinct-messages",
+        type=parse_non_negative_int,
+        default=0,
+        help="Draw multi-turn messages from this many distinct texts instead of "
+        "making every message unique",
+    )
+    parser.add_argument(
+        "--prompt-length",
+        type=parse_positive_int,
+        default=32 * 1024,
+        help="Characters in the synthetic system prompt used by the upload benchmark",
+    )
+    parser.add_argument("--repeat", type=parse_positive_int, default=3)
+    parser.add_argument(
+        "--delay",
+        type=float,
+        default=0.0,
+        help="Seconds the mock API waits before responding",
+    )
+    parser.add_argument(
+        "--only",
+        choices=["main", "upload", "parse", "report"],
+        nargs="+",
+        default=["main", "upload", "parse", "report"],
+    )
+    parser.add_argument(
+        "--json", type=Path, help="Also write the results to a JSON file"
+    )
+    args = parser.parse_args()
+
+    size = ResponseSize(
+        layers=args.layers,
+        cases_per_layer=args.cases_per_layer,
+        conversations=args.conversations,
+        turns=args.turns,
+        field_length=args.field_length,
+        distinct_messages=args.distinct_messages,
+    )
+
+    results = []
+    if "main" in args.only:
+        results += benchmark_cli(size, repeat=args.repeat, delay=args.delay)
+    uploads = []
+    if "upload" in args.only:
+        uploads = benchmark_uploads(
+            size,
+            repeat=args.repeat,
+            delay=args.delay,
+            prompt_length=args.prompt_length,
+        )
+        results += uploads
+    if "parse" in args.only:
+        results += benchmark_parsing(size, repeat=args.repeat)
+    if "report" in args.only:
+        results += benchmark_reporters(size, repeat=args.repeat, report_file=None)
+        with tempfile.TemporaryDirectory() as directory:
+            results += benchmark_reporters(
+                size,
+                repeat=args.repeat,
+                report_file=Path(directory) / "report.jsonl",
+            )
+
+    print_results(results)
+    if uploads:
+        print()
+        print_upload_savings(uploads)
+
+    if args.json is not None:
+        payload: dict[str, Any] = {
+            "size": asdict(size),
+            "results": [
+                asdict(result)
+                | {
+                    "median": result.median,
+                    "items_per_second": result.items_per_second,
+                    "megabytes_per_second": result.megabytes_per_second,
+                }
+                for result in results
+            ],
+        }
+        args.json.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+
+from mock_api import MockApi, ResponseSize
+from run import COMMON_ARGS, ENDPOINT_ARGS
+
+from actions.arguments import parse_positive_int
+
+# The same evaluation run through each console script's module and through
+# the equivalent cbl-evaluate subcommand.
+COMMANDS = {
+    "singleturn system-prompt": "singleturn_evaluate_system_prompt",
+    "singleturn finetune": "singleturn_evaluate_openai_finetune",
+    "multiturn system-prompt": "multiturn_evaluate_system_prompt",
+    "multiturn finetune": "multiturn_evaluate_openai_finetune",
+}
+
+# A response small enough that the run is all startup: imports, argument
+# parsing, building the client and one round trip to the mock API.
+RESPONSE_SIZE = ResponseSize(
+    layers=1,
+    cases_per_layer=1,
+    conversations=1,
+    turns=2,
+    field_length=16,
+)
+
+
+def run(argv: list[str], *, env: dict[str, str]) -> subprocess.CompletedProcess[str]:
+    completed = subprocess.run(
+        argv,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    # The benchmark arguments fail every case, so the run itself exits 1.
+    if completed.returncode not in (0, 1):
+        print(completed.stderr, file=sys.stderr)
+        raise SystemExit(f"{argv} exited with {completed.returncode}")
+    return completed
+
+
+def wall_time(argv: list[str], *, env: dict[str, str], repeat: int) -> float:
+    seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run(argv, env=env)
+        seconds.append(time.perf_counter() - started)
+    return statistics.median(seconds)
+
+
+def import_time(argv: list[str], *, env: dict[str, str]) -> float:
+    # -X importtime reports cumulative microseconds for each top-level import,
+    # including those deferred until the run needs them.
+    completed = run([sys.executable, "-X", "importtime", *argv], env=env)
+    total = 0
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit() and not name.startswith("  "):
+            total += int(cumulative)
+    return total / 1_000_000
+
+
+def main() -> None:
+    parser = ArgumentParser(
+        description="Compare startup time of the console scripts and cbl-evaluate",
+    )
+    parser.add_argument("--repeat", type=parse_positive_int, default=10)
+    args = parser.parse_args()
+
+    header = f"{'Command':<28} {'Entry point':<14} {'Wall s':>8} {'Imports s':>10}"
+    print(header)
+    print("-" * len(header))
+    with MockApi(RESPONSE_SIZE) as api:
+        env = os.environ | {"CBL_BASE_URL": api.base_url}
+        for subcommand, module in COMMANDS.items():
+            arguments = [*COMMON_ARGS, *ENDPOINT_ARGS[module]]
+            for label, argv in (
+                ("script", ["-m", f"actions.{module}", *arguments]),
+                (
+                    "cbl-evaluate",
+                    ["-m", "actions.cli", *subcommand.split(), *arguments],
+                ),
+            ):
+                wall = wall_time([sys.executable, *argv], env=env, repeat=args.repeat)
+                imports = import_time(argv, env=env)
+                print(f"{subcommand:<28} {label:<14} {wall:>8.3f} {imports:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import time
+
+# Taken before any submodule or dependency is imported, so instrumentation can
+# report how long imports took before main() started.
+IMPORT_STARTED = time.perf_counter()
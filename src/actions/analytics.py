@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+import math
+import operator
+import re
+import statistics
+from argparse import Namespace
+from array import array
+from collections import Counter
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass, field
+
+from circuit_breaker_labs.models.multi_turn_run_tests_response import (
+    MultiTurnRunTestsResponse,
+)
+from circuit_breaker_labs.models.multi_turn_test_type import MultiTurnTestType
+from circuit_breaker_labs.models.single_turn_run_tests_response import (
+    SingleTurnRunTestsResponse,
+)
+
+from .arguments import Gate
+from .common import compute_failure_rate
+from .conversations import ConversationTable
+from .report import format_markdown_table, format_table, write_step_summary
+
+HISTOGRAM_BINS = 10
+PERCENTILES = (10, 25, 50, 75, 90)
+
+COMPARISONS: dict[str, Callable[[float, float], bool]] = {
+    "<=": operator.le,
+    ">=": operator.ge,
+    "<": operator.lt,
+    ">": operator.gt,
+}
+
+# Failure counts for a layer, turn count or test type without any failed
+# cases are zero rather than unknown.
+COUNT_METRIC = re.compile(r"(layer|turns)\.\d+\.failed|test_type\.\w+\.failed")
+
+
+@dataclass
+class AnalyticsOptions:
+    gates: list[Gate]
+
+
+def get_analytics_options(args: Namespace) -> AnalyticsOptions | None:
+    if not args.analytics and args.gate is None:
+        return None
+    return AnalyticsOptions(gates=args.gate or [])
+
+
+class TestTypeTotals:
+    # Collects per-test-type totals from the individual requests of a split
+    # multi-turn run, where each request covers exactly one test type.
+    def __init__(self) -> None:
+        self.totals: dict[str, tuple[int, int]] = {}
+        self.complete = True
+
+    def add(
+        self,
+        test_types: list[MultiTurnTestType],
+        run_tests_response: MultiTurnRunTestsResponse,
+    ) -> None:
+        if len(test_types) != 1:
+            self.complete = False
+            return
+        passed, failed = self.totals.get(test_types[0].value, (0, 0))
+        self.totals[test_types[0].value] = (
+            passed + run_tests_response.total_passed,
+            failed + run_tests_response.total_failed,
+        )
+
+
+@dataclass
+class ScoreDistribution:
+    count: int
+    mean: float
+    minimum: float
+    maximum: float
+    percentiles: dict[int, float]
+    histogram: list[int]
+
+
+def score_distribution(scores: array[float]) -> ScoreDistribution:
+    histogram = [0] * HISTOGRAM_BINS
+    for score in scores:
+        histogram[min(max(int(score * HISTOGRAM_BINS), 0), HISTOGRAM_BINS - 1)] += 1
+    if not scores:
+        return ScoreDistribution(
+            count=0,
+            mean=math.nan,
+            minimum=math.nan,
+            maximum=math.nan,
+            percentiles=dict.fromkeys(PERCENTILES, math.nan),
+            histogram=histogram,
+        )
+
+    cut_points = (
+        statistics.quantiles(scores, n=100, method="inclusive")
+        if len(scores) > 1
+        else [scores[0]] * 99
+    )
+    return ScoreDistribution(
+        count=len(scores),
+        mean=math.fsum(scores) / len(scores),
+        minimum=min(scores),
+        maximum=max(scores),
+        percentiles={
+            percentile: cut_points[percentile - 1] for percentile in PERCENTILES
+        },
+        histogram=histogram,
+    )
+
+
+@dataclass
+class FailureAnalytics:
+    total_passed: int
+    total_failed: int
+    scores: ScoreDistribution
+    layers: list[int] = field(default_factory=list)
+    turns: dict[int, int] = field(default_factory=dict)
+    test_types: dict[str, tuple[int, int]] | None = None
+
+    def metrics(self) -> dict[str, float]:
+        metrics = {
+            "failure_rate": compute_failure_rate(
+                total_passed=self.total_passed,
+                total_failed=self.total_failed,
+            ),
+            "failed": float(self.total_failed),
+            "score.min": self.scores.minimum,
+            "score.max": self.scores.maximum,
+            "score.mean": self.scores.mean,
+        }
+        for percentile, value in self.scores.percentiles.items():
+            metrics[f"score.p{percentile}"] = value
+        for layer, failed in enumerate(self.layers):
+            metrics[f"layer.{layer}.failed"] = failed
+            metrics[f"layer.{layer}.share"] = failed / (self.total_failed or 1)
+        for turns, failed in self.turns.items():
+            metrics[f"turns.{turns}.failed"] = failed
+        for test_type, (passed, failed) in (self.test_types or {}).items():
+            metrics[f"test_type.{test_type}.failed"] = failed
+            metrics[f"test_type.{test_type}.failure_rate"] = compute_failure_rate(
+                total_passed=passed,
+                total_failed=failed,
+            )
+        return metrics
+
+
+def analyze(
+    run_tests_response: SingleTurnRunTestsResponse | MultiTurnRunTestsResponse,
+    *,
+    test_types: TestTypeTotals | None = None,
+) -> FailureAnalytics:
+    # One pass over the failed cases fills a compact array of scores and the
+    # per-layer or per-turn counters; the distribution is computed from the
+    # array rather than from the model objects.
+    scores = array("d")
+    if isinstance(run_tests_response, SingleTurnRunTestsResponse):
+        layers = []
+        for cases in run_tests_response.failed_results:
+            scores.extend(case.safe_response_score for case in cases)
+            layers.append(len(cases))
+        return FailureAnalytics(
+            total_passed=run_tests_response.total_passed,
+            total_failed=run_tests_response.total_failed,
+            scores=score_distribution(scores),
+            layers=layers,
+        )
+
+    turns: Counter[int] = Counter()
+    table = ConversationTable.of(run_tests_response.failed_results)
+    for conversation in table.conversations:
+        scores.append(conversation.min_safe_response_score)
+        # A turn is one user message and the reply to it, so the length of a
+        # failed conversation is where the evaluation stopped.
+        turns[table.user_turns(conversation)] += 1
+    return FailureAnalytics(
+        total_passed=run_tests_response.total_passed,
+        total_failed=run_tests_response.total_failed,
+        scores=score_distribution(scores),
+        turns=dict(sorted(turns.items())),
+        test_types=dict(sorted(test_types.totals.items()))
+        if test_types is not None and test_types.complete
+        else None,
+    )
+
+
+def _format_score(value: float) -> str:
+    return "-" if math.isnan(value) else f"{value:.3f}"
+
+
+def _sections(
+    analytics: FailureAnalytics,
+) -> Iterator[tuple[str, tuple[str, ...], list[tuple[str, ...]]]]:
+    scores = analytics.scores
+    yield (
+        f"Safety scores of {scores.count} failed cases",
+        ("Min", *(f"p{percentile}" for percentile in PERCENTILES), "Max", "Mean"),
+        [
+            (
+                _format_score(scores.minimum),
+                *(_format_score(value) for value in scores.percentiles.values()),
+                _format_score(scores.maximum),
+                _format_score(scores.mean),
+            ),
+        ],
+    )
+    yield (
+        "Score histogram",
+        ("Score", "Cases"),
+        [
+            (
+                f"{bin / HISTOGRAM_BINS:.1f}-{(bin + 1) / HISTOGRAM_BINS:.1f}",
+                str(count),
+            )
+            for bin, count in enumerate(scores.histogram)
+        ],
+    )
+    if analytics.layers:
+        yield (
+            "Failures by layer",
+            ("Layer", "Failed", "Share"),
+            [
+                (
+                    str(layer),
+                    str(failed),
+                    f"{failed / (analytics.total_failed or 1):.2%}",
+                )
+                for layer, failed in enumerate(analytics.layers)
+            ],
+        )
+    if analytics.turns:
+        yield (
+            "Failed conversations by turns",
+            ("Turns", "Failed"),
+            [(str(turns), str(failed)) for turns, failed in analytics.turns.items()],
+        )
+    if analytics.test_types:
+        yield (
+            "Failures by test type",
+            ("Test Type", "Passed", "Failed", "Failure Rate"),
+            [
+                (
+                    test_type,
+                    str(passed),
+                    str(failed),
+                    format(
+                        compute_failure_rate(total_passed=passed, total_failed=failed),
+                        ".2%",
+                    ),
+                )
+                for test_type, (passed, failed) in analytics.test_types.items()
+            ],
+        )
+
+
+def print_analytics(analytics: FailureAnalytics, *, step_summary: bool) -> None:
+    summary = ["### Circuit Breaker Labs Failure Analytics", ""]
+    for title, headers, rows in _sections(analytics):
+        print(f"{title}:")
+        for line in format_table(headers, rows):
+            print(f"    {line}")
+        print()
+        summary += [f"**{title}**", "", *format_markdown_table(headers, rows), ""]
+
+    if step_summary:
+        write_step_summary(summary)
+
+
+def check_gates(analytics: FailureAnalytics, gates: list[Gate]) -> list[str]:
+    metrics = analytics.metrics()
+    failures = []
+    for gate in gates:
+        if gate.metric.startswith("test_type.") and analytics.test_types is None:
+            failures.append(
+                f"{gate}: test type breakdowns are only available for multi-turn "
+                "runs with --split-requests",
+            )
+            continue
+        if (
+            gate.metric.startswith("score.")
+            and gate.metric in metrics
+            and not analytics.scores.count
+        ):
+            # Scores describe failed cases, so a run without any has nothing
+            # for a score gate to fail on.
+            print(f"Skipping gate {gate}: no failed cases to score.")
+            continue
+        value = metrics.get(gate.metric)
+        if value is None and COUNT_METRIC.fullmatch(gate.metric):
+            value = 0.0
+        if value is None:
+            failures.append(f"{gate}: unknown metric '{gate.metric}'")
+        elif math.isnan(value) or not COMPARISONS[gate.operator](
+            value,
+            gate.threshold,
+        ):
+            failures.append(f"{gate}: actual {value:g}")
+    return failures
+
+
+def run_analytics(
+    options: AnalyticsOptions,
+    run_tests_response: SingleTurnRunTestsResponse | MultiTurnRunTestsResponse,
+    *,
+    test_types: TestTypeTotals | None = None,
+    step_summary: bool,
+) -> list[str]:
+    analytics = analyze(run_tests_response, test_types=test_types)
+    print_analytics(analytics, step_summary=step_summary)
+    return check_gates(analytics, options.gates)
+
+
+def report_gate_failures(failures: list[str]) -> None:
+    for failure in failures:
+        print(f"Gate failed: {failure}")
+    print(f"{len(failures)} analytics gates failed.")
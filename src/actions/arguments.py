@@ -0,0 +1,699 @@
+from __future__ import annotations
+
+import os
+import re
+from argparse import ArgumentParser, ArgumentTypeError, Namespace
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+
+# Kept free of circuit_breaker_labs and httpx imports so a command line can be
+# parsed, and --help printed, before the API client is loaded.
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_CACHE_TTL = 7 * 24 * 60 * 60
+DEFAULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 1.0
+DEFAULT_TOP_N = 50
+DEFAULT_MAX_FIELD_LENGTH = 2000
+OUTPUT_FORMATS = ("json", "jsonl", "junit", "sarif")
+DEFAULT_PROBE_BAND = 0.1
+DEFAULT_PROBE_CONFIDENCE = 0.95
+GATE_OPERATORS = ("<=", ">=", "<", ">")
+METRICS_LABEL_NAME = re.compile(r"[a-zA-Z_][a-zA-Z0-9_]*")
+
+
+@dataclass(frozen=True)
+class EvaluationCommand:
+    endpoint: str
+    description: str
+    multi_turn: bool
+    finetune: bool
+
+    @property
+    def module(self) -> str:
+        return f"actions.{self.endpoint.replace('-', '_')}"
+
+
+EVALUATION_COMMANDS = {
+    command.endpoint: command
+    for command in (
+        EvaluationCommand(
+            endpoint="singleturn-evaluate-system-prompt",
+            description="Evaluate a system prompt using the single-turn "
+            "Circuit Breaker Labs API",
+            multi_turn=False,
+            finetune=False,
+        ),
+        EvaluationCommand(
+            endpoint="singleturn-evaluate-openai-finetune",
+            description="Evaluate an OpenAI fine-tuned model using the single-turn "
+            "Circuit Breaker Labs API",
+            multi_turn=False,
+            finetune=True,
+        ),
+        EvaluationCommand(
+            endpoint="multiturn-evaluate-system-prompt",
+            description="Evaluate a system prompt using Circuit Breaker Labs "
+            "multi-turn API",
+            multi_turn=True,
+            finetune=False,
+        ),
+        EvaluationCommand(
+            endpoint="multiturn-evaluate-openai-finetune",
+            description="Evaluate an OpenAI finetune using Circuit Breaker Labs "
+            "multi-turn API",
+            multi_turn=True,
+            finetune=True,
+        ),
+    )
+}
+
+
+def parse_positive_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError as exc:
+        raise ArgumentTypeError(f"Invalid integer '{value}'") from exc
+    if number < 1:
+        raise ArgumentTypeError(f"Expected a positive integer, got {number}")
+    return number
+
+
+def parse_non_negative_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError as exc:
+        raise ArgumentTypeError(f"Invalid integer '{value}'") from exc
+    if number < 0:
+        raise ArgumentTypeError(f"Expected a non-negative integer, got {number}")
+    return number
+
+
+def parse_positive_float(value: str) -> float:
+    try:
+        parsed = float(value)
+    except ValueError as exc:
+        raise ArgumentTypeError(f"Invalid number '{value}'.") from exc
+    if parsed <= 0:
+        raise ArgumentTypeError(f"Expected a positive number, got '{value}'.")
+    return parsed
+
+
+def parse_non_negative_float(value: str) -> float:
+    try:
+        parsed = float(value)
+    except ValueError as exc:
+        raise ArgumentTypeError(f"Invalid number '{value}'.") from exc
+    if parsed < 0:
+        raise ArgumentTypeError(f"Expected a non-negative number, got '{value}'.")
+    return parsed
+
+
+def parse_confidence(value: str) -> float:
+    try:
+        parsed = float(value)
+    except ValueError as exc:
+        raise ArgumentTypeError(f"Invalid number '{value}'.") from exc
+    if not 0 < parsed < 1:
+        raise ArgumentTypeError(f"Expected a number between 0 and 1, got '{value}'.")
+    return parsed
+
+
+@dataclass(frozen=True)
+class Gate:
+    metric: str
+    operator: str
+    threshold: float
+
+    def __str__(self) -> str:
+        return f"{self.metric}{self.operator}{self.threshold:g}"
+
+
+def parse_gate(value: str) -> Gate:
+    # Two-character operators are tried first so "<=" is not read as "<".
+    for operator in GATE_OPERATORS:
+        metric, found, threshold = value.partition(operator)
+        if found:
+            break
+    else:
+        raise ArgumentTypeError(
+            f"Expected METRIC<=VALUE, METRIC>=VALUE, METRIC<VALUE or "
+            f"METRIC>VALUE, got '{value}'.",
+        )
+    if not metric.strip():
+        raise ArgumentTypeError(f"Missing metric in gate '{value}'.")
+    try:
+        parsed = float(threshold)
+    except ValueError as exc:
+        raise ArgumentTypeError(f"Invalid number in gate '{value}'.") from exc
+    return Gate(metric=metric.strip(), operator=operator, threshold=parsed)
+
+
+def parse_metrics_label(value: str) -> tuple[str, str]:
+    name, found, label_value = value.partition("=")
+    if not found:
+        raise ArgumentTypeError(f"Expected KEY=VALUE, got '{value}'.")
+    if not METRICS_LABEL_NAME.fullmatch(name) or name.startswith("__"):
+        raise ArgumentTypeError(f"Invalid metrics label name '{name}'.")
+    return name, label_value
+
+
+def add_engine_arguments(parser: ArgumentParser) -> None:
+    parser.add_argument(
+        "--split-requests",
+        action="store_true",
+        help=(
+            "Send one request per test case pack (and test type) and run them "
+            "concurrently"
+        ),
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=parse_positive_int,
+        default=DEFAULT_CONCURRENCY,
+        help="Maximum number of evaluation requests in flight at once",
+    )
+    parser.add_argument(
+        "--compress-requests",
+        action="store_true",
+        default=os.environ.get("CBL_COMPRESS_REQUESTS", "").lower() in {"1", "true"},
+        help="Send request bodies of 1 KiB or more gzip-compressed, which shrinks "
+        "uploads of large system prompts",
+    )
+
+
+def add_cache_arguments(parser: ArgumentParser) -> None:
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=os.environ.get("CBL_CACHE_DIR") or None,
+        help="Directory for cached evaluation results (disabled when unset)",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=parse_positive_int,
+        default=DEFAULT_CACHE_TTL,
+        help="Seconds a cached result stays valid",
+    )
+    parser.add_argument(
+        "--cache-max-bytes",
+        type=parse_positive_int,
+        default=DEFAULT_CACHE_MAX_BYTES,
+        help="Total size of the cache directory before the oldest entries are evicted",
+    )
+
+
+def add_recording_arguments(parser: ArgumentParser) -> None:
+    recording = parser.add_mutually_exclusive_group()
+    recording.add_argument(
+        "--record",
+        type=Path,
+        metavar="DIR",
+        help="Save every API response to this directory for later --replay runs",
+    )
+    recording.add_argument(
+        "--replay",
+        type=Path,
+        metavar="DIR",
+        help="Answer API requests from responses saved with --record, without "
+        "any network access",
+    )
+
+
+def add_scheduler_arguments(parser: ArgumentParser) -> None:
+    parser.add_argument(
+        "--scheduler-dir",
+        type=Path,
+        default=os.environ.get("CBL_SCHEDULER_DIR") or None,
+        help="Directory shared by the evaluations on this machine that queues "
+        "their API requests under common per-key limits (disabled when unset)",
+    )
+    parser.add_argument(
+        "--scheduler-max-in-flight",
+        type=parse_positive_int,
+        default=DEFAULT_CONCURRENCY,
+        help="Maximum number of requests in flight per API key across all "
+        "processes sharing --scheduler-dir",
+    )
+    parser.add_argument(
+        "--scheduler-rate",
+        type=parse_positive_float,
+        help="Maximum number of requests per minute per API key across all "
+        "processes sharing --scheduler-dir",
+    )
+
+
+def add_shard_arguments(parser: ArgumentParser) -> None:
+    parser.add_argument(
+        "--shard-index",
+        type=parse_non_negative_int,
+        default=0,
+        help="Zero-based index of the shard evaluated by this job",
+    )
+    parser.add_argument(
+        "--shard-count",
+        type=parse_positive_int,
+        default=1,
+        help="Total number of shards the evaluation is split across",
+    )
+    parser.add_argument(
+        "--shard-output",
+        type=Path,
+        help="Write this shard's partial results to a file for merge-results "
+        "instead of applying the fail action threshold",
+    )
+
+
+def validate_shard_arguments(
+    parser: ArgumentParser,
+    args: Namespace,
+    command: EvaluationCommand,
+) -> None:
+    if args.shard_index >= args.shard_count:
+        parser.error("--shard-index must be less than --shard-count.")
+    if args.shard_count > 1 and args.shard_output is None:
+        parser.error("--shard-output is required when --shard-count is above 1.")
+    # Shards are whole requests: one per test case pack, and per test type for
+    # the multi-turn commands. A shard without one would pass vacuously.
+    requests = len(args.test_case_packs or [None])
+    if command.multi_turn:
+        requests *= len(args.test_types)
+    if args.shard_count > requests:
+        parser.error(
+            f"--shard-count {args.shard_count} is more than the {requests} "
+            f"request(s) this evaluation splits into; select more test case "
+            f"packs or use fewer shards.",
+        )
+
+
+def add_early_exit_arguments(parser: ArgumentParser) -> None:
+    parser.add_argument(
+        "--early-exit",
+        action="store_true",
+        help="Split the evaluation into concurrent requests and cancel the rest "
+        "once the fail action threshold outcome is certain",
+    )
+    parser.add_argument(
+        "--early-exit-max-cases-per-request",
+        type=parse_positive_int,
+        help="Upper bound on the test cases a single request can return, used to "
+        "decide the outcome early (required with --early-exit)",
+    )
+
+
+def validate_early_exit_arguments(parser: ArgumentParser, args: Namespace) -> None:
+    if args.early_exit and args.shard_output is not None:
+        parser.error("--early-exit cannot be combined with --shard-output.")
+    if args.early_exit and args.early_exit_max_cases_per_request is None:
+        # The verdict can only be settled early against a real bound on the
+        # outstanding requests; guessing one could flip the outcome.
+        parser.error("--early-exit requires --early-exit-max-cases-per-request.")
+
+
+def add_probe_arguments(parser: ArgumentParser, command: EvaluationCommand) -> None:
+    parser.add_argument(
+        "--probe",
+        action="store_true",
+        help="Run a small probe first and only run the full evaluation if its "
+        "failure rate is close to the fail action threshold",
+    )
+    parser.add_argument(
+        "--probe-band",
+        type=parse_non_negative_float,
+        default=DEFAULT_PROBE_BAND,
+        help="Run the full evaluation when the probe's confidence interval comes "
+        "within this distance of the fail action threshold",
+    )
+    parser.add_argument(
+        "--probe-confidence",
+        type=parse_confidence,
+        default=DEFAULT_PROBE_CONFIDENCE,
+        help="Confidence level of the probe's failure rate interval",
+    )
+    if command.multi_turn:
+        parser.add_argument(
+            "--probe-max-turns",
+            type=parse_positive_int,
+            default=2,
+            help="Maximum number of turns in probe conversations (must be even)",
+        )
+    else:
+        parser.add_argument(
+            "--probe-variations",
+            type=parse_positive_int,
+            default=1,
+            help="Variations for the probe, which always runs a single iteration layer",
+        )
+    parser.add_argument(
+        "--probe-test-case-packs",
+        nargs="+",
+        help="Test case packs for the probe (defaults to --test-case-packs)",
+    )
+
+
+def validate_probe_arguments(parser: ArgumentParser, args: Namespace) -> None:
+    if not args.probe:
+        return
+    if args.shard_count > 1 or args.shard_output is not None:
+        parser.error("--probe cannot be combined with sharding.")
+    if getattr(args, "probe_max_turns", 2) % 2 != 0:
+        parser.error("--probe-max-turns must be an even integer.")
+
+
+def add_retry_arguments(parser: ArgumentParser) -> None:
+    parser.add_argument(
+        "--request-timeout",
+        type=parse_positive_float,
+        help="Seconds to wait for an evaluation response before retrying "
+        "(defaults to no limit)",
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=parse_non_negative_int,
+        default=DEFAULT_MAX_RETRIES,
+        help="Retries for timeouts, connection errors and 408/425/429/5xx responses",
+    )
+    parser.add_argument(
+        "--retry-backoff",
+        type=parse_positive_float,
+        default=DEFAULT_RETRY_BACKOFF,
+        help="Base delay in seconds for exponential backoff between retries",
+    )
+
+
+def add_history_arguments(parser: ArgumentParser) -> None:
+    parser.add_argument(
+        "--history-db",
+        type=Path,
+        default=os.environ.get("CBL_HISTORY_DB") or None,
+        help="SQLite database that records every run for later comparison",
+    )
+
+
+def add_report_arguments(parser: ArgumentParser) -> None:
+    parser.add_argument(
+        "--report-top-n",
+        type=parse_non_negative_int,
+        default=DEFAULT_TOP_N,
+        help="Number of lowest scoring failed cases to print to the log",
+    )
+    parser.add_argument(
+        "--report-max-field-length",
+        type=parse_positive_int,
+        default=DEFAULT_MAX_FIELD_LENGTH,
+        help="Truncate printed inputs, responses and messages beyond this length",
+    )
+    parser.add_argument(
+        "--report-file",
+        type=Path,
+        help="Write every failed case, untruncated, to this JSONL file",
+    )
+    parser.add_argument(
+        "--step-summary",
+        action="store_true",
+        help="Append the worst failed cases to $GITHUB_STEP_SUMMARY",
+    )
+
+
+def add_output_arguments(parser: ArgumentParser) -> None:
+    parser.add_argument(
+        "--output-format",
+        choices=OUTPUT_FORMATS,
+        help="Write the full results, including every failed case, in this format",
+    )
+    parser.add_argument(
+        "--output-file",
+        type=Path,
+        help="File to write the --output-format results to",
+    )
+
+
+def validate_output_arguments(parser: ArgumentParser, args: Namespace) -> None:
+    if (args.output_format is None) != (args.output_file is None):
+        parser.error("--output-format and --output-file must be used together.")
+    if args.output_format is not None and args.shard_output is not None:
+        parser.error("--output-format cannot be combined with --shard-output.")
+
+
+def add_analytics_arguments(parser: ArgumentParser) -> None:
+    parser.add_argument(
+        "--analytics",
+        action="store_true",
+        help="Print failure breakdowns by layer, turn and test type with score "
+        "percentiles and a histogram",
+    )
+    parser.add_argument(
+        "--gate",
+        type=parse_gate,
+        action="append",
+        help="Fail the run when an analytics metric does not satisfy a condition "
+        "such as 'layer.0.failed<=5' or 'score.p50>=0.4' (repeatable, "
+        "implies --analytics)",
+    )
+
+
+def validate_analytics_arguments(parser: ArgumentParser, args: Namespace) -> None:
+    if (args.analytics or args.gate is not None) and args.shard_output is not None:
+        parser.error("--analytics and --gate cannot be combined with --shard-output.")
+
+
+def add_instrumentation_arguments(parser: ArgumentParser) -> None:
+    parser.add_argument(
+        "--timings",
+        type=Path,
+        default=os.environ.get("CBL_TIMINGS") or None,
+        help="Write per-phase wall times for this run to a JSON file",
+    )
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        default=os.environ.get("CBL_PROFILE") or None,
+        help="Write cProfile statistics for this run to a file readable by pstats",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        default=os.environ.get("CBL_TRACE_MEMORY", "").lower() in {"1", "true"},
+        help="Record peak memory and the largest allocation sites with tracemalloc",
+    )
+    parser.add_argument(
+        "--metrics-textfile",
+        type=Path,
+        default=os.environ.get("CBL_METRICS_TEXTFILE") or None,
+        help="Write latency, response size, error and case metrics to a file in "
+        "the Prometheus text format, for the node exporter textfile collector",
+    )
+    parser.add_argument(
+        "--metrics-otlp-endpoint",
+        default=os.environ.get("CBL_METRICS_OTLP_ENDPOINT") or None,
+        help="Push the same metrics as OTLP/HTTP JSON to a collector at this base "
+        "URL, such as http://localhost:4318",
+    )
+    parser.add_argument(
+        "--metrics-label",
+        type=parse_metrics_label,
+        action="append",
+        default=[],
+        help="Add a KEY=VALUE label to every exported metric (repeatable)",
+    )
+
+
+def add_evaluation_arguments(
+    parser: ArgumentParser, command: EvaluationCommand
+) -> None:
+    parser.add_argument(
+        "--fail-action-threshold",
+        type=float,
+        required=True,
+        help="Test failure rate above this threshold will cause the action to fail",
+    )
+    parser.add_argument(
+        "--fail-case-threshold",
+        type=float,
+        required=True,
+        help="Threshold value for a case to be considered a fail",
+    )
+    if command.multi_turn:
+        parser.add_argument(
+            "--max-turns",
+            type=int,
+            required=True,
+            help="Maximum number of turns in the conversation (must be even).",
+        )
+        parser.add_argument(
+            "--test-types",
+            nargs="+",
+            required=True,
+            help="Space-separated list of multi-turn test types to execute.",
+        )
+    else:
+        parser.add_argument(
+            "--variations",
+            type=int,
+            required=True,
+            help="Number of variations",
+        )
+        parser.add_argument(
+            "--maximum-iteration-layers",
+            type=int,
+            required=True,
+            help="Maximum iteration layers",
+        )
+    if command.finetune:
+        models = parser.add_mutually_exclusive_group(required=True)
+        models.add_argument(
+            "--model-name",
+            type=str,
+            help="Fully qualified name of the model to be tested.",
+        )
+        models.add_argument(
+            "--model-names",
+            type=str,
+            nargs="+",
+            help="Sweep several fine-tuned models, such as the checkpoints of one "
+            "fine-tuning job, concurrently and rank them by failure rate",
+        )
+        models.add_argument(
+            "--model-names-file",
+            type=Path,
+            help="Sweep the fine-tuned models listed in this file, one per line",
+        )
+        parser.add_argument(
+            "--stop-at-first-pass",
+            action="store_true",
+            help="End a sweep as soon as one model passes the fail action "
+            "threshold, skipping the outstanding requests",
+        )
+    else:
+        prompt = parser.add_mutually_exclusive_group(required=True)
+        prompt.add_argument(
+            "--system-prompt",
+            type=str,
+            help="System prompt to evaluate",
+        )
+        prompt.add_argument(
+            "--system-prompt-file",
+            type=Path,
+            help="Read the system prompt to evaluate from this UTF-8 file, for "
+            "prompts too large to pass as an argument",
+        )
+        models = parser.add_mutually_exclusive_group(required=True)
+        models.add_argument(
+            "--openrouter-model-name",
+            type=str,
+            help="Openrouter model name",
+        )
+        if not command.multi_turn:
+            models.add_argument(
+                "--openrouter-model-names",
+                type=str,
+                nargs="+",
+                help="Evaluate the system prompt against several Openrouter models "
+                "concurrently and compare them side by side",
+            )
+    parser.add_argument(
+        "--circuit-breaker-labs-api-key",
+        type=str,
+        required=True,
+        help="Circuit Breaker Labs API key",
+    )
+    if command.finetune:
+        parser.add_argument(
+            "--openai-api-key",
+            type=str,
+            required=True,
+            help="OpenAI API key",
+        )
+    parser.add_argument(
+        "--test-case-packs",
+        nargs="+",
+        help="Optional test case packs to run (space-separated).",
+    )
+    add_engine_arguments(parser)
+    add_cache_arguments(parser)
+    add_recording_arguments(parser)
+    add_scheduler_arguments(parser)
+    add_shard_arguments(parser)
+    add_early_exit_arguments(parser)
+    add_probe_arguments(parser, command)
+    add_retry_arguments(parser)
+    add_history_arguments(parser)
+    add_report_arguments(parser)
+    add_output_arguments(parser)
+    add_analytics_arguments(parser)
+    add_instrumentation_arguments(parser)
+
+
+def validate_evaluation_arguments(
+    parser: ArgumentParser,
+    args: Namespace,
+    command: EvaluationCommand,
+) -> None:
+    validate_shard_arguments(parser, args, command)
+    validate_early_exit_arguments(parser, args)
+    validate_probe_arguments(parser, args)
+    validate_output_arguments(parser, args)
+    validate_analytics_arguments(parser, args)
+    if command.finetune:
+        sweep = args.model_names is not None or args.model_names_file is not None
+        if args.stop_at_first_pass and not sweep:
+            parser.error(
+                "--stop-at-first-pass requires --model-names or --model-names-file.",
+            )
+    else:
+        sweep = getattr(args, "openrouter_model_names", None) is not None
+    if sweep and (
+        args.shard_count > 1
+        or args.shard_output is not None
+        or args.early_exit
+        or args.probe
+        or args.output_format is not None
+        or args.analytics
+        or args.gate is not None
+    ):
+        models = (
+            "--model-names and --model-names-file"
+            if command.finetune
+            else "--openrouter-model-names"
+        )
+        parser.error(
+            f"{models} cannot be combined with sharding, --early-exit, --probe, "
+            "--output-format or analytics.",
+        )
+    if command.multi_turn and args.max_turns % 2 != 0:
+        parser.error("--max-turns must be an even integer.")
+
+
+def get_system_prompt(parser: ArgumentParser, args: Namespace) -> str:
+    if args.system_prompt_file is None:
+        return str(args.system_prompt)
+    # Read as bytes and decoded in one pass, so line endings are kept exactly
+    # as written and the prompt is not copied through newline translation.
+    try:
+        return str(args.system_prompt_file.read_bytes().decode("utf-8"))
+    except OSError as exc:
+        parser.error(
+            f"argument --system-prompt-file: cannot read "
+            f"'{args.system_prompt_file}': {exc.strerror}",
+        )
+    except UnicodeDecodeError as exc:
+        parser.error(
+            f"argument --system-prompt-file: '{args.system_prompt_file}' is not "
+            f"valid UTF-8 ({exc.reason} at byte {exc.start}).",
+        )
+
+
+def parse_values[ValueT](
+    parser: ArgumentParser,
+    option: str,
+    values: list[str],
+    parse: Callable[[str], ValueT],
+) -> list[ValueT]:
+    # Enum-valued options are converted after parsing, once the caller has
+    # imported the API models, and report errors the way argparse would.
+    try:
+        return [parse(value) for value in values]
+    except ArgumentTypeError as exc:
+        parser.error(f"argument {option}: {exc}")
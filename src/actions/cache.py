@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any, Protocol
+
+
+class SupportsToDict(Protocol):
+    def to_dict(self) -> dict[str, Any]: ...
+
+
+def request_key(request: SupportsToDict) -> str:
+    # The request model's class name identifies the endpoint, and its
+    # serialized body identifies everything that influences the result.
+    canonical = json.dumps(
+        {"model": type(request).__name__, "body": request.to_dict()},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def requests_key(requests: Iterable[SupportsToDict]) -> str:
+    # Identifies a set of requests regardless of the order they were built in.
+    keys = sorted(request_key(request) for request in requests)
+    return hashlib.sha256("\n".join(keys).encode()).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, directory: Path, *, ttl: float, max_bytes: int) -> None:
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, request: SupportsToDict) -> dict[str, Any] | None:
+        path = self._path(request_key(request))
+        try:
+            with path.open(encoding="utf-8") as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        if not isinstance(entry, dict) or not isinstance(entry.get("response"), dict):
+            path.unlink(missing_ok=True)
+            return None
+        if time.time() - entry.get("created_at", 0) > self.ttl:
+            path.unlink(missing_ok=True)
+            return None
+
+        # Refresh the modification time so size-based eviction is least
+        # recently used rather than least recently written.
+        os.utime(path)
+        response: dict[str, Any] = entry["response"]
+        return response
+
+    def put(self, request: SupportsToDict, response: SupportsToDict) -> None:
+        path = self._path(request_key(request))
+        temporary_path = path.with_suffix(f".{os.getpid()}.tmp")
+        entry = {"created_at": time.time(), "response": response.to_dict()}
+        with temporary_path.open("w", encoding="utf-8") as file:
+            json.dump(entry, file, separators=(",", ":"))
+        temporary_path.replace(path)
+        self.evict()
+
+    def evict(self) -> None:
+        now = time.time()
+        entries = []
+        for path in self.directory.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total_bytes -= size
+
+
+class MemoryCache:
+    # The in-process counterpart of ResultCache, kept by the serve process so
+    # repeated evaluations skip both the API and the disk.
+    def __init__(self, *, ttl: float, max_entries: int) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+
+    def get(self, request: SupportsToDict) -> dict[str, Any] | None:
+        key = request_key(request)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        created_at, response = entry
+        if time.time() - created_at > self.ttl:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return response
+
+    def put(self, request: SupportsToDict, response: SupportsToDict) -> None:
+        key = request_key(request)
+        self.entries[key] = (time.time(), response.to_dict())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+def open_cache(
+    directory: Path | None,
+    *,
+    ttl: float,
+    max_bytes: int,
+) -> ResultCache | None:
+    if directory is None:
+        return None
+    return ResultCache(directory, ttl=ttl, max_bytes=max_bytes)
@@ -0,0 +1,452 @@
+import asyncio
+import glob
+import subprocess
+import sys
+from argparse import ArgumentParser
+from dataclasses import dataclass, replace
+from pathlib import Path
+
+from .arguments import (
+    DEFAULT_CONCURRENCY,
+    add_history_arguments,
+    add_report_arguments,
+    add_retry_arguments,
+    parse_positive_int,
+    parse_values,
+)
+from .cache import requests_key
+from .common import (
+    MULTI_TURN,
+    SINGLE_TURN,
+    get_retry_options,
+    parse_multi_turn_test_type,
+    parse_test_case_pack,
+)
+from .history import RunSummary, find_latest_run, record_run
+from .matrix_evaluate import Manifest, MatrixResult, build_cells, evaluate_cells
+from .report import (
+    ReportOptions,
+    format_markdown_table,
+    format_table,
+    get_report_options,
+    report_failed_cases,
+    write_step_summary,
+)
+from .transport import RetryOptions
+
+# Runs are recorded under the endpoint they were evaluated with, so verdicts
+# stored by the single-prompt actions are reused as well.
+ENDPOINTS = {
+    SINGLE_TURN: "singleturn-evaluate-system-prompt",
+    MULTI_TURN: "multiturn-evaluate-system-prompt",
+}
+
+
+@dataclass
+class CommandLineArguments:
+    prompts: list[str]
+    base_ref: str
+    manifest: Manifest
+    history_db: Path
+    circuit_breaker_labs_api_key: str
+    concurrency: int
+    retry: RetryOptions
+    report: ReportOptions
+
+
+@dataclass
+class PromptFile:
+    path: Path
+    system_prompt: str
+    # "new" or "changed" relative to the base ref, otherwise "unchanged".
+    status: str
+    stored: RunSummary | None = None
+
+
+def get_cli_args() -> CommandLineArguments:
+    parser = ArgumentParser(
+        description="Evaluate the system prompt files changed since a git base ref "
+        "and reuse stored verdicts for the rest",
+    )
+
+    parser.add_argument(
+        "--prompts",
+        nargs="+",
+        required=True,
+        help="Glob patterns of system prompt files, one prompt per file",
+    )
+    parser.add_argument(
+        "--base-ref",
+        type=str,
+        required=True,
+        help="Git ref to compare the prompt files against, e.g. origin/main",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=[SINGLE_TURN, MULTI_TURN],
+        required=True,
+        help="Evaluate with the single-turn or multi-turn API",
+    )
+    parser.add_argument(
+        "--fail-action-threshold",
+        type=float,
+        required=True,
+        help="Test failure rate above this threshold will fail the prompt",
+    )
+    parser.add_argument(
+        "--fail-case-threshold",
+        type=float,
+        required=True,
+        help="Threshold value for a case to be considered a fail",
+    )
+    parser.add_argument(
+        "--variations",
+        type=int,
+        help="Number of variations (single-turn)",
+    )
+    parser.add_argument(
+        "--maximum-iteration-layers",
+        type=int,
+        help="Maximum iteration layers (single-turn)",
+    )
+    parser.add_argument(
+        "--max-turns",
+        type=int,
+        help="Maximum number of turns in the conversation (multi-turn, must be even)",
+    )
+    parser.add_argument(
+        "--test-types",
+        nargs="+",
+        help="Space-separated list of multi-turn test types to execute",
+    )
+    parser.add_argument(
+        "--openrouter-model-name",
+        type=str,
+        required=True,
+        help="Openrouter model name",
+    )
+    parser.add_argument(
+        "--test-case-packs",
+        nargs="+",
+        help="Optional test case packs to run (space-separated).",
+    )
+    parser.add_argument(
+        "--circuit-breaker-labs-api-key",
+        type=str,
+        required=True,
+        help="Circuit Breaker Labs API key",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=parse_positive_int,
+        default=DEFAULT_CONCURRENCY,
+        help="Maximum number of evaluations in flight at once",
+    )
+    add_history_arguments(parser)
+    add_retry_arguments(parser)
+    add_report_arguments(parser)
+
+    args = parser.parse_args()
+    if args.history_db is None:
+        parser.error("--history-db is required to store and reuse verdicts.")
+    if args.mode == SINGLE_TURN and (
+        args.variations is None or args.maximum_iteration_layers is None
+    ):
+        parser.error(
+            "--variations and --maximum-iteration-layers are required in "
+            "single-turn mode.",
+        )
+    if args.mode == MULTI_TURN:
+        if args.max_turns is None or args.test_types is None:
+            parser.error(
+                "--max-turns and --test-types are required in multi-turn mode."
+            )
+        if args.max_turns % 2 != 0:
+            parser.error("--max-turns must be an even integer.")
+
+    manifest = Manifest(
+        mode=args.mode,
+        fail_action_threshold=args.fail_action_threshold,
+        fail_case_threshold=args.fail_case_threshold,
+        system_prompts={},
+        openrouter_model_names=[args.openrouter_model_name],
+        test_case_packs=[
+            parse_values(
+                parser,
+                "--test-case-packs",
+                args.test_case_packs,
+                parse_test_case_pack,
+            )
+            if args.test_case_packs is not None
+            else None,
+        ],
+        variations=args.variations or 0,
+        maximum_iteration_layers=args.maximum_iteration_layers or 0,
+        max_turns=args.max_turns or 0,
+        test_types=parse_values(
+            parser,
+            "--test-types",
+            args.test_types,
+            parse_multi_turn_test_type,
+        )
+        if args.test_types is not None
+        else None,
+    )
+
+    return CommandLineArguments(
+        prompts=args.prompts,
+        base_ref=args.base_ref,
+        manifest=manifest,
+        history_db=args.history_db,
+        circuit_breaker_labs_api_key=args.circuit_breaker_labs_api_key,
+        concurrency=args.concurrency,
+        retry=get_retry_options(args),
+        report=get_report_options(args),
+    )
+
+
+def _git(*args: str) -> str:
+    completed = subprocess.run(
+        ["git", *args],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip() or f"git {args[0]} failed")
+    return completed.stdout
+
+
+def find_prompt_files(patterns: list[str]) -> list[Path]:
+    paths = {
+        Path(match)
+        for pattern in patterns
+        for match in glob.glob(pattern, recursive=True)
+    }
+    return sorted(path for path in paths if path.is_file())
+
+
+def load_prompt_files(paths: list[Path], *, base_ref: str) -> list[PromptFile]:
+    # Two git calls cover every file: one lists the files that existed at the
+    # base ref, the other those whose content differs from it. Paths are
+    # reported relative to the working directory, as they were matched.
+    commit = _git("rev-parse", "--verify", f"{base_ref}^{{commit}}").strip()
+    names = [path.as_posix() for path in paths]
+    existing = set(
+        _git("ls-tree", "-r", "-z", "--name-only", commit, "--", *names).split("\0"),
+    )
+    changed = set(
+        _git(
+            "diff",
+            "--name-only",
+            "-z",
+            "--relative",
+            commit,
+            "--",
+            *names,
+        ).split("\0"),
+    )
+
+    prompt_files = []
+    for path, name in zip(paths, names, strict=True):
+        if name not in existing:
+            status = "new"
+        elif name in changed:
+            status = "changed"
+        else:
+            status = "unchanged"
+        # Decoded like --system-prompt-file, which keeps line endings.
+        try:
+            system_prompt = path.read_bytes().decode("utf-8")
+        except UnicodeDecodeError as exc:
+            raise RuntimeError(
+                f"'{path}' is not valid UTF-8 ({exc.reason} at byte {exc.start}).",
+            ) from exc
+        prompt_files.append(
+            PromptFile(path=path, system_prompt=system_prompt, status=status),
+        )
+    return prompt_files
+
+
+def _record(args: CommandLineArguments, result: MatrixResult) -> None:
+    manifest = args.manifest
+    assert result.run_tests_response is not None
+    record_run(
+        args.history_db,
+        endpoint=ENDPOINTS[manifest.mode],
+        system_prompt=result.cell.request.system_prompt,
+        model=result.cell.openrouter_model_name,
+        test_case_packs=result.cell.test_case_packs,
+        test_types=manifest.test_types,
+        run_tests_response=result.run_tests_response,
+        fail_action_threshold=manifest.fail_action_threshold,
+        duration=result.duration,
+        request_key=requests_key([result.cell.request]),
+        fail_case_threshold=manifest.fail_case_threshold,
+    )
+
+
+def print_prompt_summary(
+    *,
+    prompt_files: list[PromptFile],
+    results: dict[str, MatrixResult],
+    fail_action_threshold: float,
+    step_summary: bool,
+) -> None:
+    headers = ("Prompt", "Status", "Verdict", "Failure Rate", "Result")
+    rows = []
+    for prompt_file in prompt_files:
+        if prompt_file.stored is not None:
+            source = f"stored run #{prompt_file.stored.id}"
+            failure_rate: float | None = prompt_file.stored.failure_rate
+        else:
+            result = results[str(prompt_file.path)]
+            source = "evaluated"
+            failure_rate = None if result.error is not None else result.failure_rate
+
+        if failure_rate is None:
+            rate, verdict = "-", "ERROR"
+        else:
+            rate = f"{failure_rate:.2%}"
+            verdict = "FAIL" if failure_rate > fail_action_threshold else "PASS"
+        rows.append((str(prompt_file.path), prompt_file.status, source, rate, verdict))
+
+    for line in format_table(headers, rows):
+        print(line)
+    print()
+
+    if step_summary:
+        write_step_summary(
+            [
+                "### Circuit Breaker Labs Changed Prompts",
+                "",
+                *format_markdown_table(headers, rows),
+                "",
+            ],
+        )
+
+
+def main() -> None:
+    args = get_cli_args()
+    manifest = args.manifest
+
+    paths = find_prompt_files(args.prompts)
+    if not paths:
+        print(f"Error: no prompt files match {' '.join(args.prompts)}")
+        sys.exit(1)
+    try:
+        prompt_files = load_prompt_files(paths, base_ref=args.base_ref)
+    except (OSError, RuntimeError) as exc:
+        print(f"Error: {exc}")
+        sys.exit(1)
+
+    # One cell per prompt file, since the manifest has a single model and test
+    # case pack selection.
+    cells = {
+        cell.prompt_name: cell
+        for cell in build_cells(
+            replace(
+                manifest,
+                system_prompts={
+                    str(prompt_file.path): prompt_file.system_prompt
+                    for prompt_file in prompt_files
+                },
+            ),
+        )
+    }
+
+    # Untouched prompts reuse the latest complete verdict recorded for exactly
+    # the same request. Prompts without one are evaluated as well.
+    for prompt_file in prompt_files:
+        if prompt_file.status == "unchanged":
+            prompt_file.stored = find_latest_run(
+                args.history_db,
+                endpoint=ENDPOINTS[manifest.mode],
+                request_key=requests_key([cells[str(prompt_file.path)].request]),
+            )
+
+    pending = [
+        cells[str(prompt_file.path)]
+        for prompt_file in prompt_files
+        if prompt_file.stored is None
+    ]
+    print(
+        f"Evaluating {len(pending)} of {len(prompt_files)} prompt files "
+        f"({sum(prompt_file.status != 'unchanged' for prompt_file in prompt_files)} "
+        f"new or changed since {args.base_ref}).\n",
+    )
+
+    results = (
+        asyncio.run(
+            evaluate_cells(
+                cells=pending,
+                cbl_api_key=args.circuit_breaker_labs_api_key,
+                concurrency=args.concurrency,
+                retry=args.retry,
+            ),
+        )
+        if pending
+        else []
+    )
+    for result in results:
+        if result.run_tests_response is not None:
+            _record(args, result)
+
+    results_by_prompt = {result.cell.prompt_name: result for result in results}
+    print_prompt_summary(
+        prompt_files=prompt_files,
+        results=results_by_prompt,
+        fail_action_threshold=manifest.fail_action_threshold,
+        step_summary=args.report.step_summary,
+    )
+
+    # Every failing prompt appends to the same report file, tagged with its path.
+    report_options = replace(args.report, append=True)
+    if args.report.report_file is not None:
+        args.report.report_file.parent.mkdir(parents=True, exist_ok=True)
+        args.report.report_file.write_text("", encoding="utf-8")
+
+    failed_prompts = 0
+    for prompt_file in prompt_files:
+        stored = prompt_file.stored
+        if stored is not None:
+            if stored.failure_rate > manifest.fail_action_threshold:
+                failed_prompts += 1
+                print(f"==== {prompt_file.path} ====")
+                print(
+                    f"Failure rate {stored.failure_rate:.2%} from stored run "
+                    f"#{stored.id}.\n",
+                )
+            continue
+
+        result = results_by_prompt[str(prompt_file.path)]
+        if result.error is not None:
+            failed_prompts += 1
+            print(f"==== {prompt_file.path} ====")
+            print(f"Error: {result.error}\n")
+            continue
+
+        run_tests_response = result.run_tests_response
+        assert run_tests_response is not None
+        if result.failure_rate <= manifest.fail_action_threshold:
+            continue
+
+        failed_prompts += 1
+        print(f"==== {prompt_file.path} ====")
+        context = {"prompt": str(prompt_file.path)}
+        report_failed_cases(
+            run_tests_response,
+            failure_rate=result.failure_rate,
+            options=report_options,
+            context=context,
+        )
+
+    if failed_prompts:
+        print(f"{failed_prompts} of {len(prompt_files)} prompts failed.")
+        sys.exit(1)
+
+    print("All prompts passed within the acceptable failure threshold.")
+
+
+if __name__ == "__main__":
+    main()
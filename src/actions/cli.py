@@ -0,0 +1,167 @@
+import importlib
+import json
+import os
+import socket
+import sys
+from argparse import ArgumentParser, Namespace
+from pathlib import Path
+
+from .arguments import (
+    DEFAULT_CACHE_TTL,
+    DEFAULT_CONCURRENCY,
+    EVALUATION_COMMANDS,
+    add_evaluation_arguments,
+    parse_positive_int,
+)
+
+# (mode, target) subcommand names for each endpoint.
+SUBCOMMANDS = {
+    ("singleturn", "system-prompt"): "singleturn-evaluate-system-prompt",
+    ("singleturn", "finetune"): "singleturn-evaluate-openai-finetune",
+    ("multiturn", "system-prompt"): "multiturn-evaluate-system-prompt",
+    ("multiturn", "finetune"): "multiturn-evaluate-openai-finetune",
+}
+
+# Environment variables a submitted evaluation reads, such as CBL_CACHE_DIR
+# and GITHUB_STEP_SUMMARY, are taken from the submitting shell.
+FORWARDED_ENV_PREFIXES = ("CBL_", "GITHUB_")
+DEFAULT_SERVE_CACHE_ENTRIES = 1024
+
+
+def build_parser() -> ArgumentParser:
+    parser = ArgumentParser(
+        prog="cbl-evaluate",
+        description="Evaluate a system prompt or OpenAI fine-tuned model using the "
+        "Circuit Breaker Labs API",
+        allow_abbrev=False,
+    )
+    parser.add_argument(
+        "--server",
+        type=Path,
+        default=os.environ.get("CBL_SERVER") or None,
+        metavar="SOCKET",
+        help="Run the evaluation in a `cbl-evaluate serve` process listening on "
+        "this Unix socket",
+    )
+    modes = parser.add_subparsers(dest="mode", required=True)
+    for mode in ("singleturn", "multiturn"):
+        mode_parser = modes.add_parser(mode, help=f"Run a {mode} evaluation")
+        targets = mode_parser.add_subparsers(dest="target", required=True)
+        for target in ("system-prompt", "finetune"):
+            command = EVALUATION_COMMANDS[SUBCOMMANDS[mode, target]]
+            target_parser = targets.add_parser(
+                target,
+                help=command.description,
+                description=command.description,
+            )
+            add_evaluation_arguments(target_parser, command)
+
+    serve_parser = modes.add_parser(
+        "serve",
+        help="Keep a warm process that runs submitted evaluations",
+        description="Run evaluations submitted with `cbl-evaluate --server` in one "
+        "long-lived process that keeps its imports, connections and results "
+        "cache between them",
+    )
+    serve_parser.add_argument(
+        "--socket",
+        type=Path,
+        default=os.environ.get("CBL_SERVER") or None,
+        required=not os.environ.get("CBL_SERVER"),
+        help="Unix socket to listen on",
+    )
+    serve_parser.add_argument(
+        "--concurrency",
+        type=parse_positive_int,
+        default=DEFAULT_CONCURRENCY,
+        help="Maximum number of pooled connections to the API",
+    )
+    serve_parser.add_argument(
+        "--cache-ttl",
+        type=parse_positive_int,
+        default=DEFAULT_CACHE_TTL,
+        help="Seconds an in-memory result stays valid",
+    )
+    serve_parser.add_argument(
+        "--cache-max-entries",
+        type=parse_positive_int,
+        default=DEFAULT_SERVE_CACHE_ENTRIES,
+        help="Number of results kept in memory before the least recently used "
+        "are evicted",
+    )
+    return parser
+
+
+def command_argv(argv: list[str], args: Namespace) -> list[str]:
+    # Drops the top-level options, which all come before the mode.
+    index = 0
+    while argv[index] != args.mode:
+        index += 2 if argv[index] == "--server" else 1
+    return argv[index:]
+
+
+def run_command(argv: list[str]) -> None:
+    args = build_parser().parse_args(argv)
+    command = EVALUATION_COMMANDS[SUBCOMMANDS[args.mode, args.target]]
+    module = importlib.import_module(command.module)
+    module.main(argv[2:], prog=f"cbl-evaluate {args.mode} {args.target}")
+
+
+def submit(server: Path, argv: list[str]) -> None:
+    job = {
+        "argv": argv,
+        "cwd": os.getcwd(),
+        "env": {
+            name: value
+            for name, value in os.environ.items()
+            if name.startswith(FORWARDED_ENV_PREFIXES)
+        },
+    }
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        try:
+            connection.connect(str(server))
+        except OSError as exc:
+            print(f"Error: no evaluation server at {server}: {exc.strerror}")
+            sys.exit(1)
+        connection.sendall(json.dumps(job).encode() + b"\n")
+        with connection.makefile(encoding="utf-8") as messages:
+            for line in messages:
+                message = json.loads(line)
+                if "exit" in message:
+                    sys.stdout.flush()
+                    sys.exit(message["exit"])
+                for name, stream in (("stdout", sys.stdout), ("stderr", sys.stderr)):
+                    if name in message:
+                        stream.write(message[name])
+                        stream.flush()
+
+    print(f"Error: the evaluation server at {server} closed the connection.")
+    sys.exit(1)
+
+
+def main() -> None:
+    # Only the argument definitions are imported up front. The API client and
+    # models are loaded by the chosen evaluation once the command line is
+    # known to be valid, so --help and usage errors stay fast.
+    argv = sys.argv[1:]
+    args = build_parser().parse_args(argv)
+    if args.mode == "serve":
+        from .serve import ServeOptions
+        from .serve import main as serve
+
+        serve(
+            ServeOptions(
+                socket=args.socket,
+                concurrency=args.concurrency,
+                cache_ttl=args.cache_ttl,
+                cache_max_entries=args.cache_max_entries,
+            ),
+        )
+    elif args.server is not None:
+        submit(args.server, command_argv(argv, args))
+    else:
+        run_command(command_argv(argv, args))
+
+
+if __name__ == "__main__":
+    main()
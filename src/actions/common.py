@@ -1,19 +1,82 @@
 from __future__ import annotations
 
-from argparse import ArgumentTypeError
-from collections.abc import Iterable
+import os
+from argparse import ArgumentTypeError, Namespace
+from typing import TYPE_CHECKING
 
-from circuit_breaker_labs.models.message import Message
-from circuit_breaker_labs.models.multi_turn_failed_test_result import (
-    MultiTurnFailedTestResult,
-)
+import httpx
+from circuit_breaker_labs.client import Client
 from circuit_breaker_labs.models.multi_turn_test_type import MultiTurnTestType
-from circuit_breaker_labs.models.single_turn_failed_test_result import (
-    SingleTurnFailedTestResult,
-)
 from circuit_breaker_labs.models.test_case_pack import TestCasePack
 
-BASE_URL = "https://api.circuitbreakerlabs.ai/v1/"
+from .scheduler import Scheduler, SchedulerOptions
+from .transport import (
+    AttemptLog,
+    CompressingTransport,
+    RetryOptions,
+    RetryTransport,
+    SharedTransport,
+)
+
+if TYPE_CHECKING:
+    from .recording import RecordingOptions
+
+DEFAULT_BASE_URL = "https://api.circuitbreakerlabs.ai/v1/"
+
+SINGLE_TURN = "singleturn"
+MULTI_TURN = "multiturn"
+
+
+def build_client(
+    *,
+    concurrency: int = 1,
+    retry: RetryOptions | None = None,
+    log: AttemptLog | None = None,
+    recording: RecordingOptions | None = None,
+    connections: httpx.AsyncBaseTransport | None = None,
+    scheduler: SchedulerOptions | None = None,
+    compress_requests: bool = False,
+) -> Client:
+    retry = retry or RetryOptions()
+    limits = httpx.Limits(
+        max_connections=concurrency,
+        max_keepalive_connections=concurrency,
+    )
+    # Only the async client is used, so the retrying transport replaces the
+    # default async transport outright.
+    transport: httpx.AsyncBaseTransport | None = None
+    if recording is None or recording.mode == "record":
+        transport = RetryTransport(
+            SharedTransport(connections)
+            if connections is not None
+            else httpx.AsyncHTTPTransport(limits=limits),
+            options=retry,
+            log=log,
+            scheduler=Scheduler(scheduler) if scheduler is not None else None,
+        )
+        if compress_requests:
+            transport = CompressingTransport(transport, log=log)
+    if recording is not None:
+        from .recording import RecordingTransport
+
+        # Without an underlying transport, every request is answered from
+        # the recording and nothing is sent.
+        transport = RecordingTransport(transport, options=recording)
+    # Read for each client rather than at import, since the serve process
+    # runs every evaluation with the environment of the job that sent it.
+    return Client(
+        os.environ.get("CBL_BASE_URL", DEFAULT_BASE_URL),
+        timeout=retry.timeout,
+        httpx_args={"transport": transport},
+    )
+
+
+def get_retry_options(args: Namespace) -> RetryOptions:
+    return RetryOptions(
+        request_timeout=args.request_timeout,
+        max_retries=args.max_retries,
+        backoff=args.retry_backoff,
+    )
 
 
 def compute_failure_rate(*, total_passed: int, total_failed: int) -> float:
@@ -23,44 +86,6 @@ def compute_failure_rate(*, total_passed: int, total_failed: int) -> float:
     return total_failed / total_cases
 
 
-def print_single_turn_failed_cases(
-    *,
-    failure_rate: float,
-    failed_cases: Iterable[Iterable[SingleTurnFailedTestResult]],
-) -> None:
-    print(f"Overall Failure Rate: {failure_rate:.2%}\n")
-    for layer_index, cases in enumerate(failed_cases):
-        for case in cases:
-            print("---- Failed Case ----")
-            print(f"    Layer: {layer_index}")
-            print(f"    Safety Score: {case.safe_response_score}")
-            print(f"    User Input: {case.user_input}")
-            print(f"    Model Response: {case.model_response}")
-            print()
-
-
-def print_multi_turn_failed_cases(
-    *,
-    failure_rate: float,
-    failed_cases: Iterable[MultiTurnFailedTestResult],
-) -> None:
-    print(f"Overall Failure Rate: {failure_rate:.2%}\n")
-    for case_index, case in enumerate(failed_cases, start=1):
-        print("---- Failed Case ----")
-        print(f"    Case: {case_index}")
-        print(f"    Min Safety Score: {case.min_safe_response_score}")
-        print("    Conversation:")
-        for turn_index, message in enumerate(case.conversation, start=1):
-            _print_message(turn_index=turn_index, message=message)
-        print()
-
-
-def _print_message(*, turn_index: int, message: Message) -> None:
-    role = message.role.value
-    content = message.content
-    print(f"        [{turn_index}] {role}: {content}")
-
-
 def parse_test_case_pack(value: str) -> TestCasePack:
     try:
         return TestCasePack(value)
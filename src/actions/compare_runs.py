@@ -0,0 +1,140 @@
+import sys
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from pathlib import Path
+
+from .arguments import (
+    DEFAULT_MAX_FIELD_LENGTH,
+    EVALUATION_COMMANDS,
+    get_system_prompt,
+    parse_non_negative_int,
+)
+from .history import compare_to_baseline, hash_prompt
+from .report import truncate
+
+
+@dataclass
+class CommandLineArguments:
+    history_db: Path
+    endpoint: str
+    prompt_hash: str
+    model: str
+    max_new_failures: int
+
+
+def get_cli_args() -> CommandLineArguments:
+    parser = ArgumentParser(
+        description="Compare the latest recorded run against the last passing baseline",
+    )
+
+    parser.add_argument(
+        "--history-db",
+        type=Path,
+        required=True,
+        help="SQLite database written with --history-db",
+    )
+    parser.add_argument(
+        "--endpoint",
+        choices=EVALUATION_COMMANDS,
+        required=True,
+        help="Evaluation that recorded the runs",
+    )
+    subject = parser.add_mutually_exclusive_group()
+    subject.add_argument(
+        "--system-prompt",
+        type=str,
+        help="System prompt the runs evaluated",
+    )
+    subject.add_argument(
+        "--system-prompt-file",
+        type=Path,
+        help="File holding the system prompt the runs evaluated",
+    )
+    subject.add_argument(
+        "--prompt-hash",
+        type=str,
+        help="SHA-256 hash of the system prompt the runs evaluated",
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        required=True,
+        help="OpenRouter model name or fine-tuned model name the runs evaluated",
+    )
+    parser.add_argument(
+        "--max-new-failures",
+        type=parse_non_negative_int,
+        default=0,
+        help="Number of newly failing cases tolerated before the comparison fails",
+    )
+
+    args = parser.parse_args()
+    finetune = EVALUATION_COMMANDS[args.endpoint].finetune
+    if finetune != (
+        args.system_prompt is None
+        and args.system_prompt_file is None
+        and args.prompt_hash is None
+    ):
+        parser.error(
+            "--system-prompt, --system-prompt-file or --prompt-hash is required "
+            "for system prompt evaluations, and not allowed for fine-tune "
+            "evaluations.",
+        )
+
+    return CommandLineArguments(
+        history_db=args.history_db,
+        endpoint=args.endpoint,
+        prompt_hash=args.prompt_hash
+        or hash_prompt(None if finetune else get_system_prompt(parser, args)),
+        model=args.model,
+        max_new_failures=args.max_new_failures,
+    )
+
+
+def _format_time(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=UTC).strftime("%Y-%m-%d %H:%M:%S UTC")
+
+
+def main() -> None:
+    args = get_cli_args()
+
+    current, baseline, new_failures = compare_to_baseline(
+        args.history_db,
+        endpoint=args.endpoint,
+        prompt_hash=args.prompt_hash,
+        model=args.model,
+    )
+
+    if current is None:
+        print("Error: no recorded runs match this prompt and model.")
+        sys.exit(1)
+
+    print(
+        f"Current run:  #{current.id} at {_format_time(current.created_at)}, "
+        f"failure rate {current.failure_rate:.2%}",
+    )
+    if baseline is None:
+        print("Baseline run: none passing, every failed case is treated as new")
+    else:
+        print(
+            f"Baseline run: #{baseline.id} at {_format_time(baseline.created_at)}, "
+            f"failure rate {baseline.failure_rate:.2%}",
+        )
+    print()
+
+    for failure in new_failures:
+        layer = "-" if failure.layer is None else str(failure.layer)
+        print("---- Newly Failing Case ----")
+        print(f"    Layer: {layer}")
+        print(f"    Safety Score: {failure.score}")
+        print(f"    Input: {truncate(failure.summary, DEFAULT_MAX_FIELD_LENGTH)}")
+        print()
+
+    print(f"{len(new_failures)} newly failing cases.")
+    if len(new_failures) > args.max_new_failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import sys
+from collections.abc import Sequence
+from dataclasses import dataclass, replace
+from typing import Any
+
+from circuit_breaker_labs.models.multi_turn_run_tests_response import (
+    MultiTurnRunTestsResponse,
+)
+from circuit_breaker_labs.models.single_turn_run_tests_response import (
+    SingleTurnRunTestsResponse,
+)
+
+from .cache import SupportsToDict
+from .common import compute_failure_rate
+from .instrumentation import Instrumentation
+from .pipeline import (
+    Evaluation,
+    EvaluationOptions,
+    evaluate_requests,
+    record_model_run,
+)
+from .report import (
+    format_markdown_table,
+    format_table,
+    report_failed_cases,
+    write_step_summary,
+)
+from .sweep import SweepBudget
+
+
+@dataclass
+class ModelResult[
+    RunTestsResponseT: (SingleTurnRunTestsResponse, MultiTurnRunTestsResponse)
+]:
+    model: str
+    run_tests_response: RunTestsResponseT
+    failure_rate: float
+
+    @property
+    def layer_failure_counts(self) -> list[int]:
+        if not isinstance(self.run_tests_response, SingleTurnRunTestsResponse):
+            return []
+        return [len(cases) for cases in self.run_tests_response.failed_results]
+
+
+def print_model_comparison(
+    *,
+    results: Sequence[ModelResult[Any]],
+    fail_action_threshold: float,
+    step_summary: bool,
+    title: str = "Model Comparison",
+) -> None:
+    layers = max((len(result.layer_failure_counts) for result in results), default=0)
+    headers = (
+        "Model",
+        "Passed",
+        "Failed",
+        "Failure Rate",
+        *(f"Layer {layer}" for layer in range(layers)),
+        "Result",
+    )
+    rows = []
+    for result in results:
+        counts = result.layer_failure_counts
+        rows.append(
+            (
+                result.model,
+                str(result.run_tests_response.total_passed),
+                str(result.run_tests_response.total_failed),
+                f"{result.failure_rate:.2%}",
+                *(
+                    str(counts[layer]) if layer < len(counts) else "-"
+                    for layer in range(layers)
+                ),
+                "FAIL" if result.failure_rate > fail_action_threshold else "PASS",
+            ),
+        )
+
+    for line in format_table(headers, rows):
+        print(line)
+    print()
+
+    if step_summary:
+        write_step_summary(
+            [
+                f"### Circuit Breaker Labs {title}",
+                "",
+                f"Failure threshold: **{fail_action_threshold:.2%}**."
+                + (
+                    " Layer columns count failed cases per iteration layer."
+                    if layers
+                    else ""
+                ),
+                "",
+                *format_markdown_table(headers, rows),
+                "",
+            ],
+        )
+
+
+def run_comparison[
+    RequestT: SupportsToDict,
+    RunTestsResponseT: (SingleTurnRunTestsResponse, MultiTurnRunTestsResponse),
+](
+    evaluation: Evaluation[RequestT, RunTestsResponseT],
+    options: EvaluationOptions,
+    instrumentation: Instrumentation,
+    *,
+    sweep: bool = False,
+    stop_at_first_pass: bool = False,
+) -> None:
+    # A comparison passes when every model passes; a sweep picks a model, so
+    # it passes as long as one model passes.
+    instrumentation.begin("build_requests")
+    requests_by_model = {
+        model: evaluation.build_requests(model, None) for model in evaluation.models
+    }
+    requests = [
+        request
+        for model_requests in requests_by_model.values()
+        for request in model_requests
+    ]
+    models = [
+        model
+        for model, model_requests in requests_by_model.items()
+        for _ in model_requests
+    ]
+    model_by_request = {
+        id(request): model for request, model in zip(requests, models, strict=True)
+    }
+    responses_by_model: dict[str, list[RunTestsResponseT]] = {
+        model: [] for model in evaluation.models
+    }
+
+    # Every model's requests share one pooled client, cache and concurrency
+    # limit, so the slowest model does not hold the others back.
+    instrumentation.begin("evaluate")
+    evaluate_requests(
+        evaluation,
+        options,
+        instrumentation,
+        requests,
+        budget=SweepBudget(
+            fail_action_threshold=options.fail_action_threshold,
+            models=models,
+        )
+        if stop_at_first_pass
+        else None,
+        on_result=lambda request, result: responses_by_model[
+            model_by_request[id(request)]
+        ].append(result),
+    )
+
+    instrumentation.begin("report")
+    results = []
+    skipped = []
+    for model, model_requests in requests_by_model.items():
+        # A model whose requests did not all complete was cut short by
+        # --stop-at-first-pass and has no verdict.
+        if len(responses_by_model[model]) < len(model_requests):
+            skipped.append(model)
+            continue
+        run_tests_response = evaluation.merge(responses_by_model[model])
+        results.append(
+            ModelResult(
+                model=model,
+                run_tests_response=run_tests_response,
+                failure_rate=compute_failure_rate(
+                    total_passed=run_tests_response.total_passed,
+                    total_failed=run_tests_response.total_failed,
+                ),
+            ),
+        )
+        record_model_run(
+            evaluation,
+            options,
+            instrumentation,
+            run_tests_response,
+            model=model,
+        )
+
+    if sweep:
+        # Safest first. The sort is stable, so ties keep the order given.
+        results.sort(key=lambda result: result.failure_rate)
+    print_model_comparison(
+        results=results,
+        fail_action_threshold=options.fail_action_threshold,
+        step_summary=options.report.step_summary,
+        title="Fine-Tune Sweep" if sweep else "Model Comparison",
+    )
+    if skipped:
+        print(f"Not evaluated: {', '.join(skipped)}.")
+
+    # Every failing model appends to the same report file, tagged with its name.
+    report_options = replace(options.report, append=True)
+    if options.report.report_file is not None:
+        options.report.report_file.parent.mkdir(parents=True, exist_ok=True)
+        options.report.report_file.write_text("", encoding="utf-8")
+
+    failed_models = [
+        result
+        for result in results
+        if result.failure_rate > options.fail_action_threshold
+    ]
+    for result in failed_models:
+        print(f"==== {result.model} ====")
+        report_failed_cases(
+            result.run_tests_response,
+            failure_rate=result.failure_rate,
+            options=report_options,
+            context={"model": result.model},
+        )
+
+    if sweep:
+        safest = results[0]
+        if safest.failure_rate > options.fail_action_threshold:
+            print(f"None of the {len(results)} models passed the failure threshold.")
+            sys.exit(1)
+        print(
+            f"Safest model: {safest.model} with a failure rate of "
+            f"{safest.failure_rate:.2%}.",
+        )
+        return
+
+    if failed_models:
+        print(
+            f"{len(failed_models)} of {len(results)} models exceeded the failure "
+            "threshold.",
+        )
+        sys.exit(1)
+
+    print("All models passed within the acceptable failure threshold.")
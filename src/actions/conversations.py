@@ -0,0 +1,273 @@
+from __future__ import annotations
+
+import json
+from array import array
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from typing import Any, cast, overload
+
+from circuit_breaker_labs.models.multi_turn_failed_test_result import (
+    MultiTurnFailedTestResult,
+)
+from circuit_breaker_labs.models.multi_turn_run_tests_response import (
+    MultiTurnRunTestsResponse,
+)
+from circuit_breaker_labs.models.role import Role
+
+
+class StringTable:
+    # Stores each distinct string once; everything else refers to it by index.
+    __slots__ = ("_indexes", "strings")
+
+    def __init__(self) -> None:
+        self.strings: list[str] = []
+        self._indexes: dict[str, int] = {}
+
+    def intern(self, text: str) -> int:
+        index = self._indexes.get(text)
+        if index is None:
+            index = self._indexes[text] = len(self.strings)
+            self.strings.append(text)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+
+class CompactConversation:
+    # One failed case. `roles` and `contents` hold string table indexes, one
+    # per message. Properties the API adds beyond the known fields are kept
+    # only when present.
+    __slots__ = (
+        "contents",
+        "message_properties",
+        "min_safe_response_score",
+        "properties",
+        "roles",
+    )
+
+    def __init__(
+        self,
+        *,
+        min_safe_response_score: float,
+        roles: array[int],
+        contents: array[int],
+        properties: dict[str, Any] | None = None,
+        message_properties: tuple[dict[str, Any], ...] | None = None,
+    ) -> None:
+        self.min_safe_response_score = min_safe_response_score
+        self.roles = roles
+        self.contents = contents
+        self.properties = properties
+        self.message_properties = message_properties
+
+
+class ConversationTable(Sequence[MultiTurnFailedTestResult]):
+    # Multi-turn failed cases with their message roles and contents interned,
+    # so attacker turns and boilerplate repeated across conversations are
+    # stored, hashed and encoded once. Indexing or iterating builds the
+    # generated models on demand; reporting, diffing and serialization read
+    # the compact conversations directly.
+    __slots__ = ("_encoded", "_roles", "conversations", "strings")
+
+    def __init__(self) -> None:
+        self.strings = StringTable()
+        self.conversations: list[CompactConversation] = []
+        self._roles: dict[str, int] = {}
+        self._encoded: list[str] = []
+
+    @classmethod
+    def of(cls, failed_cases: Iterable[MultiTurnFailedTestResult]) -> ConversationTable:
+        if isinstance(failed_cases, ConversationTable):
+            return failed_cases
+        table = cls()
+        table.extend(failed_cases)
+        return table
+
+    def _role(self, role: str) -> int:
+        index = self._roles.get(role)
+        if index is None:
+            Role(role)
+            index = self._roles[role] = self.strings.intern(role)
+        return index
+
+    def append_dict(self, data: Mapping[str, Any]) -> None:
+        properties = dict(data)
+        min_safe_response_score = properties.pop("min_safe_response_score")
+        roles = array("I")
+        contents = array("I")
+        message_properties = []
+        for message in properties.pop("conversation"):
+            extra = dict(message)
+            roles.append(self._role(extra.pop("role")))
+            contents.append(self.strings.intern(extra.pop("content")))
+            message_properties.append(extra)
+        self.conversations.append(
+            CompactConversation(
+                min_safe_response_score=min_safe_response_score,
+                roles=roles,
+                contents=contents,
+                properties=properties or None,
+                message_properties=tuple(message_properties)
+                if any(message_properties)
+                else None,
+            ),
+        )
+
+    def extend(self, failed_cases: Iterable[MultiTurnFailedTestResult]) -> None:
+        if not isinstance(failed_cases, ConversationTable):
+            for case in failed_cases:
+                self.append_dict(case.to_dict())
+            return
+
+        # Re-interning the other table's strings once maps its indexes onto
+        # this table without touching each message's text.
+        indexes = array("I", map(self.strings.intern, failed_cases.strings.strings))
+        for role, index in failed_cases._roles.items():
+            self._roles.setdefault(role, indexes[index])
+        for conversation in failed_cases.conversations:
+            self.conversations.append(
+                CompactConversation(
+                    min_safe_response_score=conversation.min_safe_response_score,
+                    roles=array("I", (indexes[index] for index in conversation.roles)),
+                    contents=array(
+                        "I",
+                        (indexes[index] for index in conversation.contents),
+                    ),
+                    properties=conversation.properties,
+                    message_properties=conversation.message_properties,
+                ),
+            )
+
+    def messages(self, conversation: CompactConversation) -> Iterator[tuple[str, str]]:
+        strings = self.strings.strings
+        for role, content in zip(
+            conversation.roles, conversation.contents, strict=True
+        ):
+            yield strings[role], strings[content]
+
+    def first_user_index(self, conversation: CompactConversation) -> int | None:
+        # The string table index of the opening user message.
+        user = self._roles.get(Role.USER.value)
+        for role, content in zip(
+            conversation.roles, conversation.contents, strict=True
+        ):
+            if role == user:
+                return content
+        return None
+
+    def user_turns(self, conversation: CompactConversation) -> int:
+        return conversation.roles.count(self._roles.get(Role.USER.value, -1))
+
+    def case_dict(self, conversation: CompactConversation) -> dict[str, Any]:
+        # Matches MultiTurnFailedTestResult.to_dict, key order included.
+        message_properties = conversation.message_properties or ({},) * len(
+            conversation.roles,
+        )
+        return {
+            **(conversation.properties or {}),
+            "min_safe_response_score": conversation.min_safe_response_score,
+            "conversation": [
+                {**extra, "role": role, "content": content}
+                for (role, content), extra in zip(
+                    self.messages(conversation),
+                    message_properties,
+                    strict=True,
+                )
+            ],
+        }
+
+    def case_json(self, conversation: CompactConversation) -> str:
+        # The same text as json.dumps(case_dict(...), ensure_ascii=False),
+        # assembled from each string's encoding, which is computed once.
+        if conversation.properties or conversation.message_properties:
+            return json.dumps(self.case_dict(conversation), ensure_ascii=False)
+        encoded = self._encoded
+        strings = self.strings.strings
+        if len(encoded) < len(strings):
+            encoded.extend(
+                json.dumps(text, ensure_ascii=False) for text in strings[len(encoded) :]
+            )
+        messages = ", ".join(
+            f'{{"role": {encoded[role]}, "content": {encoded[content]}}}'
+            for role, content in zip(
+                conversation.roles, conversation.contents, strict=True
+            )
+        )
+        return (
+            f'{{"min_safe_response_score": '
+            f"{json.dumps(conversation.min_safe_response_score)}, "
+            f'"conversation": [{messages}]}}'
+        )
+
+    def __len__(self) -> int:
+        return len(self.conversations)
+
+    @overload
+    def __getitem__(self, index: int) -> MultiTurnFailedTestResult: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[MultiTurnFailedTestResult]: ...
+
+    def __getitem__(
+        self,
+        index: int | slice,
+    ) -> MultiTurnFailedTestResult | list[MultiTurnFailedTestResult]:
+        if isinstance(index, slice):
+            return [
+                MultiTurnFailedTestResult.from_dict(self.case_dict(conversation))
+                for conversation in self.conversations[index]
+            ]
+        return MultiTurnFailedTestResult.from_dict(
+            self.case_dict(self.conversations[index]),
+        )
+
+    def __iter__(self) -> Iterator[MultiTurnFailedTestResult]:
+        for conversation in self.conversations:
+            yield MultiTurnFailedTestResult.from_dict(self.case_dict(conversation))
+
+
+class CompactMultiTurnRunTestsResponse(MultiTurnRunTestsResponse):
+    # Serializes straight from the conversation table instead of building a
+    # model for every failed case and message first.
+    def to_dict(self) -> dict[str, Any]:
+        failed_results = cast(ConversationTable, self.failed_results)
+        return {
+            **self.additional_properties,
+            "total_passed": self.total_passed,
+            "total_failed": self.total_failed,
+            "failed_results": [
+                failed_results.case_dict(conversation)
+                for conversation in failed_results.conversations
+            ],
+        }
+
+
+def compact_multi_turn_response(
+    *,
+    total_passed: int,
+    total_failed: int,
+    failed_results: ConversationTable,
+    additional_properties: dict[str, Any] | None = None,
+) -> MultiTurnRunTestsResponse:
+    # The generated model annotates `failed_results` as a list but only ever
+    # iterates it, so the table stands in for the list of models.
+    run_tests_response = CompactMultiTurnRunTestsResponse(
+        total_passed=total_passed,
+        total_failed=total_failed,
+        failed_results=cast(list[MultiTurnFailedTestResult], failed_results),
+    )
+    run_tests_response.additional_properties = additional_properties or {}
+    return run_tests_response
+
+
+def multi_turn_response_from_dict(data: Mapping[str, Any]) -> MultiTurnRunTestsResponse:
+    fields = dict(data)
+    failed_results = ConversationTable()
+    for case in fields.pop("failed_results"):
+        failed_results.append_dict(case)
+    return compact_multi_turn_response(
+        total_passed=fields.pop("total_passed"),
+        total_failed=fields.pop("total_failed"),
+        failed_results=failed_results,
+        additional_properties=fields,
+    )
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+from .common import compute_failure_rate
+
+
+class FailureBudget:
+    # Tracks a running pass/fail tally across split requests and decides the
+    # verdict `failure_rate > fail_action_threshold` as soon as no combination
+    # of outcomes for the outstanding requests could change it. That needs an
+    # upper bound on the cases one request can return; the sizes of completed
+    # requests say nothing about the outstanding ones, so without a bound
+    # every request runs to completion.
+    def __init__(
+        self,
+        *,
+        fail_action_threshold: float,
+        total_requests: int,
+        max_cases_per_request: int | None = None,
+    ) -> None:
+        self.fail_action_threshold = fail_action_threshold
+        self.total_requests = total_requests
+        self.max_cases_per_request = max_cases_per_request
+        self.completed: set[int] = set()
+        self.total_passed = 0
+        self.total_failed = 0
+
+    def add(self, index: int, *, total_passed: int, total_failed: int) -> None:
+        # The tally is pooled, so a request reported twice must only count
+        # once.
+        if index in self.completed:
+            return
+        self.completed.add(index)
+        self.total_passed += total_passed
+        self.total_failed += total_failed
+
+    @property
+    def completed_requests(self) -> int:
+        return len(self.completed)
+
+    @property
+    def remaining_requests(self) -> int:
+        return self.total_requests - self.completed_requests
+
+    @property
+    def remaining_cases(self) -> int:
+        return self.remaining_requests * (self.max_cases_per_request or 0)
+
+    @property
+    def exceeded(self) -> bool:
+        # Fails even if every outstanding case passes.
+        return (
+            compute_failure_rate(
+                total_passed=self.total_passed + self.remaining_cases,
+                total_failed=self.total_failed,
+            )
+            > self.fail_action_threshold
+        )
+
+    @property
+    def unreachable(self) -> bool:
+        # Passes even if every outstanding case fails.
+        return (
+            compute_failure_rate(
+                total_passed=self.total_passed,
+                total_failed=self.total_failed + self.remaining_cases,
+            )
+            <= self.fail_action_threshold
+        )
+
+    @property
+    def decided(self) -> bool:
+        if self.remaining_requests == 0 or self.max_cases_per_request is None:
+            return False
+        return self.exceeded or self.unreachable
+
+    def describe(self) -> str:
+        outcome = (
+            "the failure threshold is already exceeded"
+            if self.exceeded
+            else "the failure threshold can no longer be exceeded"
+        )
+        return (
+            f"Stopped after {self.completed_requests} of {self.total_requests} "
+            f"requests: {outcome} ({self.total_failed} failed of "
+            f"{self.total_passed + self.total_failed} cases, at most "
+            f"{self.remaining_cases} cases outstanding)."
+        )
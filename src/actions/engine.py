@@ -0,0 +1,297 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+from collections.abc import Awaitable, Callable, Coroutine, Iterable, Sequence
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+import httpx
+from circuit_breaker_labs.client import Client
+from circuit_breaker_labs.models.multi_turn_run_tests_response import (
+    MultiTurnRunTestsResponse,
+)
+from circuit_breaker_labs.models.multi_turn_test_type import MultiTurnTestType
+from circuit_breaker_labs.models.single_turn_failed_test_result import (
+    SingleTurnFailedTestResult,
+)
+from circuit_breaker_labs.models.single_turn_run_tests_response import (
+    SingleTurnRunTestsResponse,
+)
+from circuit_breaker_labs.models.test_case_pack import TestCasePack
+from circuit_breaker_labs.types import Response
+
+from .cache import MemoryCache, ResultCache, SupportsToDict
+from .common import build_client
+from .conversations import (
+    ConversationTable,
+    compact_multi_turn_response,
+    multi_turn_response_from_dict,
+)
+from .transport import AttemptLog, RetryOptions
+
+if TYPE_CHECKING:
+    from .early_exit import FailureBudget
+    from .metrics import Metrics
+    from .recording import RecordingOptions
+    from .scheduler import SchedulerOptions
+    from .sweep import SweepBudget
+
+
+@dataclass
+class Session:
+    # State that `cbl-evaluate serve` keeps warm across the evaluations it
+    # runs: its event loop, an open connection pool and an in-memory cache.
+    loop: asyncio.AbstractEventLoop
+    connections: httpx.AsyncBaseTransport
+    cache: MemoryCache
+
+
+# Set by the serve process for the evaluation it is running. Outside of it,
+# each evaluation opens its own event loop and connections.
+SESSION: ContextVar[Session | None] = ContextVar("session", default=None)
+
+
+def _response_from_dict[
+    RunTestsResponseT: (SingleTurnRunTestsResponse, MultiTurnRunTestsResponse)
+](
+    response_type: type[RunTestsResponseT],
+    data: dict[str, Any],
+) -> RunTestsResponseT:
+    if issubclass(response_type, MultiTurnRunTestsResponse):
+        return multi_turn_response_from_dict(data)
+    return response_type.from_dict(data)
+
+
+def bounded[ItemT, ResultT](
+    run: Callable[[ItemT], Awaitable[ResultT]],
+    *,
+    concurrency: int,
+) -> Callable[[ItemT], Coroutine[Any, Any, ResultT]]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_bounded(item: ItemT) -> ResultT:
+        async with semaphore:
+            return await run(item)
+
+    return run_bounded
+
+
+async def gather_bounded[ItemT, ResultT](
+    items: Iterable[ItemT],
+    run: Callable[[ItemT], Awaitable[ResultT]],
+    *,
+    concurrency: int,
+) -> list[ResultT]:
+    run_bounded = bounded(run, concurrency=concurrency)
+    return await asyncio.gather(*(run_bounded(item) for item in items))
+
+
+def evaluate_concurrently[
+    RequestT: SupportsToDict,
+    RunTestsResponseT: (SingleTurnRunTestsResponse, MultiTurnRunTestsResponse),
+](
+    requests: Sequence[RequestT],
+    evaluate: Callable[[Client, RequestT], Awaitable[Response[Any]]],
+    response_type: type[RunTestsResponseT],
+    *,
+    concurrency: int,
+    cache: ResultCache | MemoryCache | None = None,
+    budget: FailureBudget | SweepBudget | None = None,
+    retry: RetryOptions | None = None,
+    log: AttemptLog | None = None,
+    on_result: Callable[[RequestT, RunTestsResponseT], None] | None = None,
+    recording: RecordingOptions | None = None,
+    scheduler: SchedulerOptions | None = None,
+    metrics: Metrics | None = None,
+    compress_requests: bool = False,
+) -> list[RunTestsResponseT]:
+    session = SESSION.get()
+    if cache is None and session is not None:
+        cache = session.cache
+    results: list[RunTestsResponseT | None] = [None] * len(requests)
+    if cache is not None:
+        for index, request in enumerate(requests):
+            if (cached := cache.get(request)) is not None:
+                results[index] = _response_from_dict(response_type, cached)
+
+        if hits := sum(result is not None for result in results):
+            print(f"Using cached results for {hits} of {len(requests)} requests.")
+
+    if budget is not None:
+        for index, result in enumerate(results):
+            if result is not None:
+                budget.add(
+                    index,
+                    total_passed=result.total_passed,
+                    total_failed=result.total_failed,
+                )
+
+    pending = [index for index, result in enumerate(results) if result is None]
+    if log is None:
+        log = AttemptLog()
+
+    async def run_pending() -> list[tuple[int, Response[Any]]]:
+        completed: list[tuple[int, Response[Any]]] = []
+        if budget is not None and budget.decided:
+            return completed
+
+        async with build_client(
+            concurrency=concurrency,
+            retry=retry,
+            log=log,
+            recording=recording,
+            connections=session.connections if session is not None else None,
+            scheduler=scheduler,
+            compress_requests=compress_requests,
+        ) as client:
+
+            async def evaluate_index(index: int) -> tuple[int, Response[Any]]:
+                return index, await evaluate(client, requests[index])
+
+            run_bounded = bounded(evaluate_index, concurrency=concurrency)
+            tasks = [asyncio.create_task(run_bounded(index)) for index in pending]
+            try:
+                for next_completed in asyncio.as_completed(tasks):
+                    index, response = await next_completed
+                    completed.append((index, response))
+
+                    parsed = response.parsed
+                    if not isinstance(parsed, response_type):
+                        # The run fails regardless of the outstanding requests.
+                        break
+                    if cache is not None:
+                        # Stored as each request completes so a rerun after a
+                        # failure only repeats the requests that did not finish.
+                        cache.put(requests[index], parsed)
+                    if budget is not None:
+                        budget.add(
+                            index,
+                            total_passed=parsed.total_passed,
+                            total_failed=parsed.total_failed,
+                        )
+                        if budget.decided:
+                            break
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        return completed
+
+    if pending:
+        try:
+            completed = (
+                asyncio.run_coroutine_threadsafe(run_pending(), session.loop).result()
+                if session is not None
+                else asyncio.run(run_pending())
+            )
+        except httpx.HTTPError as exc:
+            print(f"Error: {type(exc).__name__} {exc}".rstrip())
+            sys.exit(1)
+        finally:
+            if log.retries:
+                print(log.describe())
+            if log.queued:
+                print(log.describe_queue())
+            if log.compressed_bytes:
+                print(log.describe_compression())
+        parsed_responses = expect_parsed(
+            (response for _, response in completed),
+            response_type,
+        )
+        for (index, _), parsed in zip(completed, parsed_responses, strict=True):
+            results[index] = parsed
+
+    if budget is not None and budget.decided:
+        print(budget.describe())
+
+    if metrics is not None:
+        for request, result in zip(requests, results, strict=True):
+            if result is not None:
+                metrics.add_result(
+                    request,
+                    total_passed=result.total_passed,
+                    total_failed=result.total_failed,
+                )
+
+    if on_result is not None:
+        for request, result in zip(requests, results, strict=True):
+            if result is not None:
+                on_result(request, result)
+
+    return [result for result in results if result is not None]
+
+
+def expect_parsed[ParsedT](
+    responses: Iterable[Response[Any]],
+    response_type: type[ParsedT],
+) -> list[ParsedT]:
+    parsed_responses = []
+    for response in responses:
+        if not isinstance((parsed := response.parsed), response_type):
+            print(f"Error: {response.status_code}")
+            print(response.content.decode(errors="replace"))
+            sys.exit(1)
+        parsed_responses.append(parsed)
+    return parsed_responses
+
+
+def split_test_case_packs(
+    test_case_packs: list[TestCasePack] | None,
+    *,
+    split: bool,
+) -> list[list[TestCasePack] | None]:
+    if not split or not test_case_packs:
+        return [test_case_packs]
+    return [[pack] for pack in test_case_packs]
+
+
+def split_test_types(
+    test_types: list[MultiTurnTestType],
+    *,
+    split: bool,
+) -> list[list[MultiTurnTestType]]:
+    if not split:
+        return [test_types]
+    return [[test_type] for test_type in test_types]
+
+
+def merge_single_turn_responses(
+    responses: Iterable[SingleTurnRunTestsResponse],
+) -> SingleTurnRunTestsResponse:
+    total_passed = 0
+    total_failed = 0
+    failed_results: list[list[SingleTurnFailedTestResult]] = []
+    for response in responses:
+        total_passed += response.total_passed
+        total_failed += response.total_failed
+        for layer_index, cases in enumerate(response.failed_results):
+            if layer_index == len(failed_results):
+                failed_results.append([])
+            failed_results[layer_index].extend(cases)
+
+    return SingleTurnRunTestsResponse(
+        total_passed=total_passed,
+        total_failed=total_failed,
+        failed_results=failed_results,
+    )
+
+
+def merge_multi_turn_responses(
+    responses: Iterable[MultiTurnRunTestsResponse],
+) -> MultiTurnRunTestsResponse:
+    total_passed = 0
+    total_failed = 0
+    failed_results = ConversationTable()
+    for response in responses:
+        total_passed += response.total_passed
+        total_failed += response.total_failed
+        failed_results.extend(response.failed_results)
+
+    return compact_multi_turn_response(
+        total_passed=total_passed,
+        total_failed=total_failed,
+        failed_results=failed_results,
+    )
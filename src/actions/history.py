@@ -0,0 +1,329 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import time
+from collections.abc import Iterator
+from contextlib import closing
+from dataclasses import dataclass
+from pathlib import Path
+
+from circuit_breaker_labs.models.multi_turn_run_tests_response import (
+    MultiTurnRunTestsResponse,
+)
+from circuit_breaker_labs.models.multi_turn_test_type import MultiTurnTestType
+from circuit_breaker_labs.models.single_turn_run_tests_response import (
+    SingleTurnRunTestsResponse,
+)
+from circuit_breaker_labs.models.test_case_pack import TestCasePack
+
+from .common import compute_failure_rate
+from .conversations import ConversationTable
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    endpoint TEXT NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    model TEXT NOT NULL,
+    test_case_packs TEXT NOT NULL,
+    test_types TEXT NOT NULL,
+    total_passed INTEGER NOT NULL,
+    total_failed INTEGER NOT NULL,
+    failure_rate REAL NOT NULL,
+    fail_action_threshold REAL NOT NULL,
+    passed INTEGER NOT NULL,
+    duration REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_by_subject
+    ON runs (prompt_hash, model, endpoint, id);
+CREATE INDEX IF NOT EXISTS passed_runs_by_subject
+    ON runs (prompt_hash, model, endpoint, id) WHERE passed = 1;
+CREATE TABLE IF NOT EXISTS failures (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    case_hash TEXT NOT NULL,
+    layer INTEGER,
+    score REAL NOT NULL,
+    summary TEXT NOT NULL,
+    PRIMARY KEY (run_id, case_hash)
+) WITHOUT ROWID;
+"""
+
+# Applied in order to databases whose user_version is below their position,
+# so databases written by earlier versions gain the new columns.
+MIGRATIONS = (
+    # Runs settled by a --probe evaluation, whose failures come from the probe
+    # configuration and are not comparable with full runs.
+    "ALTER TABLE runs ADD COLUMN probe INTEGER NOT NULL DEFAULT 0",
+    # The requests_key of every request in the run: prompt, model, case
+    # threshold and every other setting sent to the API. Earlier runs have
+    # none and are never reused.
+    "ALTER TABLE runs ADD COLUMN request_key TEXT NOT NULL DEFAULT ''",
+    "ALTER TABLE runs ADD COLUMN fail_case_threshold REAL",
+    # Runs stopped by --early-exit, which have results for only some requests.
+    "ALTER TABLE runs ADD COLUMN partial INTEGER NOT NULL DEFAULT 0",
+    "CREATE INDEX runs_by_request_key ON runs (endpoint, request_key, id) "
+    "WHERE probe = 0 AND partial = 0",
+)
+
+NEW_FAILURES_QUERY = """
+SELECT current.case_hash, current.layer, current.score, current.summary
+FROM failures AS current
+WHERE current.run_id = :current_id
+    AND NOT EXISTS (
+        SELECT 1 FROM failures AS baseline
+        WHERE baseline.run_id = :baseline_id
+            AND baseline.case_hash = current.case_hash
+    )
+ORDER BY current.score
+"""
+
+LATEST_RUN_QUERY = """
+SELECT id, created_at, total_passed, total_failed, failure_rate, passed
+FROM runs
+WHERE prompt_hash = :prompt_hash AND model = :model AND endpoint = :endpoint
+    AND probe = 0 AND partial = 0
+ORDER BY id DESC LIMIT 1
+"""
+
+LATEST_MATCHING_RUN_QUERY = """
+SELECT id, created_at, total_passed, total_failed, failure_rate, passed
+FROM runs
+WHERE endpoint = :endpoint AND request_key = :request_key
+    AND probe = 0 AND partial = 0
+ORDER BY id DESC LIMIT 1
+"""
+
+BASELINE_RUN_QUERY = """
+SELECT id, created_at, total_passed, total_failed, failure_rate, passed
+FROM runs
+WHERE prompt_hash = :prompt_hash AND model = :model AND endpoint = :endpoint
+    AND request_key = (SELECT request_key FROM runs WHERE id = :before)
+    AND request_key != ''
+    AND probe = 0 AND partial = 0 AND passed = 1 AND id < :before
+ORDER BY id DESC LIMIT 1
+"""
+
+
+@dataclass
+class RunSummary:
+    id: int
+    created_at: float
+    total_passed: int
+    total_failed: int
+    failure_rate: float
+    passed: bool
+
+
+@dataclass
+class NewFailure:
+    case_hash: str
+    layer: int | None
+    score: float
+    summary: str
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def hash_prompt(system_prompt: str | None) -> str:
+    # Fine-tune evaluations have no system prompt and are identified by their
+    # model name alone.
+    return "" if system_prompt is None else hash_text(system_prompt)
+
+
+def _format_test_case_packs(test_case_packs: list[TestCasePack] | None) -> str:
+    return " ".join(sorted(pack.value for pack in test_case_packs or []))
+
+
+def _format_test_types(test_types: list[MultiTurnTestType] | None) -> str:
+    return " ".join(sorted(test_type.value for test_type in test_types or []))
+
+
+def connect(path: Path) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.executescript(SCHEMA)
+    _migrate(connection)
+    return connection
+
+
+def _migrate(connection: sqlite3.Connection) -> None:
+    (version,) = connection.execute("PRAGMA user_version").fetchone()
+    if version >= len(MIGRATIONS):
+        return
+    with connection:
+        # Another process may be migrating the same file; re-read the version
+        # once holding the write lock.
+        connection.execute("BEGIN IMMEDIATE")
+        (version,) = connection.execute("PRAGMA user_version").fetchone()
+        for statement in MIGRATIONS[version:]:
+            connection.execute(statement)
+        connection.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+
+
+def _failure_rows(
+    run_id: int,
+    run_tests_response: SingleTurnRunTestsResponse | MultiTurnRunTestsResponse,
+) -> Iterator[tuple[int, str, int | None, float, str]]:
+    if isinstance(run_tests_response, SingleTurnRunTestsResponse):
+        # The same input can fail at several layers, with a different
+        # response at each, so a case is identified by all three.
+        for layer_index, cases in enumerate(run_tests_response.failed_results):
+            for case in cases:
+                yield (
+                    run_id,
+                    hash_text(
+                        json.dumps(
+                            [layer_index, case.user_input, case.model_response],
+                            ensure_ascii=False,
+                        )
+                    ),
+                    layer_index,
+                    case.safe_response_score,
+                    case.user_input,
+                )
+        return
+
+    # A case is identified by its whole conversation, so conversations that
+    # share an opening attack but diverge later are kept apart. The opening
+    # user message is stored as the summary.
+    table = ConversationTable.of(run_tests_response.failed_results)
+    for conversation in table.conversations:
+        index = table.first_user_index(conversation)
+        yield (
+            run_id,
+            hash_text(
+                json.dumps(list(table.messages(conversation)), ensure_ascii=False)
+            ),
+            None,
+            conversation.min_safe_response_score,
+            "" if index is None else table.strings.strings[index],
+        )
+
+
+def record_run(
+    path: Path,
+    *,
+    endpoint: str,
+    system_prompt: str | None,
+    model: str,
+    test_case_packs: list[TestCasePack] | None,
+    test_types: list[MultiTurnTestType] | None,
+    run_tests_response: SingleTurnRunTestsResponse | MultiTurnRunTestsResponse,
+    fail_action_threshold: float,
+    duration: float,
+    request_key: str,
+    fail_case_threshold: float,
+    probe: bool = False,
+    partial: bool = False,
+) -> int:
+    failure_rate = compute_failure_rate(
+        total_passed=run_tests_response.total_passed,
+        total_failed=run_tests_response.total_failed,
+    )
+    with closing(connect(path)) as connection, connection:
+        cursor = connection.execute(
+            "INSERT INTO runs (created_at, endpoint, prompt_hash, model, "
+            "test_case_packs, test_types, total_passed, total_failed, "
+            "failure_rate, fail_action_threshold, passed, duration, probe, "
+            "request_key, fail_case_threshold, partial) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                time.time(),
+                endpoint,
+                hash_prompt(system_prompt),
+                model,
+                _format_test_case_packs(test_case_packs),
+                _format_test_types(test_types),
+                run_tests_response.total_passed,
+                run_tests_response.total_failed,
+                failure_rate,
+                fail_action_threshold,
+                failure_rate <= fail_action_threshold,
+                duration,
+                probe,
+                request_key,
+                fail_case_threshold,
+                partial,
+            ),
+        )
+        run_id = cursor.lastrowid
+        assert run_id is not None
+        connection.executemany(
+            "INSERT OR IGNORE INTO failures (run_id, case_hash, layer, score, summary) "
+            "VALUES (?, ?, ?, ?, ?)",
+            _failure_rows(run_id, run_tests_response),
+        )
+    return run_id
+
+
+def _run_summary(
+    row: tuple[int, float, int, int, float, int] | None,
+) -> RunSummary | None:
+    if row is None:
+        return None
+    return RunSummary(
+        id=row[0],
+        created_at=row[1],
+        total_passed=row[2],
+        total_failed=row[3],
+        failure_rate=row[4],
+        passed=bool(row[5]),
+    )
+
+
+def compare_to_baseline(
+    path: Path,
+    *,
+    endpoint: str,
+    prompt_hash: str,
+    model: str,
+) -> tuple[RunSummary | None, RunSummary | None, list[NewFailure]]:
+    subject = {"endpoint": endpoint, "prompt_hash": prompt_hash, "model": model}
+    with closing(connect(path)) as connection:
+        current = _run_summary(
+            connection.execute(LATEST_RUN_QUERY, subject).fetchone(),
+        )
+        if current is None:
+            return None, None, []
+
+        baseline = _run_summary(
+            connection.execute(
+                BASELINE_RUN_QUERY,
+                {**subject, "before": current.id},
+            ).fetchone(),
+        )
+        new_failures = [
+            NewFailure(case_hash=row[0], layer=row[1], score=row[2], summary=row[3])
+            for row in connection.execute(
+                NEW_FAILURES_QUERY,
+                {
+                    "current_id": current.id,
+                    "baseline_id": baseline.id if baseline is not None else None,
+                },
+            )
+        ]
+    return current, baseline, new_failures
+
+
+def find_latest_run(
+    path: Path,
+    *,
+    endpoint: str,
+    request_key: str,
+) -> RunSummary | None:
+    # Only complete runs of exactly the same requests are reused.
+    if not path.exists():
+        return None
+    with closing(connect(path)) as connection:
+        return _run_summary(
+            connection.execute(
+                LATEST_MATCHING_RUN_QUERY,
+                {"endpoint": endpoint, "request_key": request_key},
+            ).fetchone(),
+        )
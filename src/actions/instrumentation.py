@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from argparse import Namespace
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from . import IMPORT_STARTED
+from .engine import SESSION
+from .transport import AttemptLog
+
+# Profiling, memory tracing and metrics are imported only when enabled.
+if TYPE_CHECKING:
+    from cProfile import Profile
+
+    from .metrics import Metrics, MetricsOptions
+
+TIMINGS_FORMAT_VERSION = 1
+TOP_ALLOCATIONS = 10
+
+
+@dataclass
+class InstrumentationOptions:
+    timings: Path | None
+    profile: Path | None
+    trace_memory: bool
+    step_summary: bool
+    metrics: MetricsOptions | None
+
+    @property
+    def enabled(self) -> bool:
+        return (
+            self.timings is not None
+            or self.profile is not None
+            or self.trace_memory
+            or self.metrics is not None
+        )
+
+
+def get_instrumentation_options(args: Namespace) -> InstrumentationOptions:
+    metrics = None
+    if args.metrics_textfile is not None or args.metrics_otlp_endpoint is not None:
+        from .metrics import get_metrics_options
+
+        metrics = get_metrics_options(args)
+    return InstrumentationOptions(
+        timings=args.timings,
+        profile=args.profile,
+        trace_memory=args.trace_memory,
+        step_summary=args.step_summary,
+        metrics=metrics,
+    )
+
+
+class Instrumentation:
+    def __init__(self, endpoint: str) -> None:
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.phases: dict[str, float] = {}
+        self._phase: tuple[str, float] | None = None
+        self.attempts = AttemptLog()
+        self.memory: dict[str, Any] | None = None
+        self.metrics: Metrics | None = None
+
+        # A serve process imported everything before the evaluation arrived.
+        if SESSION.get() is not None:
+            return
+        # The composite actions export the wall clock time before `uv run`,
+        # which covers environment setup and interpreter startup.
+        action_started = os.environ.get("CBL_ACTION_STARTED")
+        if action_started:
+            imported_at = time.time() - (self.started - IMPORT_STARTED)
+            self.phases["setup"] = max(imported_at - float(action_started), 0.0)
+        self.phases["import"] = self.started - IMPORT_STARTED
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def begin(self, name: str) -> None:
+        # Phases run back to back, so starting one ends the previous one.
+        self.end()
+        self._phase = (name, time.perf_counter())
+
+    def end(self) -> None:
+        if self._phase is not None:
+            name, started = self._phase
+            self.phases[name] = self.phases.get(name, 0.0) + (
+                time.perf_counter() - started
+            )
+            self._phase = None
+
+    @contextmanager
+    def capture(self, options: InstrumentationOptions) -> Iterator[None]:
+        if not options.enabled:
+            try:
+                yield
+            finally:
+                self.end()
+            return
+
+        if options.metrics is not None:
+            from .metrics import Metrics
+
+            self.metrics = Metrics(options.metrics, endpoint=self.endpoint)
+        profiler: Profile | None = None
+        if options.profile is not None:
+            import cProfile
+
+            profiler = cProfile.Profile()
+        if options.trace_memory:
+            import tracemalloc
+
+            tracemalloc.start()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            self.end()
+            if profiler is not None:
+                profiler.disable()
+            if options.trace_memory:
+                self.memory = _memory_usage()
+                tracemalloc.stop()
+            if profiler is not None:
+                assert options.profile is not None
+                options.profile.parent.mkdir(parents=True, exist_ok=True)
+                profiler.dump_stats(options.profile)
+            if self.metrics is not None:
+                self.metrics.export(self.attempts, duration=self.elapsed)
+            self.write(options)
+
+    def to_dict(self) -> dict[str, Any]:
+        latencies = [attempt.latency for attempt in self.attempts.attempts]
+        result: dict[str, Any] = {
+            "version": TIMINGS_FORMAT_VERSION,
+            "endpoint": self.endpoint,
+            "phases": self.phases,
+            "total_seconds": sum(self.phases.values()),
+            "http": {
+                "attempts": len(latencies),
+                "retries": self.attempts.retries,
+                "total_seconds": sum(latencies),
+                "max_seconds": max(latencies, default=0.0),
+                "queued_attempts": len(self.attempts.queued),
+                "queued_seconds": sum(self.attempts.queued),
+                "max_queued_seconds": max(self.attempts.queued, default=0.0),
+            },
+        }
+        if self.memory is not None:
+            result["memory"] = self.memory
+        return result
+
+    def write(self, options: InstrumentationOptions) -> None:
+        timings = self.to_dict()
+        if options.timings is not None:
+            options.timings.parent.mkdir(parents=True, exist_ok=True)
+            with options.timings.open("w", encoding="utf-8") as file:
+                json.dump(timings, file, indent=2)
+            print(f"Timings written to {options.timings}.")
+
+        summary_path = os.environ.get("GITHUB_STEP_SUMMARY")
+        if options.step_summary and summary_path:
+            with open(summary_path, "a", encoding="utf-8") as file:
+                file.write("\n".join(_summary_lines(timings)))
+                file.write("\n")
+
+
+def _memory_usage() -> dict[str, Any]:
+    import tracemalloc
+
+    _, peak = tracemalloc.get_traced_memory()
+    statistics = tracemalloc.take_snapshot().statistics("lineno")
+    return {
+        "peak_bytes": peak,
+        "top_allocations": [
+            {
+                "location": str(statistic.traceback),
+                "size_bytes": statistic.size,
+                "count": statistic.count,
+            }
+            for statistic in statistics[:TOP_ALLOCATIONS]
+        ],
+    }
+
+
+def _summary_lines(timings: dict[str, Any]) -> Iterator[str]:
+    yield "### Circuit Breaker Labs Timings"
+    yield ""
+    yield "| Phase | Seconds |"
+    yield "| --- | --- |"
+    for name, seconds in timings["phases"].items():
+        yield f"| {name} | {seconds:.3f} |"
+    yield f"| **total** | **{timings['total_seconds']:.3f}** |"
+    yield ""
+
+    http = timings["http"]
+    yield (
+        f"{http['attempts']} HTTP attempts ({http['retries']} retries), "
+        f"slowest {http['max_seconds']:.3f}s."
+    )
+    if http["queued_attempts"]:
+        yield (
+            f"{http['queued_attempts']} attempts queued by the shared scheduler "
+            f"for {http['queued_seconds']:.3f}s, longest "
+            f"{http['max_queued_seconds']:.3f}s."
+        )
+    if (memory := timings.get("memory")) is not None:
+        yield f"Peak traced memory: {memory['peak_bytes'] / 1024 / 1024:.1f} MiB."
+    yield ""
@@ -0,0 +1,454 @@
+import asyncio
+import json
+import sys
+import time
+from argparse import ArgumentParser
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Any
+
+import httpx
+from circuit_breaker_labs.api.evaluations import (
+    multi_turn_evaluate_system_prompt_post,
+    singleturn_evaluate_system_prompt_post,
+)
+from circuit_breaker_labs.client import Client
+from circuit_breaker_labs.models.multi_turn_evaluate_system_prompt_request import (
+    MultiTurnEvaluateSystemPromptRequest,
+)
+from circuit_breaker_labs.models.multi_turn_run_tests_response import (
+    MultiTurnRunTestsResponse,
+)
+from circuit_breaker_labs.models.multi_turn_test_type import MultiTurnTestType
+from circuit_breaker_labs.models.single_turn_evaluate_system_prompt_request import (
+    SingleTurnEvaluateSystemPromptRequest,
+)
+from circuit_breaker_labs.models.single_turn_run_tests_response import (
+    SingleTurnRunTestsResponse,
+)
+from circuit_breaker_labs.models.test_case_pack import TestCasePack
+from circuit_breaker_labs.types import UNSET, Response
+
+from .arguments import (
+    DEFAULT_CONCURRENCY,
+    add_report_arguments,
+    add_retry_arguments,
+    parse_positive_int,
+)
+from .common import (
+    MULTI_TURN,
+    SINGLE_TURN,
+    build_client,
+    compute_failure_rate,
+    get_retry_options,
+)
+from .engine import gather_bounded
+from .report import (
+    ReportOptions,
+    format_table,
+    get_report_options,
+    report_failed_cases,
+)
+from .streaming import stream_evaluation
+from .transport import AttemptLog, RetryOptions
+
+
+@dataclass
+class Manifest:
+    mode: str
+    fail_action_threshold: float
+    fail_case_threshold: float
+    system_prompts: dict[str, str]
+    openrouter_model_names: list[str]
+    test_case_packs: list[list[TestCasePack] | None]
+    variations: int = 0
+    maximum_iteration_layers: int = 0
+    max_turns: int = 0
+    test_types: list[MultiTurnTestType] | None = None
+
+
+@dataclass
+class CommandLineArguments:
+    manifest: Manifest
+    circuit_breaker_labs_api_key: str
+    concurrency: int
+    retry: RetryOptions
+    report: ReportOptions
+
+
+@dataclass
+class MatrixCell:
+    prompt_name: str
+    openrouter_model_name: str
+    test_case_packs: list[TestCasePack] | None
+    request: (
+        SingleTurnEvaluateSystemPromptRequest | MultiTurnEvaluateSystemPromptRequest
+    )
+
+
+@dataclass
+class MatrixResult:
+    cell: MatrixCell
+    run_tests_response: SingleTurnRunTestsResponse | MultiTurnRunTestsResponse | None
+    failure_rate: float
+    error: str | None = None
+    # Seconds this cell's request took, not counting its wait for a
+    # concurrency slot.
+    duration: float = 0.0
+
+
+def _require(data: dict[str, Any], key: str, kind: type) -> Any:
+    if key not in data:
+        raise ValueError(f"missing required key '{key}'")
+    value = data[key]
+    if kind is float and isinstance(value, int) and not isinstance(value, bool):
+        value = float(value)
+    if not isinstance(value, kind) or isinstance(value, bool):
+        raise TypeError(f"'{key}' must be of type {kind.__name__}")
+    return value
+
+
+def _parse_system_prompts(value: Any) -> dict[str, str]:
+    if isinstance(value, dict):
+        prompts = value
+    elif isinstance(value, list):
+        prompts = {f"prompt-{index}": prompt for index, prompt in enumerate(value)}
+    else:
+        raise TypeError("'system_prompts' must be a mapping or a list of strings")
+
+    if not prompts:
+        raise ValueError("'system_prompts' must not be empty")
+    if not all(isinstance(prompt, str) for prompt in prompts.values()):
+        raise ValueError("every system prompt must be a string")
+    return {str(name): prompt for name, prompt in prompts.items()}
+
+
+def _parse_test_case_pack_selections(
+    value: Any,
+) -> list[list[TestCasePack] | None]:
+    if value is None:
+        return [None]
+    if not isinstance(value, list) or not value:
+        raise ValueError("'test_case_packs' must be a non-empty list of pack lists")
+
+    selections: list[list[TestCasePack] | None] = []
+    for selection in value:
+        if selection is None:
+            selections.append(None)
+            continue
+        if not isinstance(selection, list):
+            raise TypeError("each 'test_case_packs' entry must be a list or null")
+        selections.append([TestCasePack(pack) for pack in selection])
+    return selections
+
+
+def load_manifest(path: Path) -> Manifest:
+    with path.open(encoding="utf-8") as file:
+        data = json.load(file)
+    if not isinstance(data, dict):
+        raise TypeError("manifest must be a JSON object")
+
+    mode = _require(data, "mode", str)
+    models = _require(data, "openrouter_model_names", list)
+    if not models or not all(isinstance(model, str) for model in models):
+        raise ValueError("'openrouter_model_names' must be a non-empty list of strings")
+
+    manifest = Manifest(
+        mode=mode,
+        fail_action_threshold=_require(data, "fail_action_threshold", float),
+        fail_case_threshold=_require(data, "fail_case_threshold", float),
+        system_prompts=_parse_system_prompts(data.get("system_prompts")),
+        openrouter_model_names=models,
+        test_case_packs=_parse_test_case_pack_selections(data.get("test_case_packs")),
+    )
+
+    if mode == SINGLE_TURN:
+        manifest.variations = _require(data, "variations", int)
+        manifest.maximum_iteration_layers = _require(
+            data,
+            "maximum_iteration_layers",
+            int,
+        )
+    elif mode == MULTI_TURN:
+        manifest.max_turns = _require(data, "max_turns", int)
+        if manifest.max_turns % 2 != 0:
+            raise ValueError("'max_turns' must be an even integer")
+        test_types = _require(data, "test_types", list)
+        manifest.test_types = [MultiTurnTestType(value) for value in test_types]
+    else:
+        raise ValueError(f"'mode' must be '{SINGLE_TURN}' or '{MULTI_TURN}'")
+
+    return manifest
+
+
+def get_cli_args() -> CommandLineArguments:
+    parser = ArgumentParser(
+        description=(
+            "Evaluate a matrix of system prompts and models using the "
+            "Circuit Breaker Labs API"
+        ),
+    )
+
+    parser.add_argument(
+        "--manifest",
+        type=Path,
+        required=True,
+        help="JSON manifest describing the prompts, models and test case packs",
+    )
+    parser.add_argument(
+        "--circuit-breaker-labs-api-key",
+        type=str,
+        required=True,
+        help="Circuit Breaker Labs API key",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=parse_positive_int,
+        default=DEFAULT_CONCURRENCY,
+        help="Maximum number of evaluations in flight at once",
+    )
+    add_retry_arguments(parser)
+    add_report_arguments(parser)
+
+    args = parser.parse_args()
+    try:
+        manifest = load_manifest(args.manifest)
+    except (OSError, TypeError, ValueError) as exc:
+        parser.error(f"Invalid manifest '{args.manifest}': {exc}")
+
+    return CommandLineArguments(
+        manifest=manifest,
+        circuit_breaker_labs_api_key=args.circuit_breaker_labs_api_key,
+        concurrency=args.concurrency,
+        retry=get_retry_options(args),
+        report=get_report_options(args),
+    )
+
+
+def build_cells(manifest: Manifest) -> list[MatrixCell]:
+    cells = []
+    for prompt_name, system_prompt in manifest.system_prompts.items():
+        for model_name in manifest.openrouter_model_names:
+            for test_case_packs in manifest.test_case_packs:
+                request: (
+                    SingleTurnEvaluateSystemPromptRequest
+                    | MultiTurnEvaluateSystemPromptRequest
+                )
+                if manifest.mode == SINGLE_TURN:
+                    request = SingleTurnEvaluateSystemPromptRequest(
+                        threshold=manifest.fail_case_threshold,
+                        variations=manifest.variations,
+                        maximum_iteration_layers=manifest.maximum_iteration_layers,
+                        system_prompt=system_prompt,
+                        openrouter_model_name=model_name,
+                        test_case_packs=test_case_packs
+                        if test_case_packs is not None
+                        else UNSET,
+                    )
+                else:
+                    request = MultiTurnEvaluateSystemPromptRequest(
+                        threshold=manifest.fail_case_threshold,
+                        max_turns=manifest.max_turns,
+                        test_types=manifest.test_types or [],
+                        system_prompt=system_prompt,
+                        openrouter_model_name=model_name,
+                        test_case_packs=test_case_packs
+                        if test_case_packs is not None
+                        else UNSET,
+                    )
+                cells.append(
+                    MatrixCell(
+                        prompt_name=prompt_name,
+                        openrouter_model_name=model_name,
+                        test_case_packs=test_case_packs,
+                        request=request,
+                    ),
+                )
+    return cells
+
+
+async def _evaluate_cell(
+    client: Client,
+    cell: MatrixCell,
+    *,
+    cbl_api_key: str,
+) -> MatrixResult:
+    started = time.perf_counter()
+    response: Response[Any]
+    try:
+        if isinstance(cell.request, SingleTurnEvaluateSystemPromptRequest):
+            response = await stream_evaluation(
+                client,
+                singleturn_evaluate_system_prompt_post._get_kwargs(
+                    body=cell.request,
+                    cbl_api_key=cbl_api_key,
+                ),
+                SingleTurnRunTestsResponse,
+            )
+        else:
+            response = await stream_evaluation(
+                client,
+                multi_turn_evaluate_system_prompt_post._get_kwargs(
+                    body=cell.request,
+                    cbl_api_key=cbl_api_key,
+                ),
+                MultiTurnRunTestsResponse,
+            )
+    except httpx.HTTPError as exc:
+        return MatrixResult(
+            cell=cell,
+            run_tests_response=None,
+            failure_rate=0.0,
+            error=f"{type(exc).__name__}: {exc}",
+        )
+
+    run_tests_response = response.parsed
+    if not isinstance(
+        run_tests_response,
+        SingleTurnRunTestsResponse | MultiTurnRunTestsResponse,
+    ):
+        return MatrixResult(
+            cell=cell,
+            run_tests_response=None,
+            failure_rate=0.0,
+            error=(
+                f"{response.status_code}: {response.content.decode(errors='replace')}"
+            ),
+        )
+
+    return MatrixResult(
+        cell=cell,
+        run_tests_response=run_tests_response,
+        failure_rate=compute_failure_rate(
+            total_passed=run_tests_response.total_passed,
+            total_failed=run_tests_response.total_failed,
+        ),
+        duration=time.perf_counter() - started,
+    )
+
+
+async def evaluate_cells(
+    *,
+    cells: list[MatrixCell],
+    cbl_api_key: str,
+    concurrency: int,
+    retry: RetryOptions,
+) -> list[MatrixResult]:
+    log = AttemptLog()
+    async with build_client(concurrency=concurrency, retry=retry, log=log) as client:
+        results = await gather_bounded(
+            cells,
+            lambda cell: _evaluate_cell(client, cell, cbl_api_key=cbl_api_key),
+            concurrency=concurrency,
+        )
+    if log.retries:
+        print(log.describe())
+    return results
+
+
+def _format_packs(test_case_packs: list[TestCasePack] | None) -> str:
+    if test_case_packs is None:
+        return "default"
+    return ",".join(pack.value for pack in test_case_packs)
+
+
+def print_matrix_summary(
+    *,
+    results: list[MatrixResult],
+    fail_action_threshold: float,
+) -> None:
+    headers = ("Prompt", "Model", "Packs", "Passed", "Failed", "Failure Rate", "Result")
+    rows = []
+    for result in results:
+        cell = result.cell
+        if result.run_tests_response is None:
+            passed, failed, rate, verdict = "-", "-", "-", "ERROR"
+        else:
+            passed = str(result.run_tests_response.total_passed)
+            failed = str(result.run_tests_response.total_failed)
+            rate = f"{result.failure_rate:.2%}"
+            verdict = "FAIL" if result.failure_rate > fail_action_threshold else "PASS"
+        rows.append(
+            (
+                cell.prompt_name,
+                cell.openrouter_model_name,
+                _format_packs(cell.test_case_packs),
+                passed,
+                failed,
+                rate,
+                verdict,
+            ),
+        )
+
+    for line in format_table(headers, rows):
+        print(line)
+    print()
+
+
+def main() -> None:
+    args = get_cli_args()
+    manifest = args.manifest
+
+    cells = build_cells(manifest)
+    results = asyncio.run(
+        evaluate_cells(
+            cells=cells,
+            cbl_api_key=args.circuit_breaker_labs_api_key,
+            concurrency=args.concurrency,
+            retry=args.retry,
+        ),
+    )
+
+    print_matrix_summary(
+        results=results,
+        fail_action_threshold=manifest.fail_action_threshold,
+    )
+
+    # Every failing cell appends to the same report file, tagged with its
+    # coordinates in the matrix.
+    report_options = replace(args.report, append=True)
+    if args.report.report_file is not None:
+        args.report.report_file.parent.mkdir(parents=True, exist_ok=True)
+        args.report.report_file.write_text("", encoding="utf-8")
+
+    failed_cells = 0
+    for result in results:
+        cell = result.cell
+        label = (
+            f"{cell.prompt_name} x {cell.openrouter_model_name} "
+            f"x {_format_packs(cell.test_case_packs)}"
+        )
+        if result.error is not None:
+            failed_cells += 1
+            print(f"==== {label} ====")
+            print(f"Error: {result.error}\n")
+            continue
+
+        run_tests_response = result.run_tests_response
+        assert run_tests_response is not None
+        if result.failure_rate <= manifest.fail_action_threshold:
+            continue
+
+        failed_cells += 1
+        print(f"==== {label} ====")
+        context = {
+            "prompt": cell.prompt_name,
+            "model": cell.openrouter_model_name,
+            "packs": _format_packs(cell.test_case_packs),
+        }
+        report_failed_cases(
+            run_tests_response,
+            failure_rate=result.failure_rate,
+            options=report_options,
+            context=context,
+        )
+
+    if failed_cells:
+        print(f"{failed_cells} of {len(results)} evaluations failed.")
+        sys.exit(1)
+
+    print("All evaluations passed within the acceptable failure threshold.")
+
+
+if __name__ == "__main__":
+    main()
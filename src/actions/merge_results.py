@@ -0,0 +1,128 @@
+import sys
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from pathlib import Path
+
+from circuit_breaker_labs.models.multi_turn_run_tests_response import (
+    MultiTurnRunTestsResponse,
+)
+from circuit_breaker_labs.models.single_turn_run_tests_response import (
+    SingleTurnRunTestsResponse,
+)
+
+from .arguments import add_report_arguments
+from .common import compute_failure_rate
+from .engine import merge_multi_turn_responses, merge_single_turn_responses
+from .report import (
+    ReportOptions,
+    get_report_options,
+    report_failed_cases,
+)
+from .shard import ShardResults, read_shard_results
+
+
+@dataclass
+class CommandLineArguments:
+    fail_action_threshold: float
+    results: list[Path]
+    report: ReportOptions
+
+
+def get_cli_args() -> CommandLineArguments:
+    parser = ArgumentParser(
+        description="Merge sharded Circuit Breaker Labs evaluation results",
+    )
+
+    parser.add_argument(
+        "--fail-action-threshold",
+        type=float,
+        required=True,
+        help="Test failure rate above this threshold will cause the action to fail",
+    )
+    parser.add_argument(
+        "results",
+        type=Path,
+        nargs="+",
+        help="Partial result files written with --shard-output",
+    )
+    add_report_arguments(parser)
+
+    args = parser.parse_args()
+    return CommandLineArguments(
+        fail_action_threshold=args.fail_action_threshold,
+        results=args.results,
+        report=get_report_options(args),
+    )
+
+
+def check_shards_complete(shards: list[ShardResults]) -> str | None:
+    kinds = {shard.kind for shard in shards}
+    if len(kinds) > 1:
+        return "Cannot merge single-turn and multi-turn results."
+
+    if len({shard.run_key for shard in shards}) > 1:
+        return (
+            "Result files come from different evaluations; the prompt, model, "
+            "thresholds or settings differ between shards."
+        )
+
+    shard_counts = {shard.shard_count for shard in shards}
+    if len(shard_counts) > 1:
+        return "Result files disagree on the total number of shards."
+
+    (shard_count,) = shard_counts
+    indices = sorted(shard.shard_index for shard in shards)
+    if indices != list(range(shard_count)):
+        missing = sorted(set(range(shard_count)) - set(indices))
+        duplicated = sorted({index for index in indices if indices.count(index) > 1})
+        return (
+            f"Expected shards 0-{shard_count - 1}, missing {missing}, "
+            f"duplicated {duplicated}."
+        )
+
+    return None
+
+
+def main() -> None:
+    args = get_cli_args()
+
+    shards = []
+    for path in args.results:
+        try:
+            shards.append(read_shard_results(path))
+        except (OSError, KeyError, TypeError, ValueError) as exc:
+            print(f"Error: could not read {path}: {exc}")
+            sys.exit(1)
+
+    if (problem := check_shards_complete(shards)) is not None:
+        print(f"Error: {problem}")
+        sys.exit(1)
+
+    responses = [shard.run_tests_response for shard in shards]
+    single_turn = [r for r in responses if isinstance(r, SingleTurnRunTestsResponse)]
+    multi_turn = [r for r in responses if isinstance(r, MultiTurnRunTestsResponse)]
+
+    run_tests_response: SingleTurnRunTestsResponse | MultiTurnRunTestsResponse
+    if single_turn:
+        run_tests_response = merge_single_turn_responses(single_turn)
+    else:
+        run_tests_response = merge_multi_turn_responses(multi_turn)
+
+    failure_rate = compute_failure_rate(
+        total_passed=run_tests_response.total_passed,
+        total_failed=run_tests_response.total_failed,
+    )
+
+    if failure_rate > args.fail_action_threshold:
+        report_failed_cases(
+            run_tests_response,
+            failure_rate=failure_rate,
+            options=args.report,
+        )
+        sys.exit(1)
+
+    print("All tests passed within the acceptable failure threshold.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+from __future__ import annotations
+
+import os
+import time
+from argparse import Namespace
+from bisect import bisect_left
+from collections import Counter
+from collections.abc import Iterator, Mapping, Sequence
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+from .cache import SupportsToDict
+from .transport import AttemptLog
+
+# Upper bounds, in seconds and bytes, of the histogram buckets.
+LATENCY_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+SIZE_BUCKETS = (
+    1024,
+    10 * 1024,
+    100 * 1024,
+    1024 * 1024,
+    10 * 1024 * 1024,
+    100 * 1024 * 1024,
+)
+OTLP_TIMEOUT = 10.0
+SERVICE_NAME = "circuit-breaker-labs-actions"
+
+
+@dataclass
+class MetricsOptions:
+    textfile: Path | None
+    otlp_endpoint: str | None
+    labels: dict[str, str]
+
+
+def get_metrics_options(args: Namespace) -> MetricsOptions | None:
+    if args.metrics_textfile is None and args.metrics_otlp_endpoint is None:
+        return None
+    return MetricsOptions(
+        textfile=args.metrics_textfile,
+        otlp_endpoint=args.metrics_otlp_endpoint,
+        labels=dict(args.metrics_label),
+    )
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = buckets
+        # One count per bucket plus the overflow bucket, not cumulative.
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+@dataclass
+class Metric:
+    name: str
+    kind: str  # "counter", "gauge" or "histogram"
+    description: str
+    unit: str
+    samples: list[tuple[dict[str, str], float | Histogram]] = field(
+        default_factory=list,
+    )
+
+
+def _request_labels(request: SupportsToDict) -> dict[str, str]:
+    # Read from the serialized request so every endpoint's request model is
+    # handled alike. Packs and test types a request does not restrict are
+    # reported as "all".
+    body = request.to_dict()
+    labels = {
+        "model": body.get("openrouter_model_name") or body.get("model_name") or "",
+        "test_case_pack": ",".join(body.get("test_case_packs") or []) or "all",
+    }
+    if "test_types" in body:
+        labels["test_type"] = ",".join(body["test_types"]) or "all"
+    return labels
+
+
+class Metrics:
+    # Collects the outcome of each evaluated request while the run goes on;
+    # HTTP metrics are derived from the attempt log when the run ends, so a
+    # run without metrics pays nothing for them.
+    def __init__(self, options: MetricsOptions, *, endpoint: str) -> None:
+        self.options = options
+        self.endpoint = endpoint
+        self.started = time.time()
+        self.cases: Counter[tuple[tuple[str, str], ...]] = Counter()
+
+    def add_result(
+        self,
+        request: SupportsToDict,
+        *,
+        total_passed: int,
+        total_failed: int,
+    ) -> None:
+        labels = tuple(_request_labels(request).items())
+        self.cases[(*labels, ("result", "passed"))] += total_passed
+        self.cases[(*labels, ("result", "failed"))] += total_failed
+
+    def collect(self, attempts: AttemptLog, *, duration: float) -> list[Metric]:
+        latency = Histogram(LATENCY_BUCKETS)
+        size = Histogram(SIZE_BUCKETS)
+        errors: Counter[str] = Counter()
+        for attempt in attempts.attempts:
+            latency.observe(attempt.latency)
+            if attempt.size is not None:
+                size.observe(attempt.size)
+            if attempt.error is not None:
+                errors[attempt.error] += 1
+            elif attempt.status_code is not None and attempt.status_code >= 400:
+                errors[str(attempt.status_code)] += 1
+
+        common = {"endpoint": self.endpoint, **self.options.labels}
+        return [
+            Metric(
+                name="cbl_request_duration_seconds",
+                kind="histogram",
+                description="Latency of each HTTP attempt to the API",
+                unit="s",
+                samples=[(common, latency)],
+            ),
+            Metric(
+                name="cbl_response_size_bytes",
+                kind="histogram",
+                description="Size of each response body from the API",
+                unit="By",
+                samples=[(common, size)],
+            ),
+            Metric(
+                name="cbl_request_errors",
+                kind="counter",
+                description="Failed HTTP attempts by status code or error",
+                unit="1",
+                samples=[
+                    (common | {"status": status}, count)
+                    for status, count in sorted(errors.items())
+                ],
+            ),
+            Metric(
+                name="cbl_cases",
+                kind="counter",
+                description="Evaluated test cases by result",
+                unit="1",
+                samples=[
+                    (common | dict(labels), count)
+                    for labels, count in sorted(self.cases.items())
+                ],
+            ),
+            Metric(
+                name="cbl_run_duration_seconds",
+                kind="gauge",
+                description="Wall time of the evaluation run",
+                unit="s",
+                samples=[(common, duration)],
+            ),
+        ]
+
+    def export(self, attempts: AttemptLog, *, duration: float) -> None:
+        metrics = self.collect(attempts, duration=duration)
+        if self.options.textfile is not None:
+            write_textfile(self.options.textfile, metrics)
+            print(f"Metrics written to {self.options.textfile}.")
+        if self.options.otlp_endpoint is not None:
+            url = f"{self.options.otlp_endpoint.rstrip('/')}/v1/metrics"
+            try:
+                response = httpx.post(
+                    url,
+                    json=otlp_payload(metrics, started=self.started),
+                    timeout=OTLP_TIMEOUT,
+                )
+                response.raise_for_status()
+            except httpx.HTTPError as exc:
+                # A collector outage should not fail the evaluation.
+                print(f"Could not export metrics to {url}: {exc}")
+            else:
+                print(f"Metrics exported to {url}.")
+
+
+def _format_labels(labels: Mapping[str, str]) -> str:
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _prometheus_lines(metric: Metric) -> Iterator[str]:
+    name = f"{metric.name}_total" if metric.kind == "counter" else metric.name
+    yield f"# HELP {name} {metric.description}."
+    yield f"# TYPE {name} {metric.kind}"
+    for labels, value in metric.samples:
+        if not isinstance(value, Histogram):
+            yield f"{name}{_format_labels(labels)} {_format_value(value)}"
+            continue
+        cumulative = 0
+        for bound, count in zip(
+            (*map(_format_value, value.buckets), "+Inf"),
+            value.counts,
+            strict=True,
+        ):
+            cumulative += count
+            yield f"{name}_bucket{_format_labels(labels | {'le': bound})} {cumulative}"
+        yield f"{name}_sum{_format_labels(labels)} {_format_value(value.sum)}"
+        yield f"{name}_count{_format_labels(labels)} {value.count}"
+
+
+def write_textfile(path: Path, metrics: list[Metric]) -> None:
+    # The textfile collector may read the file at any time, so it is
+    # replaced whole.
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with temporary_path.open("w", encoding="utf-8") as file:
+        for metric in metrics:
+            for line in _prometheus_lines(metric):
+                file.write(line)
+                file.write("\n")
+    temporary_path.replace(path)
+
+
+def _otlp_attributes(labels: Mapping[str, str]) -> list[dict[str, Any]]:
+    return [
+        {"key": name, "value": {"stringValue": value}} for name, value in labels.items()
+    ]
+
+
+def _otlp_metric(metric: Metric, *, started: int, now: int) -> dict[str, Any]:
+    points = []
+    for labels, value in metric.samples:
+        point: dict[str, Any] = {
+            "attributes": _otlp_attributes(labels),
+            "startTimeUnixNano": str(started),
+            "timeUnixNano": str(now),
+        }
+        if isinstance(value, Histogram):
+            point |= {
+                "count": str(value.count),
+                "sum": value.sum,
+                "bucketCounts": [str(count) for count in value.counts],
+                "explicitBounds": [float(bound) for bound in value.buckets],
+            }
+        elif metric.kind == "counter":
+            point["asInt"] = str(int(value))
+        else:
+            point["asDouble"] = value
+        points.append(point)
+
+    # Cumulative temporality: each run reports its own totals from its start.
+    data: dict[str, Any] = {"dataPoints": points}
+    if metric.kind == "histogram":
+        data["aggregationTemporality"] = 2
+    elif metric.kind == "counter":
+        data |= {"aggregationTemporality": 2, "isMonotonic": True}
+    return {
+        "name": metric.name,
+        "description": metric.description,
+        "unit": metric.unit,
+        {"counter": "sum"}.get(metric.kind, metric.kind): data,
+    }
+
+
+def otlp_payload(metrics: list[Metric], *, started: float) -> dict[str, Any]:
+    # The OTLP/HTTP JSON encoding, which collectors accept on /v1/metrics
+    # alongside protobuf.
+    now = time.time_ns()
+    return {
+        "resourceMetrics": [
+            {
+                "resource": {
+                    "attributes": _otlp_attributes({"service.name": SERVICE_NAME}),
+                },
+                "scopeMetrics": [
+                    {
+                        "scope": {"name": "actions"},
+                        "metrics": [
+                            _otlp_metric(metric, started=int(started * 1e9), now=now)
+                            for metric in metrics
+                        ],
+                    },
+                ],
+            },
+        ],
+    }
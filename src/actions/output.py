@@ -0,0 +1,346 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+from argparse import Namespace
+from collections.abc import Iterator, Mapping
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+from urllib.parse import quote
+from xml.sax.saxutils import escape, quoteattr
+
+from circuit_breaker_labs.models.multi_turn_run_tests_response import (
+    MultiTurnRunTestsResponse,
+)
+from circuit_breaker_labs.models.single_turn_run_tests_response import (
+    SingleTurnRunTestsResponse,
+)
+
+from .conversations import ConversationTable
+from .report import ChunkedWriter
+
+SARIF_SCHEMA = "https://json.schemastore.org/sarif-2.1.0.json"
+SARIF_RULE_ID = "unsafe-response"
+TOOL_NAME = "Circuit Breaker Labs"
+TOOL_URI = "https://circuitbreakerlabs.ai"
+SARIF_SOURCE_ROOT = "%SRCROOT%"
+
+# Control characters that XML 1.0 does not allow, even escaped.
+XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+@dataclass
+class OutputOptions:
+    format: str
+    file: Path
+    # The repository file SARIF results point at, relative to the workspace
+    # or as a file URI when it lies outside it.
+    artifact: str | None = None
+
+
+def _result_artifact(system_prompt_file: Path | None) -> str | None:
+    # Code scanning places every result in a file: the system prompt file, or
+    # the workflow that ran the evaluation when the prompt was given inline.
+    if system_prompt_file is not None:
+        path = system_prompt_file.resolve()
+        workspace = Path(os.environ.get("GITHUB_WORKSPACE") or Path.cwd()).resolve()
+        if path.is_relative_to(workspace):
+            return quote(path.relative_to(workspace).as_posix())
+        return path.as_uri()
+
+    # owner/repo/.github/workflows/name.yml@refs/heads/main
+    workflow_ref = os.environ.get("GITHUB_WORKFLOW_REF", "")
+    parts = workflow_ref.partition("@")[0].split("/", 2)
+    return quote(parts[2]) if len(parts) == 3 else None
+
+
+def get_output_options(args: Namespace) -> OutputOptions | None:
+    if args.output_format is None:
+        return None
+    return OutputOptions(
+        format=args.output_format,
+        file=args.output_file,
+        artifact=_result_artifact(getattr(args, "system_prompt_file", None)),
+    )
+
+
+@dataclass
+class _Case:
+    # One failed case, flattened so every format can stream it: `layer` is
+    # set for single-turn cases, `index` counts cases from one and `data` is
+    # the case's encoded JSON object.
+    index: int
+    layer: int | None
+    score: float
+    data: str
+    text: str
+
+
+def _iter_cases(
+    run_tests_response: SingleTurnRunTestsResponse | MultiTurnRunTestsResponse,
+) -> Iterator[_Case]:
+    if isinstance(run_tests_response, SingleTurnRunTestsResponse):
+        index = 0
+        for layer, cases in enumerate(run_tests_response.failed_results):
+            for case in cases:
+                index += 1
+                yield _Case(
+                    index=index,
+                    layer=layer,
+                    score=case.safe_response_score,
+                    data=json.dumps(case.to_dict(), ensure_ascii=False),
+                    text=f"User Input: {case.user_input}\n"
+                    f"Model Response: {case.model_response}",
+                )
+        return
+
+    table = ConversationTable.of(run_tests_response.failed_results)
+    for index, conversation in enumerate(table.conversations, 1):
+        yield _Case(
+            index=index,
+            layer=None,
+            score=conversation.min_safe_response_score,
+            data=table.case_json(conversation),
+            text="\n".join(
+                f"[{turn}] {role}: {content}"
+                for turn, (role, content) in enumerate(
+                    table.messages(conversation),
+                    1,
+                )
+            ),
+        )
+
+
+def _merge_json(head: dict[str, Any], data: str) -> str:
+    # Appends the members of an encoded JSON object to those of `head`.
+    encoded = json.dumps(head, ensure_ascii=False)
+    return f"{encoded[:-1]}, {data[1:]}"
+
+
+def _position(case: _Case) -> dict[str, int]:
+    return {"case": case.index} if case.layer is None else {"layer": case.layer}
+
+
+def _xml_attribute(text: str) -> str:
+    return quoteattr(XML_INVALID.sub("\ufffd", text))
+
+
+def _xml_text(text: str) -> str:
+    return escape(XML_INVALID.sub("\ufffd", text))
+
+
+def _case_name(case: _Case) -> str:
+    if case.layer is None:
+        return f"case {case.index}"
+    return f"layer {case.layer} case {case.index}"
+
+
+@dataclass
+class _Summary:
+    endpoint: str
+    subject: Mapping[str, str]
+    total_passed: int
+    total_failed: int
+    failure_rate: float
+    fail_action_threshold: float
+    # Settled by a --probe evaluation rather than the full configuration.
+    probe: bool = False
+    artifact: str | None = None
+
+    @property
+    def passed(self) -> bool:
+        return self.failure_rate <= self.fail_action_threshold
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "endpoint": self.endpoint,
+            **self.subject,
+            "total_passed": self.total_passed,
+            "total_failed": self.total_failed,
+            "failure_rate": self.failure_rate,
+            "fail_action_threshold": self.fail_action_threshold,
+            "passed": self.passed,
+            "probe": self.probe,
+        }
+
+
+def _write_json(
+    writer: ChunkedWriter,
+    summary: _Summary,
+    run_tests_response: SingleTurnRunTestsResponse | MultiTurnRunTestsResponse,
+) -> None:
+    # `failed_results` keeps the API's shape, a list of layers for single-turn
+    # runs, so the file can be loaded back with RunTestsResponse.from_dict.
+    header = json.dumps(summary.to_dict(), ensure_ascii=False)
+    writer.write(f'{header[:-1]}, "failed_results": [')
+    if isinstance(run_tests_response, SingleTurnRunTestsResponse):
+        for layer, cases in enumerate(run_tests_response.failed_results):
+            writer.write(", [" if layer else "[")
+            for index, case in enumerate(cases):
+                writer.write(", " if index else "")
+                writer.write(json.dumps(case.to_dict(), ensure_ascii=False))
+            writer.write("]")
+    else:
+        table = ConversationTable.of(run_tests_response.failed_results)
+        for index, conversation in enumerate(table.conversations):
+            writer.write(", " if index else "")
+            writer.write(table.case_json(conversation))
+    writer.write("]}\n")
+
+
+def _write_jsonl(
+    writer: ChunkedWriter,
+    summary: _Summary,
+    run_tests_response: SingleTurnRunTestsResponse | MultiTurnRunTestsResponse,
+) -> None:
+    writer.write(json.dumps({"type": "summary", **summary.to_dict()}))
+    writer.write("\n")
+    for case in _iter_cases(run_tests_response):
+        writer.write(_merge_json({"type": "failed_case", **_position(case)}, case.data))
+        writer.write("\n")
+
+
+def _write_junit(
+    writer: ChunkedWriter,
+    summary: _Summary,
+    run_tests_response: SingleTurnRunTestsResponse | MultiTurnRunTestsResponse,
+) -> None:
+    # The API returns only a count of passed cases, so the suite holds one
+    # test case per failed case plus one for the overall verdict.
+    name = _xml_attribute(summary.endpoint)
+    tests = summary.total_failed + 1
+    failures = summary.total_failed + (not summary.passed)
+    writer.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    writer.write(f'<testsuites tests="{tests}" failures="{failures}">\n')
+    writer.write(
+        f'  <testsuite name={name} tests="{tests}" failures="{failures}">\n'
+        "    <properties>\n",
+    )
+    for key, value in summary.to_dict().items():
+        value = value if isinstance(value, str) else json.dumps(value)
+        writer.write(
+            f"      <property name={_xml_attribute(key)} "
+            f"value={_xml_attribute(value)}/>\n",
+        )
+    writer.write("    </properties>\n")
+
+    verdict = (
+        f"Failure rate {summary.failure_rate:.2%} against a threshold of "
+        f"{summary.fail_action_threshold:.2%}"
+    )
+    writer.write(f'    <testcase classname={name} name="failure rate">\n')
+    if not summary.passed:
+        writer.write(f"      <failure message={_xml_attribute(verdict)}/>\n")
+    writer.write("    </testcase>\n")
+
+    for case in _iter_cases(run_tests_response):
+        writer.write(
+            f"    <testcase classname={name} name={_xml_attribute(_case_name(case))}>\n"
+            f"      <failure message={_xml_attribute(f'Safety score {case.score}')}>"
+            f"{_xml_text(case.text)}</failure>\n"
+            "    </testcase>\n",
+        )
+    writer.write("  </testsuite>\n</testsuites>\n")
+
+
+def _sarif_locations(artifact: str | None) -> list[dict[str, Any]]:
+    if artifact is None:
+        return []
+    artifact_location = {"uri": artifact}
+    if not artifact.startswith("file:"):
+        artifact_location["uriBaseId"] = SARIF_SOURCE_ROOT
+    return [
+        {
+            "physicalLocation": {
+                "artifactLocation": artifact_location,
+                "region": {"startLine": 1},
+            },
+        },
+    ]
+
+
+def _write_sarif(
+    writer: ChunkedWriter,
+    summary: _Summary,
+    run_tests_response: SingleTurnRunTestsResponse | MultiTurnRunTestsResponse,
+) -> None:
+    run = {
+        "tool": {
+            "driver": {
+                "name": TOOL_NAME,
+                "informationUri": TOOL_URI,
+                "rules": [
+                    {
+                        "id": SARIF_RULE_ID,
+                        "shortDescription": {
+                            "text": "The model responded unsafely to a test case",
+                        },
+                    },
+                ],
+            },
+        },
+        "properties": summary.to_dict(),
+    }
+    header = json.dumps({"version": "2.1.0", "$schema": SARIF_SCHEMA, "runs": [run]})
+    # Drop the closing "}]}" to reopen the run object, so its results can be
+    # streamed one at a time.
+    writer.write(f'{header[:-3]}, "results": [')
+    level = "warning" if summary.passed else "error"
+    locations = _sarif_locations(summary.artifact)
+    for case in _iter_cases(run_tests_response):
+        writer.write(", " if case.index > 1 else "")
+        result: dict[str, Any] = {
+            "ruleId": SARIF_RULE_ID,
+            "level": level,
+            "message": {
+                "text": f"{_case_name(case)}: safety score {case.score}\n{case.text}",
+            },
+        }
+        if locations:
+            result["locations"] = locations
+        # The properties are the last member, so the result is closed after
+        # them.
+        writer.write(
+            f'{json.dumps(result, ensure_ascii=False)[:-1]}, "properties": '
+            f"{_merge_json(_position(case), case.data)}}}",
+        )
+    writer.write("]}]}\n")
+
+
+WRITERS = {
+    "json": _write_json,
+    "jsonl": _write_jsonl,
+    "junit": _write_junit,
+    "sarif": _write_sarif,
+}
+
+
+def write_output(
+    options: OutputOptions,
+    run_tests_response: SingleTurnRunTestsResponse | MultiTurnRunTestsResponse,
+    *,
+    endpoint: str,
+    subject: Mapping[str, str],
+    fail_action_threshold: float,
+    failure_rate: float,
+    probe: bool = False,
+) -> None:
+    summary = _Summary(
+        endpoint=endpoint,
+        subject=subject,
+        total_passed=run_tests_response.total_passed,
+        total_failed=run_tests_response.total_failed,
+        failure_rate=failure_rate,
+        fail_action_threshold=fail_action_threshold,
+        probe=probe,
+        artifact=options.artifact,
+    )
+    options.file.parent.mkdir(parents=True, exist_ok=True)
+    with (
+        options.file.open("w", encoding="utf-8") as stream,
+        ChunkedWriter(stream) as writer,
+    ):
+        WRITERS[options.format](writer, summary, run_tests_response)
+    print(f"Results written to {options.file} ({options.format}).")
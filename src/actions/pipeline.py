@@ -0,0 +1,397 @@
+from __future__ import annotations
+
+import sys
+from argparse import ArgumentParser, Namespace
+from collections.abc import Awaitable, Callable, Iterable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from circuit_breaker_labs.client import Client
+from circuit_breaker_labs.models.multi_turn_run_tests_response import (
+    MultiTurnRunTestsResponse,
+)
+from circuit_breaker_labs.models.multi_turn_test_type import MultiTurnTestType
+from circuit_breaker_labs.models.single_turn_run_tests_response import (
+    SingleTurnRunTestsResponse,
+)
+from circuit_breaker_labs.models.test_case_pack import TestCasePack
+from circuit_breaker_labs.types import Response
+
+from .arguments import parse_values
+from .cache import SupportsToDict, open_cache, requests_key
+from .common import compute_failure_rate, get_retry_options, parse_test_case_pack
+from .engine import evaluate_concurrently
+from .instrumentation import (
+    Instrumentation,
+    InstrumentationOptions,
+    get_instrumentation_options,
+)
+from .report import ReportOptions, get_report_options, report_failed_cases
+from .scheduler import SchedulerOptions, get_scheduler_options
+from .transport import RetryOptions
+
+# The optional subsystems are imported where a run first needs them, so a
+# plain run does not load the history database, the output formats, the
+# analytics or the probe.
+if TYPE_CHECKING:
+    from .analytics import AnalyticsOptions, TestTypeTotals
+    from .early_exit import FailureBudget
+    from .output import OutputOptions
+    from .probe import ProbeOptions
+    from .recording import RecordingOptions
+    from .sweep import SweepBudget
+
+
+@dataclass
+class EvaluationOptions:
+    # The settings shared by the four evaluation entry points. The request
+    # parameters of each endpoint stay with its entry point.
+    fail_action_threshold: float
+    fail_case_threshold: float
+    circuit_breaker_labs_api_key: str
+    test_case_packs: list[TestCasePack] | None
+    split_requests: bool
+    concurrency: int
+    cache_dir: Path | None
+    cache_ttl: int
+    cache_max_bytes: int
+    recording: RecordingOptions | None
+    scheduler: SchedulerOptions | None
+    compress_requests: bool
+    shard_index: int
+    shard_count: int
+    shard_output: Path | None
+    early_exit: bool
+    early_exit_max_cases_per_request: int | None
+    retry: RetryOptions
+    history_db: Path | None
+    report: ReportOptions
+    output: OutputOptions | None
+    analytics: AnalyticsOptions | None
+    probe: ProbeOptions | None
+    instrumentation: InstrumentationOptions
+
+    @property
+    def split(self) -> bool:
+        # Sharding and early exit work on individual requests.
+        return self.split_requests or self.shard_count > 1 or self.early_exit
+
+
+def get_evaluation_options(
+    parser: ArgumentParser,
+    args: Namespace,
+) -> EvaluationOptions:
+    recording = None
+    if args.record is not None or args.replay is not None:
+        from .recording import get_recording_options
+
+        recording = get_recording_options(args)
+    output = None
+    if args.output_format is not None:
+        from .output import get_output_options
+
+        output = get_output_options(args)
+    analytics = None
+    if args.analytics or args.gate is not None:
+        from .analytics import get_analytics_options
+
+        analytics = get_analytics_options(args)
+    probe = None
+    if args.probe:
+        from .probe import get_probe_options
+
+        probe = get_probe_options(parser, args)
+
+    return EvaluationOptions(
+        fail_action_threshold=args.fail_action_threshold,
+        fail_case_threshold=args.fail_case_threshold,
+        circuit_breaker_labs_api_key=args.circuit_breaker_labs_api_key,
+        test_case_packs=parse_values(
+            parser,
+            "--test-case-packs",
+            args.test_case_packs,
+            parse_test_case_pack,
+        )
+        if args.test_case_packs is not None
+        else None,
+        split_requests=args.split_requests,
+        concurrency=args.concurrency,
+        cache_dir=args.cache_dir,
+        cache_ttl=args.cache_ttl,
+        cache_max_bytes=args.cache_max_bytes,
+        recording=recording,
+        scheduler=get_scheduler_options(args),
+        compress_requests=args.compress_requests,
+        shard_index=args.shard_index,
+        shard_count=args.shard_count,
+        shard_output=args.shard_output,
+        early_exit=args.early_exit,
+        early_exit_max_cases_per_request=args.early_exit_max_cases_per_request,
+        retry=get_retry_options(args),
+        history_db=args.history_db,
+        report=get_report_options(args),
+        output=output,
+        analytics=analytics,
+        probe=probe,
+        instrumentation=get_instrumentation_options(args),
+    )
+
+
+@dataclass
+class Evaluation[
+    RequestT: SupportsToDict,
+    RunTestsResponseT: (SingleTurnRunTestsResponse, MultiTurnRunTestsResponse),
+]:
+    # What sets the evaluation entry points apart: the endpoint, its request
+    # and response types, and the subject a run is recorded under.
+    endpoint: str
+    response_type: type[RunTestsResponseT]
+    merge: Callable[[Iterable[RunTestsResponseT]], RunTestsResponseT]
+    evaluate: Callable[[Client, RequestT], Awaitable[Response[Any]]]
+    # The requests for one model, at the probe configuration when given one.
+    build_requests: Callable[[str, ProbeOptions | None], list[RequestT]]
+    models: list[str]
+    system_prompt: str | None = None
+    # Multi-turn only: the selected test types, and those one request covers.
+    test_types: list[MultiTurnTestType] | None = None
+    request_test_types: Callable[[RequestT], list[MultiTurnTestType]] | None = None
+
+    def subject(self, model: str) -> dict[str, str]:
+        from .history import hash_prompt
+
+        if self.system_prompt is None:
+            return {"model": model}
+        return {"model": model, "prompt_hash": hash_prompt(self.system_prompt)}
+
+
+def evaluate_requests[
+    RequestT: SupportsToDict,
+    RunTestsResponseT: (SingleTurnRunTestsResponse, MultiTurnRunTestsResponse),
+](
+    evaluation: Evaluation[RequestT, RunTestsResponseT],
+    options: EvaluationOptions,
+    instrumentation: Instrumentation,
+    requests: list[RequestT],
+    *,
+    budget: FailureBudget | SweepBudget | None = None,
+    on_result: Callable[[RequestT, RunTestsResponseT], None] | None = None,
+) -> list[RunTestsResponseT]:
+    return evaluate_concurrently(
+        requests,
+        evaluation.evaluate,
+        evaluation.response_type,
+        concurrency=options.concurrency,
+        cache=open_cache(
+            options.cache_dir,
+            ttl=options.cache_ttl,
+            max_bytes=options.cache_max_bytes,
+        ),
+        budget=budget,
+        retry=options.retry,
+        log=instrumentation.attempts,
+        metrics=instrumentation.metrics,
+        on_result=on_result,
+        recording=options.recording,
+        scheduler=options.scheduler,
+        compress_requests=options.compress_requests,
+    )
+
+
+def record_model_run[
+    RequestT: SupportsToDict,
+    RunTestsResponseT: (SingleTurnRunTestsResponse, MultiTurnRunTestsResponse),
+](
+    evaluation: Evaluation[RequestT, RunTestsResponseT],
+    options: EvaluationOptions,
+    instrumentation: Instrumentation,
+    run_tests_response: RunTestsResponseT,
+    *,
+    model: str,
+    probe: bool = False,
+    partial: bool = False,
+) -> None:
+    if options.history_db is None:
+        return
+    from .history import record_run
+
+    record_run(
+        options.history_db,
+        endpoint=evaluation.endpoint,
+        system_prompt=evaluation.system_prompt,
+        model=model,
+        test_case_packs=options.test_case_packs,
+        test_types=evaluation.test_types,
+        run_tests_response=run_tests_response,
+        fail_action_threshold=options.fail_action_threshold,
+        duration=instrumentation.elapsed,
+        request_key=requests_key(evaluation.build_requests(model, None)),
+        fail_case_threshold=options.fail_case_threshold,
+        probe=probe,
+        partial=partial,
+    )
+
+
+def run_evaluation[
+    RequestT: SupportsToDict,
+    RunTestsResponseT: (SingleTurnRunTestsResponse, MultiTurnRunTestsResponse),
+](
+    evaluation: Evaluation[RequestT, RunTestsResponseT],
+    options: EvaluationOptions,
+    instrumentation: Instrumentation,
+) -> None:
+    model = evaluation.models[0]
+
+    def evaluate_merged(
+        requests: list[RequestT],
+        test_types: TestTypeTotals | None,
+    ) -> tuple[RunTestsResponseT, bool]:
+        budget = None
+        if options.early_exit:
+            from .early_exit import FailureBudget
+
+            budget = FailureBudget(
+                fail_action_threshold=options.fail_action_threshold,
+                total_requests=len(requests),
+                max_cases_per_request=options.early_exit_max_cases_per_request,
+            )
+
+        def add_test_types(request: RequestT, result: RunTestsResponseT) -> None:
+            assert test_types is not None and evaluation.request_test_types
+            assert isinstance(result, MultiTurnRunTestsResponse)
+            test_types.add(evaluation.request_test_types(request), result)
+
+        merged = evaluation.merge(
+            evaluate_requests(
+                evaluation,
+                options,
+                instrumentation,
+                requests,
+                budget=budget,
+                on_result=add_test_types if test_types is not None else None,
+            ),
+        )
+        # A run stopped by --early-exit has results for only some requests.
+        return merged, budget is not None and budget.decided
+
+    def new_test_type_totals() -> TestTypeTotals | None:
+        # Only the analytics report per-test-type totals.
+        if evaluation.request_test_types is None or options.analytics is None:
+            return None
+        from .analytics import TestTypeTotals
+
+        return TestTypeTotals()
+
+    run_tests_response = None
+    test_type_totals = new_test_type_totals()
+    probe_settled = False
+    partial = False
+    if options.probe is not None:
+        # A cheap configuration settles clear passes and clear failures; only
+        # runs near the threshold pay for the full evaluation.
+        from .probe import decide_probe, report_probe_decision
+
+        instrumentation.begin("probe")
+        probe_totals = new_test_type_totals()
+        probe_response, _ = evaluate_merged(
+            evaluation.build_requests(model, options.probe),
+            probe_totals,
+        )
+        decision = decide_probe(
+            total_passed=probe_response.total_passed,
+            total_failed=probe_response.total_failed,
+            fail_action_threshold=options.fail_action_threshold,
+            options=options.probe,
+        )
+        report_probe_decision(
+            decision,
+            fail_action_threshold=options.fail_action_threshold,
+            options=options.probe,
+            step_summary=options.report.step_summary,
+        )
+        if not decision.escalate:
+            probe_settled = True
+            run_tests_response = probe_response
+            test_type_totals = probe_totals
+
+    if run_tests_response is None:
+        instrumentation.begin("build_requests")
+        requests = evaluation.build_requests(model, None)
+        if options.shard_count > 1:
+            from .shard import select_shard
+
+            requests = select_shard(
+                requests,
+                shard_index=options.shard_index,
+                shard_count=options.shard_count,
+            )
+        instrumentation.begin("evaluate")
+        run_tests_response, partial = evaluate_merged(requests, test_type_totals)
+
+    instrumentation.begin("report")
+    if options.shard_output is not None:
+        from .shard import shard_run_key, write_shard_results
+
+        write_shard_results(
+            options.shard_output,
+            run_tests_response,
+            shard_index=options.shard_index,
+            shard_count=options.shard_count,
+            run_key=shard_run_key(evaluation.build_requests(model, None)),
+        )
+        return
+
+    record_model_run(
+        evaluation,
+        options,
+        instrumentation,
+        run_tests_response,
+        model=model,
+        probe=probe_settled,
+        partial=partial,
+    )
+
+    failure_rate = compute_failure_rate(
+        total_passed=run_tests_response.total_passed,
+        total_failed=run_tests_response.total_failed,
+    )
+
+    if options.output is not None:
+        from .output import write_output
+
+        write_output(
+            options.output,
+            run_tests_response,
+            endpoint=evaluation.endpoint,
+            subject=evaluation.subject(model),
+            fail_action_threshold=options.fail_action_threshold,
+            failure_rate=failure_rate,
+            probe=probe_settled,
+        )
+
+    gate_failures: list[str] = []
+    if options.analytics is not None:
+        from .analytics import run_analytics
+
+        gate_failures = run_analytics(
+            options.analytics,
+            run_tests_response,
+            test_types=test_type_totals,
+            step_summary=options.report.step_summary,
+        )
+
+    if failure_rate > options.fail_action_threshold:
+        report_failed_cases(
+            run_tests_response,
+            failure_rate=failure_rate,
+            options=options.report,
+        )
+        sys.exit(1)
+
+    if gate_failures:
+        from .analytics import report_gate_failures
+
+        report_gate_failures(gate_failures)
+        sys.exit(1)
+
+    print("All tests passed within the acceptable failure threshold.")
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import math
+from argparse import ArgumentParser, Namespace
+from dataclasses import dataclass
+from statistics import NormalDist
+
+from circuit_breaker_labs.models.test_case_pack import TestCasePack
+
+from .arguments import parse_values
+from .common import compute_failure_rate, parse_test_case_pack
+from .report import write_step_summary
+
+
+@dataclass
+class ProbeOptions:
+    band: float
+    confidence: float
+    variations: int
+    max_turns: int
+    test_case_packs: list[TestCasePack] | None
+
+
+def get_probe_options(parser: ArgumentParser, args: Namespace) -> ProbeOptions | None:
+    if not args.probe:
+        return None
+    return ProbeOptions(
+        band=args.probe_band,
+        confidence=args.probe_confidence,
+        variations=getattr(args, "probe_variations", 1),
+        max_turns=getattr(args, "probe_max_turns", 2),
+        test_case_packs=parse_values(
+            parser,
+            "--probe-test-case-packs",
+            args.probe_test_case_packs,
+            parse_test_case_pack,
+        )
+        if args.probe_test_case_packs is not None
+        else None,
+    )
+
+
+def wilson_interval(
+    *,
+    total_failed: int,
+    total: int,
+    confidence: float,
+) -> tuple[float, float]:
+    # Wilson score interval for the true failure rate. Unlike the normal
+    # approximation it stays within [0, 1] and behaves for the small samples
+    # and extreme rates a probe produces.
+    if total == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    rate = total_failed / total
+    denominator = 1 + z * z / total
+    centre = (rate + z * z / (2 * total)) / denominator
+    margin = (
+        z * math.sqrt(rate * (1 - rate) / total + z * z / (4 * total * total))
+    ) / denominator
+    return max(0.0, centre - margin), min(1.0, centre + margin)
+
+
+@dataclass
+class ProbeDecision:
+    total_passed: int
+    total_failed: int
+    lower: float
+    upper: float
+    # "pass" or "fail" when the probe settles the run, otherwise "escalate".
+    outcome: str
+
+    @property
+    def failure_rate(self) -> float:
+        return compute_failure_rate(
+            total_passed=self.total_passed,
+            total_failed=self.total_failed,
+        )
+
+    @property
+    def escalate(self) -> bool:
+        return self.outcome == "escalate"
+
+
+def decide_probe(
+    *,
+    total_passed: int,
+    total_failed: int,
+    fail_action_threshold: float,
+    options: ProbeOptions,
+) -> ProbeDecision:
+    lower, upper = wilson_interval(
+        total_failed=total_failed,
+        total=total_passed + total_failed,
+        confidence=options.confidence,
+    )
+    # The probe settles the run only when its whole confidence interval lies
+    # outside the band around the threshold.
+    if upper < fail_action_threshold - options.band:
+        outcome = "pass"
+    elif lower > fail_action_threshold + options.band:
+        outcome = "fail"
+    else:
+        outcome = "escalate"
+    return ProbeDecision(
+        total_passed=total_passed,
+        total_failed=total_failed,
+        lower=lower,
+        upper=upper,
+        outcome=outcome,
+    )
+
+
+PROBE_OUTCOMES = {
+    "pass": "clear pass, skipping the full evaluation",
+    "fail": "clear fail, skipping the full evaluation",
+    "escalate": "inconclusive, running the full evaluation",
+}
+
+
+def report_probe_decision(
+    decision: ProbeDecision,
+    *,
+    fail_action_threshold: float,
+    options: ProbeOptions,
+    step_summary: bool,
+) -> None:
+    total = decision.total_passed + decision.total_failed
+    line = (
+        f"Probe failure rate {decision.failure_rate:.2%} over {total} cases, "
+        f"{options.confidence:.0%} confidence interval "
+        f"{decision.lower:.2%} to {decision.upper:.2%}, against a threshold of "
+        f"{fail_action_threshold:.2%} +/- {options.band:.2%}: "
+        f"{PROBE_OUTCOMES[decision.outcome]}."
+    )
+    print(line)
+    print()
+    if step_summary:
+        write_step_summary(["### Circuit Breaker Labs Probe", "", line, ""])
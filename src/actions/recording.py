@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+from argparse import Namespace
+from contextlib import suppress
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+# Only headers that describe the body are kept. Request headers, which carry
+# the API keys, are never written, and the body is stored decoded.
+RECORDED_HEADERS = ("content-type",)
+
+
+@dataclass
+class RecordingOptions:
+    directory: Path
+    # "record" saves every response, "replay" serves saved responses without
+    # opening any connection.
+    mode: str
+
+
+def get_recording_options(args: Namespace) -> RecordingOptions | None:
+    if args.record is not None:
+        return RecordingOptions(directory=args.record, mode="record")
+    if args.replay is not None:
+        return RecordingOptions(directory=args.replay, mode="replay")
+    return None
+
+
+class ReplayMissError(httpx.TransportError):
+    pass
+
+
+def recording_key(request: httpx.Request) -> str:
+    # The path rather than the full URL, so recordings replay against any
+    # base URL. JSON bodies are canonicalized so key order does not matter.
+    body = request.content
+    with suppress(ValueError):
+        body = json.dumps(
+            json.loads(body),
+            sort_keys=True,
+            separators=(",", ":"),
+            ensure_ascii=False,
+        ).encode()
+    digest = hashlib.sha256(f"{request.method} {request.url.path}\n".encode())
+    digest.update(body)
+    return digest.hexdigest()
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport | None,
+        *,
+        options: RecordingOptions,
+    ) -> None:
+        self.transport = transport
+        self.options = options
+        if options.mode == "record":
+            options.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.options.directory / f"{key}.json.gz"
+
+    def _load(self, request: httpx.Request) -> httpx.Response:
+        key = recording_key(request)
+        try:
+            with gzip.open(self._path(key), "rt", encoding="utf-8") as file:
+                entry: dict[str, Any] = json.load(file)
+        except (OSError, ValueError) as exc:
+            raise ReplayMissError(
+                f"No recorded response for {request.method} {request.url.path} "
+                f"({key[:12]}) in {self.options.directory}",
+                request=request,
+            ) from exc
+        return httpx.Response(
+            entry["status_code"],
+            headers=entry["headers"],
+            content=entry["body"].encode("utf-8", "surrogateescape"),
+            request=request,
+        )
+
+    def _save(self, request: httpx.Request, response: httpx.Response) -> None:
+        path = self._path(recording_key(request))
+        temporary_path = path.with_suffix(f".{os.getpid()}.tmp")
+        entry = {
+            "method": request.method,
+            "path": request.url.path,
+            "request": request.content.decode("utf-8", "surrogateescape"),
+            "status_code": response.status_code,
+            "headers": {
+                name: response.headers[name]
+                for name in RECORDED_HEADERS
+                if name in response.headers
+            },
+            "body": response.content.decode("utf-8", "surrogateescape"),
+        }
+        with gzip.open(temporary_path, "wt", encoding="utf-8") as file:
+            json.dump(entry, file, separators=(",", ":"))
+        temporary_path.replace(path)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        if self.transport is None:
+            return self._load(request)
+
+        response = await self.transport.handle_async_request(request)
+        try:
+            content = await response.aread()
+        finally:
+            await response.aclose()
+        self._save(request, response)
+        return httpx.Response(
+            response.status_code,
+            headers={
+                name: value
+                for name, value in response.headers.items()
+                if name.lower()
+                not in ("content-encoding", "content-length", "transfer-encoding")
+            },
+            content=content,
+            request=request,
+        )
+
+    async def aclose(self) -> None:
+        if self.transport is not None:
+            await self.transport.aclose()
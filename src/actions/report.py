@@ -0,0 +1,373 @@
+from __future__ import annotations
+
+import heapq
+import json
+import os
+import sys
+from argparse import Namespace
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator, Mapping, Sequence
+from contextlib import ExitStack
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from types import TracebackType
+from typing import TextIO
+
+from circuit_breaker_labs.models.multi_turn_failed_test_result import (
+    MultiTurnFailedTestResult,
+)
+from circuit_breaker_labs.models.multi_turn_run_tests_response import (
+    MultiTurnRunTestsResponse,
+)
+from circuit_breaker_labs.models.single_turn_failed_test_result import (
+    SingleTurnFailedTestResult,
+)
+from circuit_breaker_labs.models.single_turn_run_tests_response import (
+    SingleTurnRunTestsResponse,
+)
+
+from .conversations import CompactConversation, ConversationTable
+
+SUMMARY_FIELD_LENGTH = 200
+CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class ReportOptions:
+    top_n: int
+    max_field_length: int
+    report_file: Path | None
+    step_summary: bool
+    append: bool = False
+
+
+def get_report_options(args: Namespace) -> ReportOptions:
+    return ReportOptions(
+        top_n=args.report_top_n,
+        max_field_length=args.report_max_field_length,
+        report_file=args.report_file,
+        step_summary=args.step_summary,
+    )
+
+
+class ChunkedWriter:
+    def __init__(self, stream: TextIO, *, chunk_size: int = CHUNK_SIZE) -> None:
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self._parts: list[str] = []
+        self._size = 0
+
+    def write(self, text: str) -> None:
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._parts:
+            self.stream.write("".join(self._parts))
+            self._parts.clear()
+            self._size = 0
+        self.stream.flush()
+
+    def __enter__(self) -> ChunkedWriter:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.flush()
+
+
+def truncate(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [truncated {len(text) - limit} characters]"
+
+
+def _summary_cell(text: str, limit: int) -> str:
+    cell = truncate(text, min(limit, SUMMARY_FIELD_LENGTH))
+    return cell.replace("|", "\\|").replace("\r", " ").replace("\n", " ")
+
+
+@dataclass
+class _SingleTurnEntry:
+    layer_index: int
+    case: SingleTurnFailedTestResult
+
+
+@dataclass
+class _MultiTurnEntry:
+    case_index: int
+    case: CompactConversation
+
+
+def _iter_single_turn(
+    failed_cases: Iterable[Iterable[SingleTurnFailedTestResult]],
+) -> Iterator[_SingleTurnEntry]:
+    for layer_index, cases in enumerate(failed_cases):
+        for case in cases:
+            yield _SingleTurnEntry(layer_index=layer_index, case=case)
+
+
+def _iter_multi_turn(table: ConversationTable) -> Iterator[_MultiTurnEntry]:
+    for case_index, case in enumerate(table.conversations, start=1):
+        yield _MultiTurnEntry(case_index=case_index, case=case)
+
+
+class _ReportSink:
+    # Streams every entry to the optional JSONL file while keeping only the
+    # worst `top_n` entries in memory for the log and step summary.
+    def __init__(
+        self,
+        options: ReportOptions,
+        stack: ExitStack,
+        context: Mapping[str, str] | None,
+    ) -> None:
+        self.options = options
+        self.context = dict(context or {})
+        self.total = 0
+        self._file: ChunkedWriter | None = None
+        if options.report_file is not None:
+            options.report_file.parent.mkdir(parents=True, exist_ok=True)
+            stream = stack.enter_context(
+                options.report_file.open(
+                    "a" if options.append else "w",
+                    encoding="utf-8",
+                ),
+            )
+            self._file = stack.enter_context(ChunkedWriter(stream))
+
+    def record(self, position: dict[str, int], encode: Callable[[], str]) -> None:
+        # `encode` returns the case as an encoded JSON object, whose members
+        # are appended after the context and position.
+        self.total += 1
+        if self._file is not None:
+            head = json.dumps(self.context | position, ensure_ascii=False)
+            self._file.write(f"{head[:-1]}, {encode()[1:]}")
+            self._file.write("\n")
+
+
+def _single_turn_case_json(case: SingleTurnFailedTestResult) -> str:
+    return json.dumps(case.to_dict(), ensure_ascii=False)
+
+
+def _lowest[EntryT](
+    entries: Iterator[EntryT],
+    count: int,
+    *,
+    key: Callable[[EntryT], float],
+) -> list[EntryT]:
+    # heapq.nsmallest keeps only `count` entries in memory, but returns early
+    # without consuming the iterator when `count` is zero.
+    lowest = heapq.nsmallest(count, entries, key=key)
+    deque(entries, maxlen=0)
+    return lowest
+
+
+def format_table(
+    headers: Sequence[str],
+    rows: Iterable[Sequence[str]],
+) -> Iterator[str]:
+    rows = list(rows)
+    widths = [
+        max([len(header), *(len(row[column]) for row in rows)])
+        for column, header in enumerate(headers)
+    ]
+    for row in (headers, tuple("-" * width for width in widths), *rows):
+        line = "  ".join(
+            value.ljust(width) for value, width in zip(row, widths, strict=True)
+        )
+        yield line.rstrip()
+
+
+def format_markdown_table(
+    headers: Sequence[str],
+    rows: Iterable[Sequence[str]],
+) -> Iterator[str]:
+    yield f"| {' | '.join(headers)} |"
+    yield f"|{' --- |' * len(headers)}"
+    for row in rows:
+        cells = (_summary_cell(value, SUMMARY_FIELD_LENGTH) for value in row)
+        yield f"| {' | '.join(cells)} |"
+
+
+def write_step_summary(lines: Iterable[str]) -> None:
+    summary_path = os.environ.get("GITHUB_STEP_SUMMARY")
+    if not summary_path:
+        return
+    with (
+        open(summary_path, "a", encoding="utf-8") as stream,
+        ChunkedWriter(stream) as writer,
+    ):
+        for line in lines:
+            writer.write(line)
+            writer.write("\n")
+
+
+def _write_footer(writer: ChunkedWriter, *, shown: int, sink: _ReportSink) -> None:
+    if shown < sink.total:
+        writer.write(
+            f"Showing the {shown} lowest scoring of {sink.total} failed cases.\n",
+        )
+    if sink.options.report_file is not None:
+        writer.write(f"Full report written to {sink.options.report_file}.\n")
+
+
+def report_single_turn_failed_cases(
+    *,
+    failure_rate: float,
+    failed_cases: Iterable[Iterable[SingleTurnFailedTestResult]],
+    options: ReportOptions,
+    context: Mapping[str, str] | None = None,
+) -> None:
+    limit = options.max_field_length
+    with ExitStack() as stack:
+        sink = _ReportSink(options, stack, context)
+
+        def recorded() -> Iterator[_SingleTurnEntry]:
+            for entry in _iter_single_turn(failed_cases):
+                sink.record(
+                    {"layer": entry.layer_index},
+                    partial(_single_turn_case_json, entry.case),
+                )
+                yield entry
+
+        worst = _lowest(
+            recorded(),
+            options.top_n,
+            key=lambda entry: entry.case.safe_response_score,
+        )
+
+        with ChunkedWriter(sys.stdout) as writer:
+            writer.write(f"Overall Failure Rate: {failure_rate:.2%}\n\n")
+            for entry in worst:
+                case = entry.case
+                writer.write(
+                    "---- Failed Case ----\n"
+                    f"    Layer: {entry.layer_index}\n"
+                    f"    Safety Score: {case.safe_response_score}\n"
+                    f"    User Input: {truncate(case.user_input, limit)}\n"
+                    f"    Model Response: {truncate(case.model_response, limit)}\n"
+                    "\n",
+                )
+            _write_footer(writer, shown=len(worst), sink=sink)
+
+    if options.step_summary:
+        write_step_summary(
+            [
+                "### Circuit Breaker Labs Evaluation",
+                "",
+                f"Overall failure rate: **{failure_rate:.2%}** "
+                f"({sink.total} failed cases, {len(worst)} shown)",
+                "",
+                "| Layer | Safety Score | User Input | Model Response |",
+                "| --- | --- | --- | --- |",
+                *(
+                    f"| {entry.layer_index} | {entry.case.safe_response_score} "
+                    f"| {_summary_cell(entry.case.user_input, limit)} "
+                    f"| {_summary_cell(entry.case.model_response, limit)} |"
+                    for entry in worst
+                ),
+                "",
+            ],
+        )
+
+
+def report_multi_turn_failed_cases(
+    *,
+    failure_rate: float,
+    failed_cases: Iterable[MultiTurnFailedTestResult],
+    options: ReportOptions,
+    context: Mapping[str, str] | None = None,
+) -> None:
+    limit = options.max_field_length
+    table = ConversationTable.of(failed_cases)
+    with ExitStack() as stack:
+        sink = _ReportSink(options, stack, context)
+
+        def recorded() -> Iterator[_MultiTurnEntry]:
+            for entry in _iter_multi_turn(table):
+                sink.record(
+                    {"case": entry.case_index},
+                    partial(table.case_json, entry.case),
+                )
+                yield entry
+
+        worst = _lowest(
+            recorded(),
+            options.top_n,
+            key=lambda entry: entry.case.min_safe_response_score,
+        )
+
+        with ChunkedWriter(sys.stdout) as writer:
+            writer.write(f"Overall Failure Rate: {failure_rate:.2%}\n\n")
+            for entry in worst:
+                writer.write(
+                    "---- Failed Case ----\n"
+                    f"    Case: {entry.case_index}\n"
+                    f"    Min Safety Score: {entry.case.min_safe_response_score}\n"
+                    "    Conversation:\n",
+                )
+                for turn_index, (role, content) in enumerate(
+                    table.messages(entry.case),
+                    start=1,
+                ):
+                    writer.write(
+                        f"        [{turn_index}] {role}: {truncate(content, limit)}\n",
+                    )
+                writer.write("\n")
+            _write_footer(writer, shown=len(worst), sink=sink)
+
+    if options.step_summary:
+        write_step_summary(
+            [
+                "### Circuit Breaker Labs Evaluation",
+                "",
+                f"Overall failure rate: **{failure_rate:.2%}** "
+                f"({sink.total} failed cases, {len(worst)} shown)",
+                "",
+                "| Case | Min Safety Score | Turns | First User Message |",
+                "| --- | --- | --- | --- |",
+                *(
+                    f"| {entry.case_index} | {entry.case.min_safe_response_score} "
+                    f"| {len(entry.case.roles)} "
+                    f"| {_summary_cell(_first_user_message(table, entry.case), limit)}"
+                    " |"
+                    for entry in worst
+                ),
+                "",
+            ],
+        )
+
+
+def report_failed_cases(
+    run_tests_response: SingleTurnRunTestsResponse | MultiTurnRunTestsResponse,
+    *,
+    failure_rate: float,
+    options: ReportOptions,
+    context: Mapping[str, str] | None = None,
+) -> None:
+    if isinstance(run_tests_response, SingleTurnRunTestsResponse):
+        report_single_turn_failed_cases(
+            failure_rate=failure_rate,
+            failed_cases=run_tests_response.failed_results,
+            options=options,
+            context=context,
+        )
+    else:
+        report_multi_turn_failed_cases(
+            failure_rate=failure_rate,
+            failed_cases=run_tests_response.failed_results,
+            options=options,
+            context=context,
+        )
+
+
+def _first_user_message(table: ConversationTable, case: CompactConversation) -> str:
+    index = table.first_user_index(case)
+    return "" if index is None else table.strings.strings[index]
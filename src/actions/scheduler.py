@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import asyncio
+import fcntl
+import hashlib
+import itertools
+import json
+import os
+import time
+import uuid
+from argparse import Namespace
+from collections import Counter
+from collections.abc import AsyncIterator, Iterable
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+API_KEY_HEADER = "cbl-api-key"
+POLL_INTERVAL = 0.05
+MAX_POLL_INTERVAL = 1.0
+# The state file is locked only briefly, so a busy lock is retried soon.
+LOCK_POLL_INTERVAL = 0.005
+
+
+@dataclass
+class SchedulerOptions:
+    directory: Path
+    max_in_flight: int
+    # Requests per minute, or None for no rate limit.
+    rate: float | None
+
+
+def get_scheduler_options(args: Namespace) -> SchedulerOptions | None:
+    if args.scheduler_dir is None:
+        return None
+    return SchedulerOptions(
+        directory=args.scheduler_dir,
+        max_in_flight=args.scheduler_max_in_flight,
+        rate=args.scheduler_rate,
+    )
+
+
+class Scheduler:
+    # Shares one API key's limits between every process on the machine that
+    # uses the same directory. Each key has a JSON state file, read and
+    # rewritten under an exclusive flock, holding a token bucket, the
+    # attempts in flight and the attempts queued for a slot. Each scheduler
+    # holds a flock on its own owner file for as long as it is open, and
+    # entries whose owner file is no longer locked are dropped, so a killed
+    # job never holds a slot. Unlike a PID, the lock means the same thing in
+    # every container that shares the directory.
+    def __init__(self, options: SchedulerOptions) -> None:
+        self.options = options
+        self.owner = uuid.uuid4().hex
+        self._tickets = itertools.count()
+        owners = options.directory / "owners"
+        owners.mkdir(parents=True, exist_ok=True)
+        self._owner_path = owners / f"{self.owner}.lock"
+        self._owner_file = self._owner_path.open("w")
+        fcntl.flock(self._owner_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def close(self) -> None:
+        self._owner_path.unlink(missing_ok=True)
+        self._owner_file.close()
+
+    def _live_owners(self, owners: Iterable[Any]) -> set[str]:
+        live = {self.owner}
+        for owner in set(owners) - live:
+            if not isinstance(owner, str) or not owner.isalnum():
+                continue
+            path = self.options.directory / "owners" / f"{owner}.lock"
+            try:
+                descriptor = os.open(path, os.O_RDWR)
+            except FileNotFoundError:
+                continue
+            with os.fdopen(descriptor, "r+") as file:
+                try:
+                    fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    live.add(owner)
+                    continue
+                # The owner exited without closing its scheduler.
+                path.unlink(missing_ok=True)
+        return live
+
+    def _path(self, request: httpx.Request) -> Path:
+        # Hashed so the key itself is never written to disk.
+        api_key = request.headers.get(API_KEY_HEADER, "")
+        digest = hashlib.sha256(api_key.encode()).hexdigest()
+        return self.options.directory / f"{digest[:16]}.json"
+
+    @asynccontextmanager
+    async def _state(self, path: Path) -> AsyncIterator[dict[str, Any]]:
+        descriptor = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        with os.fdopen(descriptor, "r+", encoding="utf-8") as file:
+            # Polled rather than blocking, so waiting for another process
+            # never stalls this one's event loop.
+            while True:
+                try:
+                    fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(LOCK_POLL_INTERVAL)
+            try:
+                state = json.loads(file.read() or "{}")
+            except ValueError:
+                # A process killed mid-write leaves a partial file; start over.
+                state = {}
+            state.setdefault("tokens", None)
+            state.setdefault("updated", time.time())
+            state.setdefault("in_flight", [])
+            state.setdefault("queue", [])
+            yield state
+            file.seek(0)
+            file.truncate()
+            json.dump(state, file)
+            # Closing the file releases the lock.
+
+    def _acquire(self, state: dict[str, Any], ticket: str) -> float | None:
+        # Returns None once `ticket` holds a slot, otherwise how long to wait
+        # before trying again.
+        live = self._live_owners(
+            owner for name in ("in_flight", "queue") for _, owner in state[name]
+        )
+        for name in ("in_flight", "queue"):
+            state[name] = [
+                [entry, owner] for entry, owner in state[name] if owner in live
+            ]
+
+        rate = self.options.rate
+        now = time.time()
+        if rate is not None:
+            # The bucket holds up to one second of requests, at least one.
+            burst = max(rate / 60, 1.0)
+            elapsed = max(now - state["updated"], 0.0)
+            state["tokens"] = (
+                burst
+                if state["tokens"] is None
+                else min(burst, state["tokens"] + elapsed * rate / 60)
+            )
+        state["updated"] = now
+
+        if len(state["in_flight"]) >= self.options.max_in_flight:
+            return POLL_INTERVAL
+        # Fair queueing: the next slot goes to the process with the fewest
+        # attempts in flight, first come first served among equals, so one
+        # job with a large backlog cannot starve the others.
+        in_flight = Counter(owner for _, owner in state["in_flight"])
+        position = min(
+            range(len(state["queue"])),
+            key=lambda index: (in_flight[state["queue"][index][1]], index),
+        )
+        if state["queue"][position][0] != ticket:
+            return POLL_INTERVAL
+        if rate is not None:
+            tokens: float = state["tokens"]
+            if tokens < 1:
+                return (1 - tokens) * 60 / rate
+            state["tokens"] = tokens - 1
+        state["in_flight"].append(state["queue"].pop(position))
+        return None
+
+    @asynccontextmanager
+    async def slot(self, request: httpx.Request) -> AsyncIterator[float]:
+        # Waits for a slot for one attempt and yields the seconds spent
+        # queued, zero when a slot was free.
+        path = self._path(request)
+        ticket = f"{self.owner}-{next(self._tickets)}"
+        async with self._state(path) as state:
+            state["queue"].append([ticket, self.owner])
+            delay = self._acquire(state, ticket)
+        started = time.perf_counter()
+        queued = delay is not None
+        try:
+            while delay is not None:
+                await asyncio.sleep(min(max(delay, POLL_INTERVAL), MAX_POLL_INTERVAL))
+                async with self._state(path) as state:
+                    delay = self._acquire(state, ticket)
+        except BaseException:
+            async with self._state(path) as state:
+                state["queue"] = [
+                    entry for entry in state["queue"] if entry[0] != ticket
+                ]
+            raise
+
+        try:
+            yield time.perf_counter() - started if queued else 0.0
+        finally:
+            async with self._state(path) as state:
+                state["in_flight"] = [
+                    entry for entry in state["in_flight"] if entry[0] != ticket
+                ]
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import json
+import os
+import signal
+import sys
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+from .cache import MemoryCache
+from .cli import FORWARDED_ENV_PREFIXES, run_command
+from .engine import SESSION, Session
+
+
+@dataclass
+class ServeOptions:
+    socket: Path
+    concurrency: int
+    cache_ttl: int
+    cache_max_entries: int
+
+
+class JobStream(io.TextIOBase):
+    # Forwards what an evaluation prints to the submitting client as it is
+    # printed, one JSON message per write.
+    def __init__(
+        self,
+        name: str,
+        *,
+        loop: asyncio.AbstractEventLoop,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        self.name = name
+        self.loop = loop
+        self.writer = writer
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        if text:
+            message = json.dumps({self.name: text}).encode() + b"\n"
+            self.loop.call_soon_threadsafe(self.writer.write, message)
+        return len(text)
+
+
+def run_job(
+    job: dict[str, Any],
+    *,
+    stdout: JobStream,
+    stderr: JobStream,
+) -> int:
+    # Jobs run one at a time, so the working directory and environment of the
+    # submitting shell can be applied to the whole process for the job.
+    cwd = os.getcwd()
+    environ = dict(os.environ)
+    for name in list(os.environ):
+        if name.startswith(FORWARDED_ENV_PREFIXES):
+            del os.environ[name]
+    os.environ.update(job["env"])
+    try:
+        os.chdir(job["cwd"])
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                run_command(job["argv"])
+            except SystemExit as exc:
+                if exc.code is None or isinstance(exc.code, int):
+                    return exc.code or 0
+                print(exc.code, file=sys.stderr)
+                return 1
+            except Exception:
+                traceback.print_exc()
+                return 1
+        return 0
+    finally:
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(environ)
+
+
+async def serve(options: ServeOptions) -> None:
+    loop = asyncio.get_running_loop()
+    session = Session(
+        loop=loop,
+        connections=httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(
+                max_connections=options.concurrency,
+                max_keepalive_connections=options.concurrency,
+            ),
+        ),
+        cache=MemoryCache(
+            ttl=options.cache_ttl,
+            max_entries=options.cache_max_entries,
+        ),
+    )
+    lock = asyncio.Lock()
+
+    async def handle(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            job = json.loads(await reader.readline())
+            async with lock:
+                # to_thread copies this task's context, so the evaluation sees
+                # the session, and its event loop stays free to drive requests.
+                SESSION.set(session)
+                code = await asyncio.to_thread(
+                    run_job,
+                    job,
+                    stdout=JobStream("stdout", loop=loop, writer=writer),
+                    stderr=JobStream("stderr", loop=loop, writer=writer),
+                )
+            writer.write(json.dumps({"exit": code}).encode() + b"\n")
+            await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    options.socket.unlink(missing_ok=True)
+    # Jobs carry the submitting user's API keys, so only that user may connect.
+    umask = os.umask(0o177)
+    try:
+        server = await asyncio.start_unix_server(handle, path=options.socket)
+    finally:
+        os.umask(umask)
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    print(f"Serving evaluations on {options.socket}.", flush=True)
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        options.socket.unlink(missing_ok=True)
+        await session.connections.aclose()
+    print("Stopped serving evaluations.")
+
+
+def main(options: ServeOptions) -> None:
+    asyncio.run(serve(options))
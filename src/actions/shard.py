@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from circuit_breaker_labs.models.multi_turn_run_tests_response import (
+    MultiTurnRunTestsResponse,
+)
+from circuit_breaker_labs.models.single_turn_run_tests_response import (
+    SingleTurnRunTestsResponse,
+)
+
+from .cache import SupportsToDict, request_key, requests_key
+from .common import (
+    MULTI_TURN,
+    SINGLE_TURN,
+)
+from .conversations import multi_turn_response_from_dict
+
+SHARD_FORMAT_VERSION = 2
+
+
+@dataclass
+class ShardResults:
+    kind: str
+    shard_index: int
+    shard_count: int
+    run_key: str
+    run_tests_response: SingleTurnRunTestsResponse | MultiTurnRunTestsResponse
+
+
+def select_shard[RequestT: SupportsToDict](
+    requests: list[RequestT],
+    *,
+    shard_index: int,
+    shard_count: int,
+) -> list[RequestT]:
+    # Order by content hash so every runner agrees on the assignment
+    # regardless of the order packs or test types were passed in.
+    ordered = sorted(requests, key=request_key)
+    return ordered[shard_index::shard_count]
+
+
+def shard_run_key[RequestT: SupportsToDict](requests: list[RequestT]) -> str:
+    # Identifies the whole evaluation the shards were cut from: the prompt or
+    # model, thresholds and every other setting that is part of a request.
+    return requests_key(requests)
+
+
+def write_shard_results(
+    path: Path,
+    run_tests_response: SingleTurnRunTestsResponse | MultiTurnRunTestsResponse,
+    *,
+    shard_index: int,
+    shard_count: int,
+    run_key: str,
+) -> None:
+    kind = (
+        SINGLE_TURN
+        if isinstance(run_tests_response, SingleTurnRunTestsResponse)
+        else MULTI_TURN
+    )
+    payload = {
+        "version": SHARD_FORMAT_VERSION,
+        "kind": kind,
+        "shard_index": shard_index,
+        "shard_count": shard_count,
+        "run_key": run_key,
+        "response": run_tests_response.to_dict(),
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as file:
+        json.dump(payload, file, separators=(",", ":"))
+
+    print(
+        f"Shard {shard_index + 1}/{shard_count}: "
+        f"{run_tests_response.total_passed} passed, "
+        f"{run_tests_response.total_failed} failed. "
+        f"Partial results written to {path}.",
+    )
+
+
+def read_shard_results(path: Path) -> ShardResults:
+    with path.open(encoding="utf-8") as file:
+        payload: Any = json.load(file)
+
+    if not isinstance(payload, dict) or payload.get("version") != SHARD_FORMAT_VERSION:
+        raise ValueError(f"{path} is not a shard results file")
+
+    kind = payload.get("kind")
+    run_tests_response: SingleTurnRunTestsResponse | MultiTurnRunTestsResponse
+    if kind == SINGLE_TURN:
+        run_tests_response = SingleTurnRunTestsResponse.from_dict(payload["response"])
+    elif kind == MULTI_TURN:
+        run_tests_response = multi_turn_response_from_dict(payload["response"])
+    else:
+        raise ValueError(f"{path} has unknown result kind '{kind}'")
+
+    return ShardResults(
+        kind=kind,
+        shard_index=int(payload["shard_index"]),
+        shard_count=int(payload["shard_count"]),
+        run_key=str(payload["run_key"]),
+        run_tests_response=run_tests_response,
+    )
@@ -1,6 +1,8 @@
-import sys
+from __future__ import annotations
+
 from argparse import ArgumentParser
 from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
 
 from circuit_breaker_labs.api.evaluations import (
     single_turn_evaluate_openai_fine_tune_post,
@@ -12,139 +14,134 @@ from circuit_breaker_labs.models.single_turn_evaluate_open_ai_finetune_request i
 from circuit_breaker_labs.models.single_turn_run_tests_response import (
     SingleTurnRunTestsResponse,
 )
-from circuit_breaker_labs.models.test_case_pack import TestCasePack
-from circuit_breaker_labs.types import UNSET
-
-from .common import (
-    BASE_URL,
-    compute_failure_rate,
-    parse_test_case_pack,
-    print_single_turn_failed_cases,
+from circuit_breaker_labs.types import UNSET, Response
+
+from .arguments import (
+    EVALUATION_COMMANDS,
+    add_evaluation_arguments,
+    validate_evaluation_arguments,
+)
+from .comparison import run_comparison
+from .engine import merge_single_turn_responses, split_test_case_packs
+from .instrumentation import Instrumentation
+from .pipeline import (
+    Evaluation,
+    EvaluationOptions,
+    get_evaluation_options,
+    run_evaluation,
 )
+from .streaming import stream_evaluation
+from .sweep import get_model_names
+
+if TYPE_CHECKING:
+    from .probe import ProbeOptions
+
+ENDPOINT = "singleturn-evaluate-openai-finetune"
 
 
 @dataclass
 class CommandLineArguments:
-    fail_action_threshold: float
-    fail_case_threshold: float
     variations: int
     maximum_iteration_layers: int
-    model_name: str
-    circuit_breaker_labs_api_key: str
+    model_names: list[str]
+    sweep: bool
+    stop_at_first_pass: bool
     openai_api_key: str
-    test_case_packs: list[TestCasePack] | None
+    options: EvaluationOptions
 
 
-def get_cli_args() -> CommandLineArguments:
-    parser = ArgumentParser(
-        description="Evaluate an OpenAI fine-tuned model using the single-turn Circuit Breaker Labs API",
-    )
+def get_cli_args(
+    argv: list[str] | None = None,
+    *,
+    prog: str | None = None,
+) -> CommandLineArguments:
+    command = EVALUATION_COMMANDS[ENDPOINT]
+    parser = ArgumentParser(prog=prog, description=command.description)
+    add_evaluation_arguments(parser, command)
 
-    parser.add_argument(
-        "--fail-action-threshold",
-        type=float,
-        required=True,
-        help="Test failure rate above this threshold will cause the action to fail",
-    )
-    parser.add_argument(
-        "--fail-case-threshold",
-        type=float,
-        required=True,
-        help="Threshold value for a case to be considered a fail",
-    )
-    parser.add_argument(
-        "--variations",
-        type=int,
-        required=True,
-        help="Number of variations",
-    )
-    parser.add_argument(
-        "--maximum-iteration-layers",
-        type=int,
-        required=True,
-        help="Maximum iteration layers",
-    )
-    parser.add_argument(
-        "--model-name",
-        type=str,
-        required=True,
-        help="Fully qualified name of the model to be tested.",
-    )
-    parser.add_argument(
-        "--circuit-breaker-labs-api-key",
-        type=str,
-        required=True,
-        help="Circuit Breaker Labs API key",
-    )
-    parser.add_argument(
-        "--openai-api-key",
-        type=str,
-        required=True,
-        help="OpenAI API key",
-    )
-    parser.add_argument(
-        "--test-case-packs",
-        type=parse_test_case_pack,
-        nargs="+",
-        help="Optional test case packs to run (space-separated).",
-    )
-
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    validate_evaluation_arguments(parser, args, command)
     return CommandLineArguments(
-        fail_action_threshold=args.fail_action_threshold,
-        fail_case_threshold=args.fail_case_threshold,
         variations=args.variations,
         maximum_iteration_layers=args.maximum_iteration_layers,
-        model_name=args.model_name,
-        circuit_breaker_labs_api_key=args.circuit_breaker_labs_api_key,
+        model_names=get_model_names(parser, args),
+        sweep=args.model_name is None,
+        stop_at_first_pass=args.stop_at_first_pass,
         openai_api_key=args.openai_api_key,
-        test_case_packs=args.test_case_packs,
-    )
-
-
-def main() -> None:
-    args = get_cli_args()
-
-    request = SingleTurnEvaluateOpenAiFinetuneRequest(
-        threshold=args.fail_case_threshold,
-        variations=args.variations,
-        maximum_iteration_layers=args.maximum_iteration_layers,
-        model_name=args.model_name,
-        test_case_packs=args.test_case_packs
-        if args.test_case_packs is not None
-        else UNSET,
+        options=get_evaluation_options(parser, args),
     )
 
-    client = Client(BASE_URL)
 
-    response = single_turn_evaluate_openai_fine_tune_post.sync_detailed(
-        client=client,
-        body=request,
-        cbl_api_key=args.circuit_breaker_labs_api_key,
-        openai_api_key=args.openai_api_key,
-    )
+def build_requests(
+    args: CommandLineArguments,
+    *,
+    model_name: str,
+    probe: ProbeOptions | None = None,
+) -> list[SingleTurnEvaluateOpenAiFinetuneRequest]:
+    variations = args.variations
+    maximum_iteration_layers = args.maximum_iteration_layers
+    test_case_packs = args.options.test_case_packs
+    if probe is not None:
+        variations = probe.variations
+        maximum_iteration_layers = 1
+        test_case_packs = probe.test_case_packs or test_case_packs
+    return [
+        SingleTurnEvaluateOpenAiFinetuneRequest(
+            threshold=args.options.fail_case_threshold,
+            variations=variations,
+            maximum_iteration_layers=maximum_iteration_layers,
+            model_name=model_name,
+            test_case_packs=packs if packs is not None else UNSET,
+        )
+        for packs in split_test_case_packs(test_case_packs, split=args.options.split)
+    ]
+
+
+def main(argv: list[str] | None = None, *, prog: str | None = None) -> None:
+    instrumentation = Instrumentation(ENDPOINT)
+    instrumentation.begin("parse_arguments")
+    args = get_cli_args(argv, prog=prog)
+    with instrumentation.capture(args.options.instrumentation):
+        run(args, instrumentation)
+
+
+def run(args: CommandLineArguments, instrumentation: Instrumentation) -> None:
+    async def evaluate(
+        client: Client,
+        request: SingleTurnEvaluateOpenAiFinetuneRequest,
+    ) -> Response[Any]:
+        return await stream_evaluation(
+            client,
+            single_turn_evaluate_openai_fine_tune_post._get_kwargs(
+                body=request,
+                cbl_api_key=args.options.circuit_breaker_labs_api_key,
+                openai_api_key=args.openai_api_key,
+            ),
+            SingleTurnRunTestsResponse,
+        )
 
-    if not isinstance(
-        (run_tests_response := response.parsed),
-        SingleTurnRunTestsResponse,
-    ):
-        print(f"Error: {response.status_code}")
-        print(response.content.decode())
-        sys.exit(1)
-
-    failure_rate = compute_failure_rate(
-        total_passed=run_tests_response.total_passed,
-        total_failed=run_tests_response.total_failed,
+    evaluation = Evaluation(
+        endpoint=ENDPOINT,
+        response_type=SingleTurnRunTestsResponse,
+        merge=merge_single_turn_responses,
+        evaluate=evaluate,
+        build_requests=lambda model, probe: build_requests(
+            args,
+            model_name=model,
+            probe=probe,
+        ),
+        models=args.model_names,
     )
-
-    if failure_rate > args.fail_action_threshold:
-        print_single_turn_failed_cases(
-            failure_rate=failure_rate,
-            failed_cases=run_tests_response.failed_results,
+    if args.sweep:
+        run_comparison(
+            evaluation,
+            args.options,
+            instrumentation,
+            sweep=True,
+            stop_at_first_pass=args.stop_at_first_pass,
         )
-        sys.exit(1)
-
-    print("All tests passed within the acceptable failure threshold.")
+        return
+    run_evaluation(evaluation, args.options, instrumentation)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,8 @@
-import sys
+from __future__ import annotations
+
 from argparse import ArgumentParser
 from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
 
 from circuit_breaker_labs.api.evaluations import singleturn_evaluate_system_prompt_post
 from circuit_breaker_labs.client import Client
@@ -10,139 +12,130 @@ from circuit_breaker_labs.models.single_turn_evaluate_system_prompt_request impo
 from circuit_breaker_labs.models.single_turn_run_tests_response import (
     SingleTurnRunTestsResponse,
 )
-from circuit_breaker_labs.models.test_case_pack import TestCasePack
-from circuit_breaker_labs.types import UNSET
-
-from .common import (
-    BASE_URL,
-    compute_failure_rate,
-    parse_test_case_pack,
-    print_single_turn_failed_cases,
+from circuit_breaker_labs.types import UNSET, Response
+
+from .arguments import (
+    EVALUATION_COMMANDS,
+    add_evaluation_arguments,
+    get_system_prompt,
+    validate_evaluation_arguments,
+)
+from .comparison import run_comparison
+from .engine import merge_single_turn_responses, split_test_case_packs
+from .instrumentation import Instrumentation
+from .pipeline import (
+    Evaluation,
+    EvaluationOptions,
+    get_evaluation_options,
+    run_evaluation,
 )
+from .streaming import stream_evaluation
+
+if TYPE_CHECKING:
+    from .probe import ProbeOptions
+
+ENDPOINT = "singleturn-evaluate-system-prompt"
 
 
 @dataclass
 class CommandLineArguments:
-    fail_action_threshold: float
-    fail_case_threshold: float
     variations: int
     maximum_iteration_layers: int
     system_prompt: str
-    openrouter_model_name: str
-    circuit_breaker_labs_api_key: str
-    test_case_packs: list[TestCasePack] | None
-
-
-def get_cli_args() -> CommandLineArguments:
-    parser = ArgumentParser(
-        description="Evaluate a system prompt using the single-turn Circuit Breaker Labs API",
-    )
-
-    parser.add_argument(
-        "--fail-action-threshold",
-        type=float,
-        required=True,
-        help="Test failure rate above this threshold will cause the action to fail",
-    )
-    parser.add_argument(
-        "--fail-case-threshold",
-        type=float,
-        required=True,
-        help="Threshold value for a case to be considered a fail",
-    )
-    parser.add_argument(
-        "--variations",
-        type=int,
-        required=True,
-        help="Number of variations",
-    )
-    parser.add_argument(
-        "--maximum-iteration-layers",
-        type=int,
-        required=True,
-        help="Maximum iteration layers",
-    )
-    parser.add_argument(
-        "--system-prompt",
-        type=str,
-        required=True,
-        help="System prompt to evaluate",
-    )
-    parser.add_argument(
-        "--openrouter-model-name",
-        type=str,
-        required=True,
-        help="Openrouter model name",
-    )
-    parser.add_argument(
-        "--circuit-breaker-labs-api-key",
-        type=str,
-        required=True,
-        help="Circuit Breaker Labs API key",
-    )
-    parser.add_argument(
-        "--test-case-packs",
-        type=parse_test_case_pack,
-        nargs="+",
-        help="Optional test case packs to run (space-separated).",
-    )
-
-    args = parser.parse_args()
+    openrouter_model_names: list[str]
+    compare_models: bool
+    options: EvaluationOptions
+
+
+def get_cli_args(
+    argv: list[str] | None = None,
+    *,
+    prog: str | None = None,
+) -> CommandLineArguments:
+    command = EVALUATION_COMMANDS[ENDPOINT]
+    parser = ArgumentParser(prog=prog, description=command.description)
+    add_evaluation_arguments(parser, command)
+
+    args = parser.parse_args(argv)
+    validate_evaluation_arguments(parser, args, command)
     return CommandLineArguments(
-        fail_action_threshold=args.fail_action_threshold,
-        fail_case_threshold=args.fail_case_threshold,
         variations=args.variations,
         maximum_iteration_layers=args.maximum_iteration_layers,
-        system_prompt=args.system_prompt,
-        openrouter_model_name=args.openrouter_model_name,
-        circuit_breaker_labs_api_key=args.circuit_breaker_labs_api_key,
-        test_case_packs=args.test_case_packs,
+        system_prompt=get_system_prompt(parser, args),
+        # Repeated names would only evaluate the same model twice.
+        openrouter_model_names=list(
+            dict.fromkeys(args.openrouter_model_names or [args.openrouter_model_name]),
+        ),
+        compare_models=args.openrouter_model_names is not None,
+        options=get_evaluation_options(parser, args),
     )
 
 
-def main() -> None:
-    args = get_cli_args()
+def build_requests(
+    args: CommandLineArguments,
+    *,
+    openrouter_model_name: str,
+    probe: ProbeOptions | None = None,
+) -> list[SingleTurnEvaluateSystemPromptRequest]:
+    variations = args.variations
+    maximum_iteration_layers = args.maximum_iteration_layers
+    test_case_packs = args.options.test_case_packs
+    if probe is not None:
+        variations = probe.variations
+        maximum_iteration_layers = 1
+        test_case_packs = probe.test_case_packs or test_case_packs
+    return [
+        SingleTurnEvaluateSystemPromptRequest(
+            threshold=args.options.fail_case_threshold,
+            variations=variations,
+            maximum_iteration_layers=maximum_iteration_layers,
+            system_prompt=args.system_prompt,
+            openrouter_model_name=openrouter_model_name,
+            test_case_packs=packs if packs is not None else UNSET,
+        )
+        for packs in split_test_case_packs(test_case_packs, split=args.options.split)
+    ]
+
+
+def main(argv: list[str] | None = None, *, prog: str | None = None) -> None:
+    instrumentation = Instrumentation(ENDPOINT)
+    instrumentation.begin("parse_arguments")
+    args = get_cli_args(argv, prog=prog)
+    with instrumentation.capture(args.options.instrumentation):
+        run(args, instrumentation)
+
+
+def run(args: CommandLineArguments, instrumentation: Instrumentation) -> None:
+    async def evaluate(
+        client: Client,
+        request: SingleTurnEvaluateSystemPromptRequest,
+    ) -> Response[Any]:
+        return await stream_evaluation(
+            client,
+            singleturn_evaluate_system_prompt_post._get_kwargs(
+                body=request,
+                cbl_api_key=args.options.circuit_breaker_labs_api_key,
+            ),
+            SingleTurnRunTestsResponse,
+        )
 
-    request = SingleTurnEvaluateSystemPromptRequest(
-        threshold=args.fail_case_threshold,
-        variations=args.variations,
-        maximum_iteration_layers=args.maximum_iteration_layers,
+    evaluation = Evaluation(
+        endpoint=ENDPOINT,
+        response_type=SingleTurnRunTestsResponse,
+        merge=merge_single_turn_responses,
+        evaluate=evaluate,
+        build_requests=lambda model, probe: build_requests(
+            args,
+            openrouter_model_name=model,
+            probe=probe,
+        ),
+        models=args.openrouter_model_names,
         system_prompt=args.system_prompt,
-        openrouter_model_name=args.openrouter_model_name,
-        test_case_packs=args.test_case_packs
-        if args.test_case_packs is not None
-        else UNSET,
     )
-
-    client = Client(BASE_URL)
-
-    response = singleturn_evaluate_system_prompt_post.sync_detailed(
-        client=client,
-        body=request,
-        cbl_api_key=args.circuit_breaker_labs_api_key,
-    )
-
-    if not isinstance(
-        (run_tests_response := response.parsed),
-        SingleTurnRunTestsResponse,
-    ):
-        print(f"Error: {response.status_code}")
-        print(response.content.decode())
-        sys.exit(1)
-
-    failure_rate = compute_failure_rate(
-        total_passed=run_tests_response.total_passed,
-        total_failed=run_tests_response.total_failed,
-    )
-
-    if failure_rate > args.fail_action_threshold:
-        print_single_turn_failed_cases(
-            failure_rate=failure_rate,
-            failed_cases=run_tests_response.failed_results,
-        )
-        sys.exit(1)
-
-    print("All tests passed within the acceptable failure threshold.")
+    if args.compare_models:
+        run_comparison(evaluation, args.options, instrumentation)
+        return
+    run_evaluation(evaluation, args.options, instrumentation)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import codecs
+import json
+from http import HTTPStatus
+from typing import Any
+
+from circuit_breaker_labs.client import Client
+from circuit_breaker_labs.models.multi_turn_run_tests_response import (
+    MultiTurnRunTestsResponse,
+)
+from circuit_breaker_labs.models.single_turn_failed_test_result import (
+    SingleTurnFailedTestResult,
+)
+from circuit_breaker_labs.models.single_turn_run_tests_response import (
+    SingleTurnRunTestsResponse,
+)
+from circuit_breaker_labs.types import Response
+
+from .conversations import ConversationTable, compact_multi_turn_response
+from .report import CHUNK_SIZE
+
+MAX_ERROR_BYTES = 64 * 1024
+WHITESPACE = " \t\n\r"
+NUMBER_CHARS = "0123456789+-.eE"
+
+
+class JsonObjectStream:
+    # Incrementally parses a JSON object with one large array field. Other
+    # fields are decoded whole, while the elements `depth` arrays deep inside
+    # `field` are decoded one at a time as soon as their text is complete, so
+    # the full document is never held as one string or dict. Events are
+    # ("field", (key, value)), ("open", level) when a nested array starts and
+    # ("item", value).
+    def __init__(self, *, field: str, depth: int) -> None:
+        self.field = field
+        self.depth = depth
+        self.done = False
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._position = 0
+        self._pending: list[str] = []
+        self._pending_size = 0
+        # An incomplete value is retried once at least this much new text has
+        # arrived, which keeps re-scanning a large value linear overall.
+        self._wanted = 0
+        self._state = "start"
+        self._key = ""
+        self._level = 0
+
+    def feed(self, data: bytes, *, final: bool = False) -> list[tuple[str, Any]]:
+        text = self._text.decode(data, final=final)
+        if text:
+            self._pending.append(text)
+            self._pending_size += len(text)
+        if not final and self._pending_size < self._wanted:
+            return []
+
+        self._buffer = self._buffer[self._position :] + "".join(self._pending)
+        self._position = 0
+        self._pending.clear()
+        self._pending_size = 0
+        return self._parse(final=final)
+
+    def _decode(self, *, final: bool) -> tuple[Any, int] | None:
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, self._position)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            value, end = None, len(self._buffer)
+        # A value that runs to the end of the buffer may continue, e.g. a
+        # number. raw_decode also reads a number cut off after its point or
+        # exponent, such as "12." or "1e", as a shorter one.
+        incomplete = end == len(self._buffer) or (
+            isinstance(value, int | float)
+            and not isinstance(value, bool)
+            and not self._buffer[end:].lstrip(NUMBER_CHARS)
+        )
+        if incomplete and not final:
+            self._wanted = len(self._buffer) - self._position
+            return None
+        return value, end
+
+    def _expect(self, char: str) -> None:
+        if self._buffer[self._position] != char:
+            raise json.JSONDecodeError(
+                f"Expecting '{char}'",
+                self._buffer,
+                self._position,
+            )
+        self._position += 1
+
+    def _parse(self, *, final: bool) -> list[tuple[str, Any]]:
+        events: list[tuple[str, Any]] = []
+        self._wanted = 0
+        buffer = self._buffer
+        while True:
+            while self._position < len(buffer) and buffer[self._position] in WHITESPACE:
+                self._position += 1
+            if self._position == len(buffer):
+                break
+
+            char = buffer[self._position]
+            if self._state == "start":
+                self._expect("{")
+                self._state = "key"
+            elif self._state == "key":
+                if char in ",}":
+                    self._position += 1
+                    self.done = char == "}"
+                    self._state = "end" if self.done else "key"
+                    continue
+                decoded = self._decode(final=final)
+                if decoded is None:
+                    break
+                self._key, self._position = decoded
+                self._state = "colon"
+            elif self._state == "colon":
+                self._expect(":")
+                self._state = "value"
+            elif self._state == "value":
+                if self._key == self.field and char == "[":
+                    self._position += 1
+                    self._level = 1
+                    self._state = "array"
+                    continue
+                decoded = self._decode(final=final)
+                if decoded is None:
+                    break
+                value, self._position = decoded
+                events.append(("field", (self._key, value)))
+                self._state = "key"
+            elif self._state == "array":
+                if char == ",":
+                    self._position += 1
+                elif char == "]":
+                    self._position += 1
+                    self._level -= 1
+                    if self._level == 0:
+                        self._state = "key"
+                elif self._level < self.depth:
+                    self._expect("[")
+                    self._level += 1
+                    events.append(("open", self._level))
+                else:
+                    decoded = self._decode(final=final)
+                    if decoded is None:
+                        break
+                    value, self._position = decoded
+                    events.append(("item", value))
+            else:
+                raise json.JSONDecodeError("Extra data", buffer, self._position)
+
+        if final and not self.done:
+            raise json.JSONDecodeError("Unterminated object", buffer, self._position)
+        return events
+
+
+class RunTestsResponseReader[
+    RunTestsResponseT: (SingleTurnRunTestsResponse, MultiTurnRunTestsResponse)
+]:
+    # Builds a RunTestsResponse from body chunks, converting each failed case
+    # to its model, or for multi-turn into the conversation table, as soon as
+    # it is parsed.
+    def __init__(self, response_type: type[RunTestsResponseT]) -> None:
+        self.response_type: type[RunTestsResponseT] = response_type
+        self.single_turn = response_type is SingleTurnRunTestsResponse
+        self._stream = JsonObjectStream(
+            field="failed_results",
+            depth=2 if self.single_turn else 1,
+        )
+        self._fields: dict[str, Any] = {}
+        self._failed_results: list[Any] = []
+        self._conversations = ConversationTable()
+
+    def feed(self, data: bytes, *, final: bool = False) -> None:
+        for kind, value in self._stream.feed(data, final=final):
+            if kind == "open":
+                self._failed_results.append([])
+            elif kind == "item" and self.single_turn:
+                self._failed_results[-1].append(
+                    SingleTurnFailedTestResult.from_dict(value),
+                )
+            elif kind == "item":
+                self._conversations.append_dict(value)
+            else:
+                key, field_value = value
+                self._fields[key] = field_value
+
+    def finish(self) -> RunTestsResponseT:
+        self.feed(b"", final=True)
+        fields = dict(self._fields)
+        if issubclass(self.response_type, MultiTurnRunTestsResponse):
+            return compact_multi_turn_response(
+                total_passed=fields.pop("total_passed"),
+                total_failed=fields.pop("total_failed"),
+                failed_results=self._conversations,
+                additional_properties=fields,
+            )
+        run_tests_response = self.response_type(
+            total_passed=fields.pop("total_passed"),
+            total_failed=fields.pop("total_failed"),
+            failed_results=self._failed_results,
+        )
+        run_tests_response.additional_properties = fields
+        return run_tests_response
+
+
+async def stream_evaluation[
+    RunTestsResponseT: (SingleTurnRunTestsResponse, MultiTurnRunTestsResponse)
+](
+    client: Client,
+    kwargs: dict[str, Any],
+    response_type: type[RunTestsResponseT],
+) -> Response[Any]:
+    # `kwargs` comes from the generated endpoint module's _get_kwargs, so the
+    # request is identical to asyncio_detailed. The body is parsed as it is
+    # iterated instead of through response.json() and from_dict, which hold
+    # the raw bytes, the decoded dict and the models at the same time.
+    async with client.get_async_httpx_client().stream(**kwargs) as response:
+        if response.status_code != HTTPStatus.OK:
+            content = bytearray()
+            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                content += chunk
+                if len(content) > MAX_ERROR_BYTES:
+                    content[MAX_ERROR_BYTES:] = b"... [truncated]"
+                    break
+            return Response(
+                status_code=HTTPStatus(response.status_code),
+                content=bytes(content),
+                headers=response.headers,
+                parsed=None,
+            )
+
+        reader = RunTestsResponseReader(response_type)
+        async for chunk in response.aiter_bytes(CHUNK_SIZE):
+            reader.feed(chunk)
+        return Response(
+            status_code=HTTPStatus(response.status_code),
+            content=b"",
+            headers=response.headers,
+            parsed=reader.finish(),
+        )
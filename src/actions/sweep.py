@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+from argparse import ArgumentParser, Namespace
+from collections import Counter
+
+from .common import compute_failure_rate
+
+
+def get_model_names(parser: ArgumentParser, args: Namespace) -> list[str]:
+    if args.model_names_file is not None:
+        try:
+            lines = args.model_names_file.read_text(encoding="utf-8").splitlines()
+        except OSError as exc:
+            parser.error(
+                f"argument --model-names-file: cannot read "
+                f"'{args.model_names_file}': {exc.strerror}",
+            )
+        # Blank lines and comments are allowed, so a job's checkpoint list can
+        # be annotated.
+        model_names = [
+            line.strip()
+            for line in lines
+            if line.strip() and not line.lstrip().startswith("#")
+        ]
+        if not model_names:
+            parser.error(
+                f"argument --model-names-file: no model names in "
+                f"'{args.model_names_file}'.",
+            )
+    else:
+        model_names = args.model_names or [args.model_name]
+    return list(dict.fromkeys(model_names))
+
+
+class SweepBudget:
+    # Ends a sweep as soon as every request for one model has completed and
+    # that model passes the threshold. Requests map to models by index.
+    def __init__(self, *, fail_action_threshold: float, models: list[str]) -> None:
+        self.fail_action_threshold = fail_action_threshold
+        self.models = models
+        self.remaining_requests = Counter(models)
+        self.totals = dict.fromkeys(models, (0, 0))
+        self.passed_model: str | None = None
+
+    def add(self, index: int, *, total_passed: int, total_failed: int) -> None:
+        model = self.models[index]
+        passed, failed = self.totals[model]
+        self.totals[model] = (passed + total_passed, failed + total_failed)
+        self.remaining_requests[model] -= 1
+        if (
+            self.passed_model is None
+            and self.remaining_requests[model] == 0
+            and self.failure_rate(model) <= self.fail_action_threshold
+        ):
+            self.passed_model = model
+
+    def failure_rate(self, model: str) -> float:
+        passed, failed = self.totals[model]
+        return compute_failure_rate(total_passed=passed, total_failed=failed)
+
+    @property
+    def decided(self) -> bool:
+        return self.passed_model is not None and any(
+            self.remaining_requests.values(),
+        )
+
+    def describe(self) -> str:
+        assert self.passed_model is not None
+        skipped = sum(bool(remaining) for remaining in self.remaining_requests.values())
+        return (
+            f"Stopped the sweep: {self.passed_model} passed with a failure rate of "
+            f"{self.failure_rate(self.passed_model):.2%}, skipping {skipped} of "
+            f"{len(self.remaining_requests)} models that had not finished."
+        )
@@ -0,0 +1,304 @@
+from __future__ import annotations
+
+import asyncio
+import gzip
+import random
+import statistics
+import time
+from collections.abc import AsyncIterator
+from contextlib import AsyncExitStack, asynccontextmanager
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from .arguments import DEFAULT_MAX_RETRIES, DEFAULT_RETRY_BACKOFF
+from .scheduler import Scheduler
+
+RETRYABLE_STATUS_CODES = frozenset({408, 425, 429, 500, 502, 503, 504})
+RETRYABLE_ERRORS = (
+    httpx.TimeoutException,
+    httpx.NetworkError,
+    httpx.RemoteProtocolError,
+)
+
+DEFAULT_RETRY_MAX_BACKOFF = 60.0
+MAX_RETRY_AFTER = 300.0
+CONNECT_TIMEOUT = 10.0
+# Bodies smaller than this gain little from compression and are sent as is.
+COMPRESSION_MIN_BYTES = 1024
+COMPRESSION_LEVEL = 6
+
+
+@dataclass
+class RetryOptions:
+    request_timeout: float | None = None
+    max_retries: int = DEFAULT_MAX_RETRIES
+    backoff: float = DEFAULT_RETRY_BACKOFF
+    max_backoff: float = DEFAULT_RETRY_MAX_BACKOFF
+
+    @property
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            self.request_timeout,
+            connect=min(CONNECT_TIMEOUT, self.request_timeout or CONNECT_TIMEOUT),
+        )
+
+
+@dataclass
+class AttemptMetric:
+    url: str
+    attempt: int
+    latency: float
+    status_code: int | None
+    error: str | None
+    # Seconds spent waiting for a shared scheduler slot before the attempt.
+    queued: float = 0.0
+    # Bytes of the response body read by the caller, counted as it streams.
+    size: int | None = None
+
+
+@dataclass
+class AttemptLog:
+    attempts: list[AttemptMetric] = field(default_factory=list)
+    # Request body bytes before and after gzip, counted once per request.
+    uncompressed_bytes: int = 0
+    compressed_bytes: int = 0
+
+    @property
+    def retries(self) -> int:
+        return sum(attempt.attempt > 0 for attempt in self.attempts)
+
+    def describe(self) -> str:
+        latencies = [attempt.latency for attempt in self.attempts]
+        return (
+            f"Sent {len(self.attempts)} attempts, {self.retries} of them retries. "
+            f"Attempt latency: median {statistics.median(latencies):.2f}s, "
+            f"max {max(latencies):.2f}s."
+        )
+
+    @property
+    def queued(self) -> list[float]:
+        return [attempt.queued for attempt in self.attempts if attempt.queued]
+
+    def describe_queue(self) -> str:
+        waits = self.queued
+        return (
+            f"Waited for the shared scheduler before {len(waits)} of "
+            f"{len(self.attempts)} attempts: median {statistics.median(waits):.2f}s, "
+            f"max {max(waits):.2f}s, total {sum(waits):.2f}s."
+        )
+
+    def describe_compression(self) -> str:
+        saved = 1 - self.compressed_bytes / self.uncompressed_bytes
+        return (
+            f"Compressed request bodies from {self.uncompressed_bytes} to "
+            f"{self.compressed_bytes} bytes, saving {saved:.1%} of the upload."
+        )
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+class _AttemptStream(httpx.AsyncByteStream):
+    # Counts the body of the returned attempt as it is read and releases its
+    # scheduler slot once the response is closed.
+    def __init__(
+        self,
+        stream: httpx.AsyncByteStream,
+        *,
+        metric: AttemptMetric | None,
+        stack: AsyncExitStack,
+    ) -> None:
+        self.stream = stream
+        self.metric = metric
+        self.stack = stack
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self.stream:
+            if self.metric is not None:
+                self.metric.size = (self.metric.size or 0) + len(chunk)
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self.stream.aclose()
+        finally:
+            await self.stack.aclose()
+
+
+class RetryTransport(httpx.AsyncBaseTransport):
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        *,
+        options: RetryOptions,
+        log: AttemptLog | None = None,
+        scheduler: Scheduler | None = None,
+    ) -> None:
+        self.transport = transport
+        self.options = options
+        self.log = log
+        self.scheduler = scheduler
+
+    def backoff(self, attempt: int) -> float:
+        # Full jitter keeps concurrent requests from retrying in lockstep.
+        ceiling = min(self.options.max_backoff, self.options.backoff * 2**attempt)
+        return random.uniform(0, ceiling)
+
+    def _record(
+        self,
+        request: httpx.Request,
+        *,
+        attempt: int,
+        started: float,
+        queued: float,
+        status_code: int | None = None,
+        error: str | None = None,
+    ) -> AttemptMetric | None:
+        if self.log is None:
+            return None
+        metric = AttemptMetric(
+            url=str(request.url),
+            attempt=attempt,
+            latency=time.perf_counter() - started,
+            status_code=status_code,
+            error=error,
+            queued=queued,
+        )
+        self.log.attempts.append(metric)
+        return metric
+
+    @asynccontextmanager
+    async def _slot(self, request: httpx.Request) -> AsyncIterator[float]:
+        # Each attempt, retries included, takes its own slot, so the shared
+        # limits also pace retries after a 429.
+        if self.scheduler is None:
+            yield 0.0
+            return
+        async with self.scheduler.slot(request) as queued:
+            yield queued
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            # The slot is held until the response body has been read and
+            # closed, which for a successful evaluation happens in the caller.
+            stack = AsyncExitStack()
+            try:
+                queued = await stack.enter_async_context(self._slot(request))
+                started = time.perf_counter()
+                response = await self.transport.handle_async_request(request)
+            except RETRYABLE_ERRORS as exc:
+                await stack.aclose()
+                self._record(
+                    request,
+                    attempt=attempt,
+                    started=started,
+                    queued=queued,
+                    error=type(exc).__name__,
+                )
+                if attempt >= self.options.max_retries:
+                    raise
+                delay = self.backoff(attempt)
+            except BaseException:
+                await stack.aclose()
+                raise
+            else:
+                # Only the status and headers decide on a retry, so the body
+                # streams through to the caller unbuffered.
+                metric = self._record(
+                    request,
+                    attempt=attempt,
+                    started=started,
+                    queued=queued,
+                    status_code=response.status_code,
+                )
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if (
+                    response.status_code not in RETRYABLE_STATUS_CODES
+                    or attempt >= self.options.max_retries
+                    or (retry_after is not None and retry_after > MAX_RETRY_AFTER)
+                ):
+                    assert isinstance(response.stream, httpx.AsyncByteStream)
+                    response.stream = _AttemptStream(
+                        response.stream,
+                        metric=metric,
+                        stack=stack,
+                    )
+                    return response
+
+                await response.aclose()
+                await stack.aclose()
+                delay = self.backoff(attempt) if retry_after is None else retry_after
+
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        if self.scheduler is not None:
+            self.scheduler.close()
+        await self.transport.aclose()
+
+
+class CompressingTransport(httpx.AsyncBaseTransport):
+    # Sends request bodies gzipped with Content-Encoding. It wraps the
+    # retrying transport, so each body is compressed once and retries resend
+    # the compressed bytes.
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        *,
+        log: AttemptLog | None = None,
+    ) -> None:
+        self.transport = transport
+        self.log = log
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = request.content
+        if len(body) < COMPRESSION_MIN_BYTES or "Content-Encoding" in request.headers:
+            return await self.transport.handle_async_request(request)
+
+        compressed = gzip.compress(body, compresslevel=COMPRESSION_LEVEL, mtime=0)
+        if self.log is not None:
+            self.log.uncompressed_bytes += len(body)
+            self.log.compressed_bytes += len(compressed)
+        headers = request.headers.copy()
+        headers["Content-Encoding"] = "gzip"
+        headers["Content-Length"] = str(len(compressed))
+        return await self.transport.handle_async_request(
+            httpx.Request(
+                request.method,
+                request.url,
+                headers=headers,
+                content=compressed,
+                extensions=request.extensions,
+            ),
+        )
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class SharedTransport(httpx.AsyncBaseTransport):
+    # A connection pool owned by a longer-lived caller, such as the serve
+    # process, which stays open when a client built on it is closed.
+    def __init__(self, transport: httpx.AsyncBaseTransport) -> None:
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        pass
@@ -0,0 +1,47 @@
+import pytest
+from circuit_breaker_labs.models.single_turn_run_tests_response import (
+    SingleTurnRunTestsResponse,
+)
+
+from actions.analytics import analyze, check_gates
+from actions.arguments import parse_gate
+
+
+def _response(total_failed: int) -> SingleTurnRunTestsResponse:
+    return SingleTurnRunTestsResponse.from_dict(
+        {
+            "total_passed": 10,
+            "total_failed": total_failed,
+            "failed_results": [
+                [
+                    {
+                        "user_input": "u",
+                        "model_response": "m",
+                        "safe_response_score": 0.2,
+                        "safe_response_score_threshold": 0.5,
+                    }
+                    for _ in range(total_failed)
+                ],
+            ],
+        },
+    )
+
+
+def test_score_gates_are_skipped_without_failed_cases(
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    gates = [parse_gate("score.p50>=0.4"), parse_gate("score.min>=0.4")]
+    assert check_gates(analyze(_response(0)), gates) == []
+    assert "Skipping gate score.p50>=0.4" in capsys.readouterr().out
+
+
+def test_score_gates_apply_to_failed_cases() -> None:
+    assert check_gates(analyze(_response(2)), [parse_gate("score.p50>=0.4")]) == [
+        "score.p50>=0.4: actual 0.2",
+    ]
+
+
+def test_unknown_score_metric_fails_without_failed_cases() -> None:
+    assert check_gates(analyze(_response(0)), [parse_gate("score.p99>=0.4")]) == [
+        "score.p99>=0.4: unknown metric 'score.p99'",
+    ]
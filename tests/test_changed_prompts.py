@@ -0,0 +1,39 @@
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from actions.changed_prompts import load_prompt_files
+
+
+def _git(*args: str) -> None:
+    subprocess.run(["git", *args], check=True, capture_output=True)
+
+
+def test_invalid_utf8_prompt_is_reported_by_path(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    _git("init", "-q")
+    _git(
+        "-c",
+        "user.name=t",
+        "-c",
+        "user.email=t@t",
+        "commit",
+        "-q",
+        "--allow-empty",
+        "-m",
+        "base",
+    )
+    good = Path("good.txt")
+    good.write_bytes(b"Be helpful.\r\n")
+    bad = Path("bad.txt")
+    bad.write_bytes(b"caf\xe9")
+
+    assert load_prompt_files([good], base_ref="HEAD")[0].system_prompt == (
+        "Be helpful.\r\n"
+    )
+    with pytest.raises(RuntimeError, match=r"'bad.txt' is not valid UTF-8"):
+        load_prompt_files([good, bad], base_ref="HEAD")
@@ -0,0 +1,10 @@
+import pytest
+
+from actions.common import DEFAULT_BASE_URL, build_client
+
+
+def test_base_url_is_read_for_each_client(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.delenv("CBL_BASE_URL", raising=False)
+    assert build_client()._base_url == DEFAULT_BASE_URL
+    monkeypatch.setenv("CBL_BASE_URL", "http://127.0.0.1:8765/v1/")
+    assert build_client()._base_url == "http://127.0.0.1:8765/v1/"
@@ -0,0 +1,65 @@
+from actions.early_exit import FailureBudget
+
+
+def test_completed_request_sizes_do_not_decide_the_verdict() -> None:
+    # A small all-failing pack finishing first must not settle a run that a
+    # larger all-passing pack could still bring under the threshold.
+    budget = FailureBudget(fail_action_threshold=0.2, total_requests=2)
+    budget.add(0, total_passed=0, total_failed=5)
+    assert not budget.decided
+
+
+def test_bound_too_large_to_decide() -> None:
+    budget = FailureBudget(
+        fail_action_threshold=0.2,
+        total_requests=2,
+        max_cases_per_request=100,
+    )
+    budget.add(0, total_passed=0, total_failed=5)
+    assert not budget.decided
+
+
+def test_exceeded_with_known_bound() -> None:
+    budget = FailureBudget(
+        fail_action_threshold=0.2,
+        total_requests=2,
+        max_cases_per_request=10,
+    )
+    budget.add(0, total_passed=0, total_failed=5)
+    assert budget.decided
+    assert budget.exceeded
+
+
+def test_unreachable_with_known_bound() -> None:
+    budget = FailureBudget(
+        fail_action_threshold=0.5,
+        total_requests=2,
+        max_cases_per_request=10,
+    )
+    budget.add(0, total_passed=20, total_failed=0)
+    assert budget.decided
+    assert budget.unreachable
+    assert not budget.exceeded
+
+
+def test_never_decided_once_every_request_completed() -> None:
+    budget = FailureBudget(
+        fail_action_threshold=0.2,
+        total_requests=1,
+        max_cases_per_request=10,
+    )
+    budget.add(0, total_passed=0, total_failed=5)
+    assert not budget.decided
+
+
+def test_duplicate_completion_is_counted_once() -> None:
+    budget = FailureBudget(
+        fail_action_threshold=0.2,
+        total_requests=2,
+        max_cases_per_request=10,
+    )
+    budget.add(0, total_passed=10, total_failed=0)
+    budget.add(0, total_passed=10, total_failed=0)
+    assert budget.completed_requests == 1
+    assert budget.total_passed == 10
+    assert not budget.decided
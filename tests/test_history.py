@@ -0,0 +1,211 @@
+import sqlite3
+from pathlib import Path
+
+from circuit_breaker_labs.models.multi_turn_test_type import MultiTurnTestType
+from circuit_breaker_labs.models.single_turn_run_tests_response import (
+    SingleTurnRunTestsResponse,
+)
+
+from actions.conversations import multi_turn_response_from_dict
+from actions.history import (
+    SCHEMA,
+    RunSummary,
+    compare_to_baseline,
+    find_latest_run,
+    hash_prompt,
+    record_run,
+)
+
+
+def _conversation(*replies: str) -> dict[str, object]:
+    conversation = [{"role": "user", "content": "opening attack"}]
+    for reply in replies:
+        conversation.append({"role": "assistant", "content": reply})
+        conversation.append({"role": "user", "content": f"follow up to {reply}"})
+    return {"min_safe_response_score": 0.1, "conversation": conversation}
+
+
+def _record(
+    path: Path,
+    *,
+    conversations: list[dict[str, object]],
+    test_types: list[MultiTurnTestType],
+    total_passed: int,
+    probe: bool = False,
+    partial: bool = False,
+    request_key: str = "key",
+) -> int:
+    return record_run(
+        path,
+        endpoint="https://example.test",
+        system_prompt="prompt",
+        model="model",
+        test_case_packs=None,
+        test_types=test_types,
+        run_tests_response=multi_turn_response_from_dict(
+            {
+                "total_passed": total_passed,
+                "total_failed": len(conversations),
+                "failed_results": conversations,
+            },
+        ),
+        fail_action_threshold=0.5,
+        duration=1.0,
+        request_key=request_key,
+        fail_case_threshold=0.5,
+        probe=probe,
+        partial=partial,
+    )
+
+
+def _compare(path: Path) -> tuple[RunSummary | None, RunSummary | None, list[str]]:
+    current, baseline, new_failures = compare_to_baseline(
+        path,
+        endpoint="https://example.test",
+        prompt_hash=hash_prompt("prompt"),
+        model="model",
+    )
+    return current, baseline, [failure.case_hash for failure in new_failures]
+
+
+def test_conversations_sharing_an_opening_are_kept_apart(tmp_path: Path) -> None:
+    path = tmp_path / "history.db"
+    test_types = list(MultiTurnTestType)[:1]
+    _record(
+        path, conversations=[_conversation("a")], test_types=test_types, total_passed=9
+    )
+    _record(
+        path,
+        conversations=[_conversation("a"), _conversation("b")],
+        test_types=test_types,
+        total_passed=8,
+    )
+
+    _, baseline, new_failures = _compare(path)
+    assert baseline is not None
+    assert len(new_failures) == 1
+
+
+def test_baseline_must_send_the_same_requests(tmp_path: Path) -> None:
+    # Runs with another case threshold, say, differ only in their requests.
+    path = tmp_path / "history.db"
+    test_types = list(MultiTurnTestType)[:1]
+    _record(path, conversations=[], test_types=test_types, total_passed=10)
+    _record(
+        path,
+        conversations=[],
+        test_types=test_types,
+        total_passed=10,
+        request_key="other",
+    )
+
+    current, baseline, _ = _compare(path)
+    assert current is not None
+    assert baseline is None
+
+
+def test_single_turn_cases_are_kept_apart_by_layer_and_response(
+    tmp_path: Path,
+) -> None:
+    path = tmp_path / "history.db"
+
+    def record(failed_results: list[list[dict[str, object]]]) -> None:
+        record_run(
+            path,
+            endpoint="https://example.test",
+            system_prompt="prompt",
+            model="model",
+            test_case_packs=None,
+            test_types=None,
+            run_tests_response=SingleTurnRunTestsResponse.from_dict(
+                {
+                    "total_passed": 20,
+                    "total_failed": sum(map(len, failed_results)),
+                    "failed_results": failed_results,
+                },
+            ),
+            fail_action_threshold=0.5,
+            duration=1.0,
+            request_key="key",
+            fail_case_threshold=0.5,
+        )
+
+    def case(response: str) -> dict[str, object]:
+        return {
+            "user_input": "attack",
+            "model_response": response,
+            "safe_response_score": 0.1,
+        }
+
+    record([[case("a")], [case("a")]])
+    record([[case("a")], [case("a"), case("b")]])
+
+    current, baseline, new_failures = _compare(path)
+    assert current is not None and current.total_failed == 3
+    assert baseline is not None
+    assert len(new_failures) == 1
+    with sqlite3.connect(path) as connection:
+        (stored,) = connection.execute(
+            "SELECT COUNT(*) FROM failures WHERE run_id = ?",
+            (current.id,),
+        ).fetchone()
+    connection.close()
+    assert stored == 3
+
+
+def test_probe_runs_are_ignored(tmp_path: Path) -> None:
+    path = tmp_path / "history.db"
+    test_types = list(MultiTurnTestType)[:1]
+    full = _record(path, conversations=[], test_types=test_types, total_passed=10)
+    _record(
+        path,
+        conversations=[_conversation("a")],
+        test_types=test_types,
+        total_passed=1,
+        probe=True,
+    )
+
+    current, baseline, new_failures = _compare(path)
+    assert current is not None and current.id == full
+    assert baseline is None
+    assert new_failures == []
+
+    latest = find_latest_run(path, endpoint="https://example.test", request_key="key")
+    assert latest is not None and latest.id == full
+
+
+def test_databases_from_earlier_versions_are_migrated(tmp_path: Path) -> None:
+    path = tmp_path / "history.db"
+    with sqlite3.connect(path) as connection:
+        connection.executescript(SCHEMA)
+    connection.close()
+
+    test_types = list(MultiTurnTestType)[:1]
+    _record(path, conversations=[], test_types=test_types, total_passed=10)
+    current, _, _ = _compare(path)
+    assert current is not None
+
+
+def test_only_complete_runs_of_the_same_requests_are_reused(tmp_path: Path) -> None:
+    path = tmp_path / "history.db"
+    test_types = list(MultiTurnTestType)[:1]
+    full = _record(path, conversations=[], test_types=test_types, total_passed=10)
+    other = _record(
+        path,
+        conversations=[],
+        test_types=test_types,
+        total_passed=10,
+        request_key="other",
+    )
+    _record(
+        path,
+        conversations=[],
+        test_types=test_types,
+        total_passed=5,
+        partial=True,
+    )
+
+    latest = find_latest_run(path, endpoint="https://example.test", request_key="key")
+    assert latest is not None and latest.id == full
+    current, _, _ = _compare(path)
+    assert current is not None and current.id == other
@@ -0,0 +1,131 @@
+import json
+from argparse import Namespace
+from pathlib import Path
+from typing import Any
+from urllib.parse import urlsplit
+
+import pytest
+from circuit_breaker_labs.models.single_turn_run_tests_response import (
+    SingleTurnRunTestsResponse,
+)
+
+from actions.output import get_output_options, write_output
+
+RESPONSE = SingleTurnRunTestsResponse.from_dict(
+    {
+        "total_passed": 3,
+        "total_failed": 1,
+        "failed_results": [
+            [
+                {
+                    "user_input": "attack",
+                    "model_response": "unsafe reply",
+                    "safe_response_score": 0.1,
+                },
+            ],
+        ],
+    },
+)
+
+
+def _check_sarif(log: dict[str, Any]) -> None:
+    # The constraints the SARIF 2.1.0 schema places on the objects written.
+    assert set(log) <= {"$schema", "version", "runs", "properties"}
+    assert log["version"] == "2.1.0"
+    for run in log["runs"]:
+        driver = run["tool"]["driver"]
+        assert isinstance(driver["name"], str)
+        assert all(isinstance(rule["id"], str) for rule in driver["rules"])
+        for result in run["results"]:
+            assert isinstance(result["message"]["text"], str)
+            assert result["level"] in {"none", "note", "warning", "error"}
+            assert isinstance(result["properties"], dict)
+            for location in result.get("locations", []):
+                physical = location["physicalLocation"]
+                artifact = physical["artifactLocation"]
+                assert set(artifact) <= {"uri", "uriBaseId"}
+                uri = urlsplit(artifact["uri"])
+                assert " " not in artifact["uri"] and "\\" not in artifact["uri"]
+                assert bool(uri.scheme) != ("uriBaseId" in artifact)
+                assert physical["region"]["startLine"] >= 1
+
+
+def _write_sarif(tmp_path: Path, system_prompt_file: Path | None) -> dict[str, Any]:
+    options = get_output_options(
+        Namespace(
+            output_format="sarif",
+            output_file=tmp_path / "results.sarif",
+            system_prompt_file=system_prompt_file,
+        ),
+    )
+    assert options is not None
+    write_output(
+        options,
+        RESPONSE,
+        endpoint="singleturn-evaluate-system-prompt",
+        subject={"model": "model"},
+        fail_action_threshold=0.5,
+        failure_rate=0.25,
+    )
+    log: dict[str, Any] = json.loads(options.file.read_text(encoding="utf-8"))
+    _check_sarif(log)
+    return log
+
+
+def _locations(log: dict[str, Any]) -> list[Any]:
+    return [result.get("locations") for result in log["runs"][0]["results"]]
+
+
+def test_results_point_at_the_system_prompt_file(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("GITHUB_WORKSPACE", str(tmp_path))
+    prompt = tmp_path / "prompts" / "support bot.txt"
+    (location,) = _locations(_write_sarif(tmp_path, prompt))
+    assert location == [
+        {
+            "physicalLocation": {
+                "artifactLocation": {
+                    "uri": "prompts/support%20bot.txt",
+                    "uriBaseId": "%SRCROOT%",
+                },
+                "region": {"startLine": 1},
+            },
+        },
+    ]
+
+
+def test_prompt_outside_the_workspace_uses_a_file_uri(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("GITHUB_WORKSPACE", str(tmp_path / "workspace"))
+    prompt = tmp_path / "prompt.txt"
+    (location,) = _locations(_write_sarif(tmp_path, prompt))
+    assert location[0]["physicalLocation"]["artifactLocation"] == {
+        "uri": prompt.as_uri(),
+    }
+
+
+def test_inline_prompt_points_at_the_workflow(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv(
+        "GITHUB_WORKFLOW_REF",
+        "owner/repo/.github/workflows/safety.yml@refs/heads/main",
+    )
+    (location,) = _locations(_write_sarif(tmp_path, None))
+    assert location[0]["physicalLocation"]["artifactLocation"] == {
+        "uri": ".github/workflows/safety.yml",
+        "uriBaseId": "%SRCROOT%",
+    }
+
+
+def test_no_location_outside_github_actions(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.delenv("GITHUB_WORKFLOW_REF", raising=False)
+    assert _locations(_write_sarif(tmp_path, None)) == [None]
@@ -0,0 +1,29 @@
+from actions.report import SUMMARY_FIELD_LENGTH, format_markdown_table, format_table
+
+
+def test_format_table_without_rows() -> None:
+    assert list(format_table(["Model", "Failure Rate"], [])) == [
+        "Model  Failure Rate",
+        "-----  ------------",
+    ]
+
+
+def test_format_table_pads_to_the_widest_value() -> None:
+    assert list(format_table(["A", "B"], [["long value", "x"]])) == [
+        "A           B",
+        "----------  -",
+        "long value  x",
+    ]
+
+
+def test_format_markdown_table_truncates_and_escapes_cells() -> None:
+    header, separator, row = format_markdown_table(
+        ["Message"],
+        [["a|b\n" + "x" * (2 * SUMMARY_FIELD_LENGTH)]],
+    )
+    assert header == "| Message |"
+    assert separator == "| --- |"
+    cell = row.removeprefix("| ").removesuffix(" |")
+    assert cell.startswith("a\\|b x")
+    assert "\n" not in cell
+    assert cell.endswith(f"... [truncated {SUMMARY_FIELD_LENGTH + 4} characters]")
@@ -0,0 +1,77 @@
+import asyncio
+import fcntl
+import json
+from pathlib import Path
+
+import httpx
+import pytest
+
+from actions.scheduler import Scheduler, SchedulerOptions
+
+REQUEST = httpx.Request(
+    "POST",
+    "https://example.test/run",
+    headers={"cbl-api-key": "k"},
+)
+
+
+def _scheduler(directory: Path) -> Scheduler:
+    return Scheduler(SchedulerOptions(directory=directory, max_in_flight=1, rate=None))
+
+
+def test_slot_of_an_owner_without_a_lock_is_reclaimed(tmp_path: Path) -> None:
+    scheduler = _scheduler(tmp_path)
+    # Left behind by a killed job, in a container where its PID means nothing.
+    state = {"in_flight": [["dead-0", "dead"], ["old-0", 12345]], "queue": []}
+    scheduler._path(REQUEST).write_text(json.dumps(state))
+
+    async def acquire() -> float:
+        async with scheduler.slot(REQUEST) as queued:
+            return queued
+
+    assert asyncio.run(acquire()) == 0.0
+    assert json.loads(scheduler._path(REQUEST).read_text())["in_flight"] == []
+    scheduler.close()
+
+
+def test_slot_of_a_live_owner_is_kept(tmp_path: Path) -> None:
+    first = _scheduler(tmp_path)
+    second = _scheduler(tmp_path)
+
+    async def contend() -> None:
+        async with first.slot(REQUEST):
+            with pytest.raises(TimeoutError):
+                async with asyncio.timeout(0.2), second.slot(REQUEST):
+                    pass
+        async with asyncio.timeout(1), second.slot(REQUEST):
+            pass
+
+    asyncio.run(contend())
+    first.close()
+    second.close()
+    assert list((tmp_path / "owners").iterdir()) == []
+
+
+def test_waiting_for_the_state_lock_does_not_block_the_loop(tmp_path: Path) -> None:
+    scheduler = _scheduler(tmp_path)
+    path = scheduler._path(REQUEST)
+    path.touch()
+
+    async def acquire() -> None:
+        async with scheduler.slot(REQUEST):
+            pass
+
+    async def contend() -> int:
+        ticks = 0
+        with path.open("r+") as held:
+            fcntl.flock(held, fcntl.LOCK_EX)
+            waiter = asyncio.create_task(acquire())
+            for _ in range(5):
+                await asyncio.sleep(0.01)
+                ticks += 1
+            assert not waiter.done()
+        await asyncio.wait_for(waiter, 1)
+        return ticks
+
+    assert asyncio.run(contend()) == 5
+    scheduler.close()
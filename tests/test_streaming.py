@@ -0,0 +1,121 @@
+import json
+from collections.abc import Iterator
+from typing import Any
+
+import pytest
+from circuit_breaker_labs.models.multi_turn_run_tests_response import (
+    MultiTurnRunTestsResponse,
+)
+from circuit_breaker_labs.models.single_turn_run_tests_response import (
+    SingleTurnRunTestsResponse,
+)
+
+from actions.streaming import JsonObjectStream, RunTestsResponseReader
+
+SINGLE_TURN = {
+    "failed_results": [
+        [
+            {
+                "user_input": 'quote " and backslash \\ and été \U0001f600',
+                "model_response": "line\nbreak\ttab  ",
+                "safe_response_score": 0.125,
+            },
+        ],
+        [],
+        [
+            {
+                "user_input": "日本語",
+                "model_response": "\\u0041 is not an escape here",
+                "safe_response_score": 1e-05,
+            },
+        ],
+    ],
+    "total_failed": 2,
+    "duration": 1.25e-07,
+    "total_passed": 12345,
+}
+
+MULTI_TURN = {
+    "total_passed": 7,
+    "failed_results": [
+        {
+            "min_safe_response_score": 0.25,
+            "conversation": [
+                {"role": "user", "content": 'café "quoted" \U0001f600'},
+                {"role": "assistant", "content": "reply\\n"},
+            ],
+        },
+    ],
+    "total_failed": 1,
+}
+
+
+def _splits(body: bytes) -> Iterator[list[bytes]]:
+    # Every two-way split, which cuts inside each string, escape, multibyte
+    # character and number, and byte at a time.
+    for index in range(len(body) + 1):
+        yield [body[:index], body[index:]]
+    yield [body[index : index + 1] for index in range(len(body))]
+
+
+def _read(response_type: Any, chunks: list[bytes]) -> dict[str, Any]:
+    reader = RunTestsResponseReader(response_type)
+    for chunk in chunks:
+        reader.feed(chunk)
+    result: dict[str, Any] = reader.finish().to_dict()
+    return result
+
+
+@pytest.mark.parametrize(
+    ("response_type", "data"),
+    [
+        (SingleTurnRunTestsResponse, SINGLE_TURN),
+        (MultiTurnRunTestsResponse, MULTI_TURN),
+    ],
+)
+def test_any_chunking_parses_like_json_loads(response_type: Any, data: Any) -> None:
+    body = json.dumps(data, ensure_ascii=False).encode()
+    expected = json.loads(body)
+    for chunks in _splits(body):
+        assert _read(response_type, chunks) == expected
+
+
+def test_number_cut_at_a_point_or_exponent_waits_for_the_rest() -> None:
+    for head, tail in [(b"12.", b"5"), (b"1e", b"-3"), (b"2E+", b"2"), (b"-", b"7")]:
+        stream = JsonObjectStream(field="failed_results", depth=1)
+        events = stream.feed(b'{"total_passed": ' + head)
+        events += stream.feed(tail + b', "failed_results": []}', final=True)
+        assert events == [("field", ("total_passed", json.loads(head + tail)))]
+        assert stream.done
+
+
+def test_array_items_are_emitted_as_soon_as_they_are_complete() -> None:
+    stream = JsonObjectStream(field="failed_results", depth=2)
+    assert stream.feed(b'{"failed_results": [[{"a": 1}, {"b"') == [
+        ("open", 2),
+        ("item", {"a": 1}),
+    ]
+    assert stream.feed(b": 2}]]}", final=True) == [("item", {"b": 2})]
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b'{"total_passed": 1, "failed_results": [[{"a": 1}',
+        b'{"total_passed": 1, "failed_results": [',
+        b'{"total_passed": 12',
+        b'{"total_passed": 12.}',
+        b'{"total_passed" 1}',
+        b'{"failed_results": [{"a": 1}]}',
+        b'{"failed_results": [[x]]}',
+        b'{"total_passed": 1} trailing',
+        b"[]",
+        b"",
+    ],
+)
+def test_malformed_or_truncated_body_is_rejected(body: bytes) -> None:
+    stream = JsonObjectStream(field="failed_results", depth=2)
+    with pytest.raises(json.JSONDecodeError):
+        for index in range(len(body)):
+            stream.feed(body[index : index + 1])
+        stream.feed(b"", final=True)
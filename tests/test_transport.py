@@ -0,0 +1,219 @@
+import asyncio
+import gzip
+import json
+from collections.abc import AsyncIterator, Callable
+
+import httpx
+import pytest
+
+from actions.transport import (
+    COMPRESSION_MIN_BYTES,
+    MAX_RETRY_AFTER,
+    AttemptLog,
+    CompressingTransport,
+    RetryOptions,
+    RetryTransport,
+)
+
+URL = "https://example.test/run"
+
+
+@pytest.fixture
+def sleeps(monkeypatch: pytest.MonkeyPatch) -> list[float]:
+    delays: list[float] = []
+
+    async def sleep(delay: float) -> None:
+        delays.append(delay)
+
+    monkeypatch.setattr("actions.transport.asyncio.sleep", sleep)
+    return delays
+
+
+def _send(
+    handler: Callable[[httpx.Request], httpx.Response],
+    *,
+    options: RetryOptions | None = None,
+    log: AttemptLog | None = None,
+) -> httpx.Response:
+    transport = RetryTransport(
+        httpx.MockTransport(handler),
+        options=options or RetryOptions(max_retries=3, backoff=1.0),
+        log=log,
+    )
+
+    async def send() -> httpx.Response:
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await client.post(URL, json={})
+
+    return asyncio.run(send())
+
+
+def _failing(status_codes: list[int]) -> Callable[[httpx.Request], httpx.Response]:
+    responses = iter(status_codes)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(next(responses, 200))
+
+    return handler
+
+
+@pytest.mark.parametrize("status_code", [408, 425, 429, 500, 502, 503, 504])
+def test_retryable_status_is_retried(sleeps: list[float], status_code: int) -> None:
+    log = AttemptLog()
+    response = _send(_failing([status_code]), log=log)
+    assert response.status_code == 200
+    assert [attempt.status_code for attempt in log.attempts] == [status_code, 200]
+    assert len(sleeps) == 1
+
+
+@pytest.mark.parametrize("status_code", [400, 401, 404, 422, 501])
+def test_other_status_is_returned(sleeps: list[float], status_code: int) -> None:
+    log = AttemptLog()
+    response = _send(_failing([status_code]), log=log)
+    assert response.status_code == status_code
+    assert len(log.attempts) == 1
+    assert sleeps == []
+
+
+def test_gives_up_after_max_retries(sleeps: list[float]) -> None:
+    log = AttemptLog()
+    response = _send(_failing([503] * 10), log=log)
+    assert response.status_code == 503
+    assert [attempt.attempt for attempt in log.attempts] == [0, 1, 2, 3]
+    assert log.retries == 3
+    assert len(sleeps) == 3
+
+
+def test_no_retries(sleeps: list[float]) -> None:
+    response = _send(_failing([503]), options=RetryOptions(max_retries=0))
+    assert response.status_code == 503
+    assert sleeps == []
+
+
+def test_backoff_is_capped_exponential_jitter(sleeps: list[float]) -> None:
+    options = RetryOptions(max_retries=6, backoff=1.0, max_backoff=5.0)
+    _send(_failing([500] * 6), options=options)
+    ceilings = [1.0, 2.0, 4.0, 5.0, 5.0, 5.0]
+    assert len(sleeps) == len(ceilings)
+    for delay, ceiling in zip(sleeps, ceilings, strict=True):
+        assert 0 <= delay <= ceiling
+
+
+def test_retry_after_seconds_is_honoured(sleeps: list[float]) -> None:
+    responses = iter([httpx.Response(429, headers={"Retry-After": "7"})])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return next(responses, httpx.Response(200))
+
+    assert _send(handler).status_code == 200
+    assert sleeps == [7.0]
+
+
+def test_long_retry_after_is_not_waited_for(sleeps: list[float]) -> None:
+    retry_after = str(int(MAX_RETRY_AFTER) + 1)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(429, headers={"Retry-After": retry_after})
+
+    assert _send(handler).status_code == 429
+    assert sleeps == []
+
+
+def test_timeout_is_retried(sleeps: list[float]) -> None:
+    calls = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise httpx.ReadTimeout("timed out", request=request)
+        return httpx.Response(200)
+
+    log = AttemptLog()
+    assert _send(handler, log=log).status_code == 200
+    assert [attempt.error for attempt in log.attempts] == ["ReadTimeout", None]
+
+
+def test_timeout_is_raised_after_max_retries(sleeps: list[float]) -> None:
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.ConnectTimeout("timed out", request=request)
+
+    with pytest.raises(httpx.ConnectTimeout):
+        _send(handler, options=RetryOptions(max_retries=2))
+    assert len(sleeps) == 2
+
+
+def test_timeout_configuration() -> None:
+    timeout = RetryOptions(request_timeout=120.0).timeout
+    assert timeout.read == 120.0
+    assert timeout.connect == 10.0
+    assert RetryOptions(request_timeout=2.0).timeout.connect == 2.0
+    assert RetryOptions().timeout.read is None
+
+
+def test_response_body_streams_through_unread(sleeps: list[float]) -> None:
+    log = AttemptLog()
+    sent: list[bytes] = []
+
+    async def body() -> AsyncIterator[bytes]:
+        for chunk in (b'{"a": ', b"1}"):
+            sent.append(chunk)
+            yield chunk
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=body())
+
+    transport = RetryTransport(
+        httpx.MockTransport(handler),
+        options=RetryOptions(max_retries=3, backoff=1.0),
+        log=log,
+    )
+
+    async def receive() -> list[bytes]:
+        async with (
+            httpx.AsyncClient(transport=transport) as client,
+            client.stream("POST", URL, json={}) as response,
+        ):
+            assert sent == []
+            assert log.attempts[0].size is None
+            return [chunk async for chunk in response.aiter_raw()]
+
+    assert asyncio.run(receive()) == [b'{"a": ', b"1}"]
+    assert log.attempts[0].size == 8
+
+
+def _compress(content: bytes, log: AttemptLog) -> httpx.Request:
+    received: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        received.append(request)
+        return httpx.Response(200)
+
+    transport = CompressingTransport(httpx.MockTransport(handler), log=log)
+
+    async def send() -> None:
+        async with httpx.AsyncClient(transport=transport) as client:
+            await client.post(URL, content=content)
+
+    asyncio.run(send())
+    return received[0]
+
+
+def test_large_body_is_gzipped() -> None:
+    log = AttemptLog()
+    body = json.dumps({"system_prompt": "Be helpful. " * 200}).encode()
+    request = _compress(body, log)
+    assert request.headers["Content-Encoding"] == "gzip"
+    assert request.headers["Content-Length"] == str(len(request.content))
+    assert gzip.decompress(request.content) == body
+    assert log.uncompressed_bytes == len(body)
+    assert log.compressed_bytes == len(request.content) < len(body)
+
+
+def test_small_body_is_sent_uncompressed() -> None:
+    log = AttemptLog()
+    body = b"x" * (COMPRESSION_MIN_BYTES - 1)
+    request = _compress(body, log)
+    assert "Content-Encoding" not in request.headers
+    assert request.content == body
+    assert log.compressed_bytes == 0